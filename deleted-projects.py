@@ -1,15 +1,12 @@
 import streamlit as st
-import requests
+
+import kbc.stacks
+from kbc import transport
+from tabs import components
 
 # Keboola API token (ensure you keep this secure)
 
-hostname_suffix_options = {
-    "keboola.com": "AWS us-east-1",
-    "eu-central-1.keboola.com": "AWS eu-central-1",
-    "north-europe.azure.keboola.com": "Azure North Europe",
-    "us-east4.gcp.keboola.com": "GCP US East4",
-    "europe-west3.gcp.keboola.com": "GCP Europe West3"
-}
+hostname_suffix_options = kbc.stacks.labels(multitenant_only=True)
 
 def get_headers(token):
     return {
@@ -19,7 +16,7 @@ def get_headers(token):
 
 
 def get_deleted_projects(api_url, token):
-    response = requests.get(
+    response = transport.get(
         f"{api_url}/deleted-projects",
         headers=get_headers(token),
         params={"limit": "1000"}
@@ -28,7 +25,7 @@ def get_deleted_projects(api_url, token):
 
 
 def get_deleted_project(api_url, token, deleted_project_id):
-    response = requests.get(
+    response = transport.get(
         f"{api_url}/deleted_projects/{deleted_project_id}",
         headers=get_headers(token)
     )
@@ -36,7 +33,7 @@ def get_deleted_project(api_url, token, deleted_project_id):
 
 
 def restore_deleted_project(api_url, token, deleted_project_id, new_expiration_days=0):
-    response = requests.delete(
+    response = transport.delete(
         f"{api_url}/deleted-projects/{deleted_project_id}",
         headers=get_headers(token),
         json={"expirationDays": new_expiration_days}
@@ -45,7 +42,7 @@ def restore_deleted_project(api_url, token, deleted_project_id, new_expiration_d
 
 
 def get_project(api_url, token, project_id):
-    response = requests.get(
+    response = transport.get(
         f"{api_url}/projects/{project_id}",
         headers=get_headers(token)
     )
@@ -70,16 +67,15 @@ token = st.text_input("Keboola Manage Token", type="password")
 
 deleted_projects = get_deleted_projects(api_url, token)
 
-options = {}
-for deleted_project in deleted_projects:
-    options[deleted_project['id']] = f"{deleted_project['organization']['name']} : {deleted_project['id']} - {deleted_project['name']}"
-
-
-selected_project = st.selectbox(
-    "Select by ID",
-    options=list(options.keys()),
-    format_func=lambda x: options[x]
+grid = components.render_grid(
+    {"id": [p['id'] for p in deleted_projects],
+     "name": [p['name'] for p in deleted_projects],
+     "organization": [p['organization']['name'] for p in deleted_projects],
+     "deleted": [p.get('deletedTime', '') for p in deleted_projects]},
+    key='deleted_projects_grid', selection='single'
 )
+selected_rows = components.grid_selected_rows(grid)
+selected_project = selected_rows[0]['id'] if selected_rows else None
 
 if selected_project:
     expiration_days = st.text_input("Days until expiration (0 = no expiry):", 0)
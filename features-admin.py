@@ -1,15 +1,11 @@
 import streamlit as st
-import requests
+
+import kbc.stacks
+from kbc import transport
 
 # Keboola API token (ensure you keep this secure)
 
-hostname_suffix_options = {
-    "keboola.com": "AWS us-east-1",
-    "eu-central-1.keboola.com": "AWS eu-central-1",
-    "north-europe.azure.keboola.com": "Azure North Europe",
-    "us-east4.gcp.keboola.com": "GCP US East4",
-    "europe-west3.gcp.keboola.com": "GCP Europe West3"
-}
+hostname_suffix_options = kbc.stacks.labels(multitenant_only=True)
 
 def get_headers(token):
     return {
@@ -20,7 +16,7 @@ def get_headers(token):
 
 # Helper functions for API interactions
 def get_project_features(api_url, token, project_id):
-    response = requests.get(
+    response = transport.get(
         f"{api_url}/projects/{project_id}/features",
         headers=get_headers(token)
     )
@@ -28,7 +24,7 @@ def get_project_features(api_url, token, project_id):
 
 
 def add_project_feature(api_url, token, project_id, feature_name):
-    response = requests.post(
+    response = transport.post(
         f"{api_url}/projects/{project_id}/features",
         headers=get_headers(token),
         json={"feature": feature_name}
@@ -37,7 +33,7 @@ def add_project_feature(api_url, token, project_id, feature_name):
 
 
 def remove_project_feature(api_url, token, project_id, feature_name):
-    response = requests.delete(
+    response = transport.delete(
         f"{api_url}/projects/{project_id}/features/{feature_name}",
         headers=get_headers(token)
     )
@@ -45,14 +41,14 @@ def remove_project_feature(api_url, token, project_id, feature_name):
 
 
 def get_project_details(api_url, token, project_id):
-    response = requests.get(
+    response = transport.get(
         f"{api_url}/projects/{project_id}",
         headers=get_headers(token)
     )
     return response.json()
 
 def get_features_list(api_url, token):
-    response = requests.get(
+    response = transport.get(
         f"{api_url}/features?type=project",
         headers=get_headers(token)
     )
@@ -0,0 +1,259 @@
+"""
+Full-text search over the configurations of many projects.
+
+Configurations and their rows are pulled concurrently with iter_project_configurations and kept in a local SQLite
+FTS5 index (INDEX_FILE): one document per configuration and per row, with its name, description and configuration
+JSON. Re-indexing compares the versions in the listing with the indexed ones and rewrites only the documents that
+changed; configurations that disappeared from a project are dropped.
+
+Queries such as "which configurations use host X" or "which orchestrations reference config Y" are then answered from
+the index without touching the API:
+
+    index = ConfigIndex()
+    index.index_organization(manage_token, 'EU', project_ids)
+    index.search('db.example.com')
+"""
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import requests
+
+import kbc.kbcapi_scripts
+import kbc.tokenbroker
+
+INDEX_FILE = os.path.join(kbc.kbcapi_scripts.PAR_WORKDIRPATH, 'data', 'config-index.sqlite')
+MAX_WORKERS = 8
+# row_id of the document holding the configuration itself
+CONFIG_ROW = ''
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS projects (
+    region TEXT NOT NULL,
+    project_id TEXT NOT NULL,
+    indexed_at REAL,
+    documents INTEGER,
+    PRIMARY KEY (region, project_id)
+);
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    region TEXT NOT NULL,
+    project_id TEXT NOT NULL,
+    component_id TEXT NOT NULL,
+    component_type TEXT,
+    config_id TEXT NOT NULL,
+    row_id TEXT NOT NULL,
+    version INTEGER,
+    name TEXT,
+    description TEXT,
+    body TEXT,
+    UNIQUE (region, project_id, component_id, config_id, row_id)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+    name, description, body, content='documents', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS documents_ai AFTER INSERT ON documents BEGIN
+    INSERT INTO documents_fts (rowid, name, description, body) VALUES (new.id, new.name, new.description, new.body);
+END;
+CREATE TRIGGER IF NOT EXISTS documents_ad AFTER DELETE ON documents BEGIN
+    INSERT INTO documents_fts (documents_fts, rowid, name, description, body)
+    VALUES ('delete', old.id, old.name, old.description, old.body);
+END;
+CREATE TRIGGER IF NOT EXISTS documents_au AFTER UPDATE ON documents BEGIN
+    INSERT INTO documents_fts (documents_fts, rowid, name, description, body)
+    VALUES ('delete', old.id, old.name, old.description, old.body);
+    INSERT INTO documents_fts (rowid, name, description, body) VALUES (new.id, new.name, new.description, new.body);
+END;
+"""
+
+_UPSERT = """
+INSERT INTO documents (region, project_id, component_id, component_type, config_id, row_id, version, name,
+                       description, body)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (region, project_id, component_id, config_id, row_id) DO UPDATE SET
+    component_type = excluded.component_type, version = excluded.version, name = excluded.name,
+    description = excluded.description, body = excluded.body
+"""
+
+
+def _version(value) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _documents(record: dict) -> Iterable[Tuple[Tuple[str, str, str], Optional[int], Callable[[], tuple]]]:
+    """(key, version, build) of the configuration record and each of its rows; build() returns the indexed columns."""
+    component = record.get('component') or {}
+    component_id, config_id = str(component.get('id', '')), str(record.get('id', ''))
+
+    def _build(item, component_type=component.get('type')):
+        return lambda: (component_type, item.get('name') or '', item.get('description') or '',
+                        json.dumps(item.get('configuration') or {}, ensure_ascii=False))
+
+    yield (component_id, config_id, CONFIG_ROW), _version(record.get('version')), _build(record)
+    for row in record.get('rows') or []:
+        yield (component_id, config_id, str(row.get('id', ''))), _version(row.get('version')), _build(row)
+
+
+def _fetch_project(token: str, region: str, indexed_versions: Dict[Tuple[str, str, str], Optional[int]]):
+    """
+    Downloads the project's configurations and returns (changed documents, keys of all documents).
+    Documents whose version matches the indexed one are not serialized again.
+    """
+    changed, seen = [], set()
+    for record in kbc.kbcapi_scripts.iter_project_configurations(
+            token, region, include='configuration,rows', fields=('id', 'name', 'description', 'version',
+                                                                  'configuration', 'rows')):
+        for key, version, build in _documents(record):
+            seen.add(key)
+            if version is None or indexed_versions.get(key, -1) != version:
+                changed.append(key + (version,) + build())
+    return changed, seen
+
+
+def match_expression(query: str) -> str:
+    """
+    FTS5 MATCH expression requiring every whitespace separated term of the query. Each term is matched as a phrase,
+    so 'db.example.com' or 'keboola.ex-db-snowflake' match the tokens in that order.
+    """
+    return ' '.join('"' + term.replace('"', '""') + '"' for term in query.split())
+
+
+class ConfigIndex:
+
+    def __init__(self, index_path: str = INDEX_FILE):
+        self.index_path = index_path
+        os.makedirs(os.path.dirname(index_path) or '.', exist_ok=True)
+        # WAL and a busy timeout let several sessions index and search the shared file at once (see httpcache)
+        self.connection = sqlite3.connect(index_path, timeout=30)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.executescript(_SCHEMA)
+
+    # ---- indexing ----
+
+    def _indexed_versions(self, region: str, project_id: str) -> Dict[Tuple[str, str, str], Optional[int]]:
+        rows = self.connection.execute('SELECT component_id, config_id, row_id, version FROM documents '
+                                       'WHERE region = ? AND project_id = ?', (region, project_id))
+        return {(component_id, config_id, row_id): version for component_id, config_id, row_id, version in rows}
+
+    def _store(self, region: str, project_id: str, changed: List[tuple], seen: set,
+               indexed: Iterable[Tuple[str, str, str]]) -> Tuple[int, int]:
+        removed = [key for key in indexed if key not in seen]
+        with self.connection:
+            self.connection.executemany(_UPSERT, [(region, project_id, component_id, component_type, config_id,
+                                                   row_id, version, name, description, body)
+                                                  for component_id, config_id, row_id, version, component_type, name,
+                                                  description, body in changed])
+            self.connection.executemany('DELETE FROM documents WHERE region = ? AND project_id = ? AND '
+                                        'component_id = ? AND config_id = ? AND row_id = ?',
+                                        [(region, project_id) + key for key in removed])
+            self.connection.execute('INSERT OR REPLACE INTO projects VALUES (?, ?, ?, ?)',
+                                    (region, project_id, time.time(), len(seen)))
+        return len(changed), len(removed)
+
+    def index_projects(self, project_tokens: Dict[Tuple[str, str], str], max_workers: int = MAX_WORKERS,
+                       on_progress: Optional[Callable[[dict], None]] = None) -> List[dict]:
+        """
+        (Re-)indexes projects concurrently. Downloads run in worker threads, the index is written from the calling
+        thread one project at a time, so a failing project leaves its previously indexed documents in place.
+
+        Args:
+            project_tokens: {(region, project_id): storage token}
+            on_progress: Called with each project's outcome as it finishes.
+
+        Returns:
+            [{"region", "project", "status", "updated", "removed", "message"}], status being 'success' or 'error'.
+        """
+        outcomes = []
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {}
+            for (region, project_id), token in project_tokens.items():
+                indexed = self._indexed_versions(region, str(project_id))
+                futures[executor.submit(_fetch_project, token, region, indexed)] = (region, str(project_id), indexed)
+            for future in as_completed(futures):
+                region, project_id, indexed = futures[future]
+                try:
+                    changed, seen = future.result()
+                    updated, removed = self._store(region, project_id, changed, seen, indexed)
+                    outcome = {"status": "success", "updated": updated, "removed": removed,
+                               "message": f"{len(seen)} documents, {updated} updated, {removed} removed"}
+                except (requests.RequestException, ValueError, KeyError, sqlite3.OperationalError) as error:
+                    # API failures, unparseable responses, records missing expected fields and an index kept locked
+                    # by another session past the busy timeout fail only this project
+                    outcome = {"status": "error", "updated": 0, "removed": 0,
+                               "message": f"{type(error).__name__}: {error}"}
+                outcome = {"region": region, "project": project_id, **outcome}
+                outcomes.append(outcome)
+                if on_progress:
+                    on_progress(outcome)
+        return outcomes
+
+    def index_organization(self, manage_token: str, region: str, project_ids: Iterable,
+                           max_workers: int = MAX_WORKERS,
+                           on_progress: Optional[Callable[[dict], None]] = None) -> List[dict]:
+        """index_projects with read-only storage tokens of the projects taken from the token broker."""
+        tokens, errors = kbc.tokenbroker.broker.tokens_for(manage_token, region, project_ids,
+                                                           permissions=kbc.tokenbroker.READ_ONLY,
+                                                           max_workers=max_workers)
+        outcomes = []
+        for project_id, error in errors.items():
+            outcome = {"region": region, "project": project_id, "status": "error", "updated": 0, "removed": 0,
+                       "message": f"No storage token: {error}"}
+            outcomes.append(outcome)
+            if on_progress:
+                on_progress(outcome)
+        return outcomes + self.index_projects({(region, project_id): token for project_id, token in tokens.items()},
+                                              max_workers=max_workers, on_progress=on_progress)
+
+    # ---- queries ----
+
+    def search(self, query: str, limit: int = 200, regions: Iterable[str] = (), project_ids: Iterable = (),
+               component_ids: Iterable[str] = (), raw: bool = False) -> List[dict]:
+        """
+        Documents matching the query, best matches first.
+
+        Args:
+            raw: Pass the query to FTS5 as is (operators OR / NOT / NEAR, prefix*, column filters), otherwise every
+                term is required (see match_expression).
+
+        Returns:
+            [{"region", "project_id", "component_id", "component_type", "config_id", "row_id", "version", "name",
+              "snippet"}]
+        """
+        expression = query if raw else match_expression(query)
+        if not expression.strip():
+            return []
+        clauses, params = ['documents_fts MATCH ?'], [expression]
+        for column, values in (('region', regions), ('project_id', project_ids), ('component_id', component_ids)):
+            values = [str(v) for v in values]
+            if values:
+                clauses.append(f'd.{column} IN ({", ".join("?" * len(values))})')
+                params += values
+        sql = ('SELECT d.region, d.project_id, d.component_id, d.component_type, d.config_id, d.row_id, d.version, '
+               "d.name, snippet(documents_fts, 2, '[', ']', '…', 16) "
+               'FROM documents_fts JOIN documents d ON d.id = documents_fts.rowid '
+               f'WHERE {" AND ".join(clauses)} ORDER BY bm25(documents_fts, 10.0, 5.0, 1.0) LIMIT ?')
+        keys = ['region', 'project_id', 'component_id', 'component_type', 'config_id', 'row_id', 'version', 'name',
+                'snippet']
+        return [dict(zip(keys, row)) for row in self.connection.execute(sql, params + [limit])]
+
+    def document(self, region: str, project_id, component_id: str, config_id: str, row_id: str = CONFIG_ROW) -> dict:
+        """The indexed configuration JSON of one document."""
+        row = self.connection.execute('SELECT body FROM documents WHERE region = ? AND project_id = ? AND '
+                                      'component_id = ? AND config_id = ? AND row_id = ?',
+                                      (region, str(project_id), component_id, config_id, row_id)).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def projects(self) -> List[dict]:
+        rows = self.connection.execute('SELECT region, project_id, indexed_at, documents FROM projects '
+                                       'ORDER BY region, CAST(project_id AS INTEGER)')
+        return [dict(zip(('region', 'project_id', 'indexed_at', 'documents'), row)) for row in rows]
+
+    def close(self):
+        self.connection.close()
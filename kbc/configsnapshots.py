@@ -0,0 +1,282 @@
+"""
+Content-addressed snapshots of project configurations.
+
+Each configuration is split into blobs along its structure: the configuration itself (name, description, disabled
+flag and JSON), its state, and the same two blobs for every row. A blob is stored once under the SHA-256 of its
+canonical JSON, zlib compressed, in SNAPSHOT_DIR/blobs. A snapshot is a manifest listing the blob hashes of every
+configuration of a project (SNAPSHOT_DIR/manifests/<region>/<project>/<time>.json), so a snapshot taken an hour after
+the previous one writes only the blobs that changed in between plus a small manifest.
+
+Restoring compares the snapshot with the project's current configurations and recreates (create_config /
+create_config_row) or updates (update_config / update_config_row / state endpoints) only what differs. Restore never
+deletes configurations or rows created after the snapshot.
+"""
+import datetime
+import hashlib
+import json
+import os
+import tempfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import requests
+
+import kbc.kbcapi_scripts
+import kbc.tokenbroker
+
+SNAPSHOT_DIR = os.path.join(kbc.kbcapi_scripts.PAR_WORKDIRPATH, 'data', 'config-snapshots')
+MAX_WORKERS = 8
+COMPRESSION_LEVEL = 6
+
+_HEAD_FIELDS = ('name', 'description', 'isDisabled', 'configuration')
+# failures of one project / configuration that are recorded as its outcome instead of aborting the batch: API errors,
+# unexpected responses, and missing (FileNotFoundError) or damaged blobs
+SNAPSHOT_ERRORS = (requests.RequestException, ValueError, KeyError, OSError, zlib.error)
+
+
+def _canonical(value) -> bytes:
+    return json.dumps(value, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode()
+
+
+def blob_hash(value) -> str:
+    return hashlib.sha256(_canonical(value)).hexdigest()
+
+
+def _head(item: dict) -> dict:
+    return {field: item.get(field) for field in _HEAD_FIELDS}
+
+
+def _entries(record: dict) -> Iterable[Tuple[str, dict, dict]]:
+    """(row_id or '' for the configuration, head, state) of the configuration record and its rows."""
+    yield '', _head(record), record.get('state') or {}
+    for row in record.get('rows') or []:
+        yield str(row.get('id')), _head(row), row.get('state') or {}
+
+
+def _config_key(entry: dict) -> str:
+    return f"{entry['component_id']}/{entry['config_id']}"
+
+
+class SnapshotStore:
+
+    def __init__(self, root: str = SNAPSHOT_DIR):
+        self.root = root
+        self.blob_dir = os.path.join(root, 'blobs')
+        self.manifest_dir = os.path.join(root, 'manifests')
+
+    # ---- blobs ----
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.blob_dir, digest[:2], digest[2:])
+
+    def _write_atomic(self, path: str, data: bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def put_blob(self, value) -> Tuple[str, int]:
+        """Stores the value unless a blob with the same content exists; returns (hash, compressed bytes written)."""
+        data = _canonical(value)
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._blob_path(digest)
+        if os.path.exists(path):
+            return digest, 0
+        compressed = zlib.compress(data, COMPRESSION_LEVEL)
+        self._write_atomic(path, compressed)
+        return digest, len(compressed)
+
+    def get_blob(self, digest: str):
+        with open(self._blob_path(digest), 'rb') as f:
+            return json.loads(zlib.decompress(f.read()))
+
+    # ---- snapshots ----
+
+    def snapshot_project(self, token: str, region: str, project_id, label: str = '') -> dict:
+        """
+        Snapshots all configurations of the project.
+
+        Returns:
+            {"id", "configurations", "blobs_written", "bytes_written", "bytes_total"}, bytes_total being the size of
+            the uncompressed snapshot.
+        """
+        configurations = []
+        written = bytes_written = bytes_total = 0
+        for record in kbc.kbcapi_scripts.iter_project_configurations(token, region, include='configuration,rows,state'):
+            entry = {"component_id": str((record.get('component') or {}).get('id')), "config_id": str(record['id']),
+                     "version": record.get('version'), "rows": []}
+            for row_id, head, state in _entries(record):
+                item = {}
+                for field, value in (('blob', head), ('state', state)):
+                    item[field], size = self.put_blob(value)
+                    written += size > 0
+                    bytes_written += size
+                    bytes_total += len(_canonical(value))
+                if row_id:
+                    entry['rows'].append({"row_id": row_id, **item})
+                else:
+                    entry.update(item)
+            configurations.append(entry)
+
+        created_at = datetime.datetime.now(datetime.timezone.utc)
+        snapshot_id = f"{region}/{project_id}/{created_at.strftime('%Y%m%dT%H%M%S%fZ')}"
+        manifest = {"id": snapshot_id, "created_at": created_at.isoformat(), "region": region,
+                    "project_id": str(project_id), "label": label, "configurations": configurations}
+        self._write_atomic(os.path.join(self.manifest_dir, snapshot_id + '.json'),
+                           json.dumps(manifest, indent=1).encode())
+        return {"id": snapshot_id, "configurations": len(configurations), "blobs_written": written,
+                "bytes_written": bytes_written, "bytes_total": bytes_total}
+
+    def snapshot_projects(self, project_tokens: Dict[Tuple[str, str], str], label: str = '',
+                          max_workers: int = MAX_WORKERS,
+                          on_progress: Optional[Callable[[dict], None]] = None) -> List[dict]:
+        """
+        Snapshots many projects concurrently.
+
+        Args:
+            project_tokens: {(region, project_id): storage token}
+
+        Returns:
+            [{"status", "project", "message", <snapshot_project summary>}]
+        """
+        outcomes = []
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(self.snapshot_project, token, region, project_id, label): (region, project_id)
+                       for (region, project_id), token in project_tokens.items()}
+            for future in as_completed(futures):
+                region, project_id = futures[future]
+                try:
+                    summary = future.result()
+                    outcome = {"status": "success", **summary,
+                               "message": f"{summary['configurations']} configurations, "
+                                          f"{summary['bytes_written']} of {summary['bytes_total']} bytes stored"}
+                except SNAPSHOT_ERRORS as error:
+                    outcome = {"status": "error", "message": f"{type(error).__name__}: {error}"}
+                outcome["project"] = f"{region}/{project_id}"
+                outcomes.append(outcome)
+                if on_progress:
+                    on_progress(outcome)
+        return outcomes
+
+    def snapshot_organization(self, manage_token: str, region: str, project_ids: Iterable, label: str = '',
+                              max_workers: int = MAX_WORKERS,
+                              on_progress: Optional[Callable[[dict], None]] = None) -> List[dict]:
+        """snapshot_projects with read-only storage tokens of the projects taken from the token broker."""
+        tokens, errors = kbc.tokenbroker.broker.tokens_for(manage_token, region, project_ids,
+                                                           permissions=kbc.tokenbroker.READ_ONLY,
+                                                           max_workers=max_workers)
+        outcomes = []
+        for project_id, error in errors.items():
+            outcome = {"status": "error", "project": f"{region}/{project_id}", "message": f"No storage token: {error}"}
+            outcomes.append(outcome)
+            if on_progress:
+                on_progress(outcome)
+        return outcomes + self.snapshot_projects({(region, project_id): token for project_id, token in tokens.items()},
+                                                 label=label, max_workers=max_workers, on_progress=on_progress)
+
+    def list_snapshots(self, region: Optional[str] = None, project_id=None) -> List[str]:
+        """Snapshot IDs (<region>/<project>/<time>), oldest first."""
+        root = os.path.join(self.manifest_dir, *[str(part) for part in (region, project_id) if part is not None])
+        ids = []
+        for directory, _, files in os.walk(root):
+            ids += [os.path.relpath(os.path.join(directory, name[:-len('.json')]), self.manifest_dir)
+                    .replace(os.sep, '/') for name in files if name.endswith('.json')]
+        return sorted(ids)
+
+    def load_manifest(self, snapshot_id: str) -> dict:
+        with open(os.path.join(self.manifest_dir, snapshot_id + '.json')) as f:
+            return json.load(f)
+
+    # ---- restore ----
+
+    def _current_hashes(self, token: str, region: str) -> Dict[str, Dict[str, Tuple[str, str]]]:
+        """{component/config: {row_id or '': (blob hash, state hash)}} of the project as it is now."""
+        current = {}
+        for record in kbc.kbcapi_scripts.iter_project_configurations(token, region, include='configuration,rows,state'):
+            key = f"{(record.get('component') or {}).get('id')}/{record['id']}"
+            current[key] = {row_id: (blob_hash(head), blob_hash(state)) for row_id, head, state in _entries(record)}
+        return current
+
+    def _restore_configuration(self, token: str, region: str, entry: dict, current: Optional[dict],
+                               change_description: str) -> str:
+        component_id, config_id = entry['component_id'], entry['config_id']
+        actions = []
+        head_changed = current is None or current.get('', (None, None))[0] != entry['blob']
+        state_changed = current is None or current.get('', (None, None))[1] != entry['state']
+        if head_changed or state_changed:
+            head, state = self.get_blob(entry['blob']), self.get_blob(entry['state'])
+            if current is None:
+                kbc.kbcapi_scripts.create_config(token, region, component_id, head['name'], head['description'] or '',
+                                                 head['configuration'] or {}, configurationId=config_id,
+                                                 state=state or None, changeDescription=change_description,
+                                                 is_disabled=bool(head['isDisabled']))
+                actions.append('created')
+            else:
+                kbc.kbcapi_scripts.update_config(token, region, component_id, config_id, head['name'],
+                                                 head['description'] or '', configuration=head['configuration'],
+                                                 state=state if state_changed else None,
+                                                 changeDescription=change_description,
+                                                 is_disabled=bool(head['isDisabled']))
+                actions.append('updated')
+
+        for row in entry['rows']:
+            row_current = (current or {}).get(row['row_id'])
+            if row_current == (row['blob'], row['state']):
+                continue
+            head, state = self.get_blob(row['blob']), self.get_blob(row['state'])
+            if row_current is None:
+                kbc.kbcapi_scripts.create_config_row(token, region, component_id, config_id, head['name'],
+                                                     head['configuration'] or {}, description=head['description'] or '',
+                                                     rowId=row['row_id'], state=state or None,
+                                                     changeDescription=change_description,
+                                                     is_disabled=bool(head['isDisabled']))
+            else:
+                kbc.kbcapi_scripts.update_config_row(token, region, component_id, config_id, row['row_id'],
+                                                     head['name'], head['description'] or '',
+                                                     configuration=head['configuration'],
+                                                     state=state if row_current[1] != row['state'] else None,
+                                                     changeDescription=change_description,
+                                                     is_disabled=bool(head['isDisabled']))
+            actions.append(f"row {row['row_id']}")
+        return ', '.join(actions)
+
+    def restore(self, snapshot_id: str, token: str, only: Optional[Iterable[str]] = None,
+                max_workers: int = MAX_WORKERS, on_progress: Optional[Callable[[dict], None]] = None) -> List[dict]:
+        """
+        Brings the project's configurations back to the snapshot, touching only those that differ.
+
+        Args:
+            token: Storage token of the project the snapshot was taken from (or of another project on the same
+                region to restore into).
+            only: Restrict to these configurations ('<component_id>/<config_id>').
+
+        Returns:
+            [{"status", "configuration", "message"}], status being 'success', 'skipped' (unchanged) or 'error'.
+        """
+        manifest = self.load_manifest(snapshot_id)
+        region = manifest['region']
+        only = set(only) if only is not None else None
+        entries = [e for e in manifest['configurations'] if only is None or _config_key(e) in only]
+        current = self._current_hashes(token, region)
+        change_description = f"Restored from snapshot {snapshot_id}"
+
+        outcomes = []
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(self._restore_configuration, token, region, entry,
+                                       current.get(_config_key(entry)), change_description): entry
+                       for entry in entries}
+            for future in as_completed(futures):
+                key = _config_key(futures[future])
+                try:
+                    actions = future.result()
+                    outcome = {"status": "success" if actions else "skipped",
+                               "message": actions or "unchanged since the snapshot"}
+                except SNAPSHOT_ERRORS as error:
+                    outcome = {"status": "error", "message": f"{type(error).__name__}: {error}"}
+                outcome["configuration"] = key
+                outcomes.append(outcome)
+                if on_progress:
+                    on_progress(outcome)
+        return outcomes
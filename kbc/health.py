@@ -0,0 +1,172 @@
+"""
+Stack health tracking: a circuit breaker per stack plus a background latency probe.
+
+kbc.transport records the outcome of every call here, once per call after its retries. After FAILURE_THRESHOLD
+consecutive failures (connection errors, timeouts, 502 / 503 / 504 - other statuses come from a reachable stack and
+say nothing about its health) the stack's circuit opens and further calls fail immediately with StackUnavailable instead of
+waiting for the failing host. After RESET_TIMEOUT the circuit goes half-open and admits a single trial call (or a
+probe); success closes it again, failure re-opens it with a doubled timeout.
+"""
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+import requests
+
+from kbc import stacks
+
+FAILURE_THRESHOLD = 3
+RESET_TIMEOUT = 30.0
+MAX_RESET_TIMEOUT = 300.0
+PROBE_INTERVAL = float(os.environ.get('KBC_HEALTH_PROBE_INTERVAL', '30'))
+PROBE_TIMEOUT = 5.0
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class StackUnavailable(requests.ConnectionError):
+    """Raised without sending the request when the stack's circuit is open."""
+
+
+class CircuitBreaker:
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.reset_timeout = RESET_TIMEOUT
+        self.latency: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.checked_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a call may be sent now. In half-open state only one trial call is admitted at a time."""
+        with self._lock:
+            if self.state == OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    @property
+    def available(self) -> bool:
+        """Non-consuming variant of allow() for filtering fan-outs."""
+        with self._lock:
+            return self.state != OPEN or time.monotonic() - self.opened_at >= self.reset_timeout
+
+    def record_success(self, latency: Optional[float] = None):
+        with self._lock:
+            self.state = CLOSED
+            self.failures = 0
+            self.reset_timeout = RESET_TIMEOUT
+            self._trial_in_flight = False
+            self.checked_at = time.time()
+            if latency is not None:
+                self.latency = latency
+
+    def release(self):
+        """Ends a call that says nothing about the stack's health without changing the state."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self, error: str):
+        with self._lock:
+            self.failures += 1
+            self.last_error = error
+            self.checked_at = time.time()
+            if self.state == HALF_OPEN:
+                self.reset_timeout = min(self.reset_timeout * 2, MAX_RESET_TIMEOUT)
+                self._open()
+            elif self.state == CLOSED and self.failures >= FAILURE_THRESHOLD:
+                self._open()
+            self._trial_in_flight = False
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(host_or_stack: str) -> CircuitBreaker:
+    name = stacks.stack_of(host_or_stack) or host_or_stack
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
+
+def breaker_for_url(url: str) -> CircuitBreaker:
+    return breaker_for(urlparse(url).hostname or '')
+
+
+def is_available(stack: str) -> bool:
+    return breaker_for(stack).available
+
+
+def available_stacks(candidates: Optional[List[str]] = None) -> List[str]:
+    """Filters the candidates (all registered stacks by default) to those whose circuit admits calls."""
+    candidates = candidates if candidates is not None else stacks.stack_ids()
+    return [stack for stack in candidates if is_available(stack)]
+
+
+def snapshot() -> List[dict]:
+    """Current state of all registered stacks, for display."""
+    rows = []
+    for stack in stacks.stack_ids():
+        breaker = breaker_for(stack)
+        rows.append({"stack": stack,
+                     "state": breaker.state,
+                     "latency_ms": round(breaker.latency * 1000) if breaker.latency is not None else None,
+                     "last_error": breaker.last_error})
+    return rows
+
+
+# ---- background probe ----
+
+def probe(stack: str) -> bool:
+    breaker = breaker_for(stack)
+    started = time.monotonic()
+    try:
+        response = requests.get(f'https://connection.{stack}/v2/storage', params={'exclude': 'components'},
+                                timeout=PROBE_TIMEOUT)
+    except requests.RequestException as e:
+        breaker.record_failure(str(e))
+        return False
+    if response.status_code >= 500:
+        breaker.record_failure(f'HTTP {response.status_code}')
+        return False
+    breaker.record_success(time.monotonic() - started)
+    return True
+
+
+def _probe_loop():
+    while True:
+        for stack in stacks.stack_ids():
+            probe(stack)
+        time.sleep(PROBE_INTERVAL)
+
+
+_probe_thread: Optional[threading.Thread] = None
+_probe_lock = threading.Lock()
+
+
+def start_probe():
+    """Starts the process-wide probe thread once; safe to call on every rerun."""
+    global _probe_thread
+    with _probe_lock:
+        if _probe_thread is None or not _probe_thread.is_alive():
+            _probe_thread = threading.Thread(target=_probe_loop, name='kbc-health-probe', daemon=True)
+            _probe_thread.start()
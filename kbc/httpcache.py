@@ -0,0 +1,170 @@
+"""
+Persistent HTTP cache for read-only catalog endpoints, shared by all processes on the machine.
+
+Responses are stored in a SQLite database (WAL mode, so the Streamlit app, its replicas and the standalone scripts
+can read and write concurrently). Each cacheable endpoint has a policy:
+
+    ttl    - seconds a stored response is served without contacting the API
+    stale  - further seconds it may still be served while being revalidated in the background
+
+Revalidation is conditional (If-None-Match / If-Modified-Since), so an unchanged catalog costs a 304 only.
+Set KBC_HTTP_CACHE to a file path to relocate the database, or to "off" to disable caching.
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Hashable, List, NamedTuple, Optional
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+
+class CachePolicy(NamedTuple):
+    pattern: 're.Pattern'
+    ttl: float
+    stale: float
+
+
+POLICIES: List[CachePolicy] = [
+    # feature catalog
+    CachePolicy(re.compile(r'^https://connection\.[^/]+/manage/features(\?|$)'), ttl=3600, stale=7 * 86400),
+    # Storage API index with the component list
+    CachePolicy(re.compile(r'^https://connection\.[^/]+/v2/storage/?(\?|$)'), ttl=3600, stale=7 * 86400),
+    # organization list and organization detail (incl. its projects); the project lists feed bulk changes, so they
+    # are never served more than a few minutes old (bulk plans bypass the cache altogether, see transport's cache=)
+    CachePolicy(re.compile(r'^https://connection\.[^/]+/manage/organizations/?(\?|$)'), ttl=300, stale=600),
+    CachePolicy(re.compile(r'^https://connection\.[^/]+/manage/organizations/\d+/?(\?|$)'), ttl=60, stale=120),
+]
+
+DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'kbc-support-tooling', 'http-cache.sqlite')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    headers TEXT NOT NULL,
+    body BLOB NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    stored_at REAL NOT NULL
+)
+"""
+
+
+def policy_for(url: str) -> Optional[CachePolicy]:
+    if cache is None:
+        return None
+    for policy in POLICIES:
+        if policy.pattern.match(url):
+            return policy
+    return None
+
+
+class CacheEntry(NamedTuple):
+    url: str
+    status: int
+    headers: dict
+    body: bytes
+    etag: Optional[str]
+    last_modified: Optional[str]
+    stored_at: float
+
+    def age(self) -> float:
+        return time.time() - self.stored_at
+
+    def to_response(self) -> requests.Response:
+        response = requests.Response()
+        response.status_code = self.status
+        response.url = self.url
+        response._content = self.body
+        response.headers = CaseInsensitiveDict(self.headers)
+        response.headers['X-Cache'] = 'HIT'
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers) or 'utf-8'
+        return response
+
+    def conditional_headers(self) -> dict:
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class HttpCache:
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute(_SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def key_for(parts: Hashable) -> str:
+        return hashlib.sha256(repr(parts).encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        row = self._connection().execute(
+            'SELECT url, status, headers, body, etag, last_modified, stored_at FROM responses WHERE key = ?',
+            (key,)).fetchone()
+        if row is None:
+            return None
+        url, status, headers, body, etag, last_modified, stored_at = row
+        return CacheEntry(url, status, json.loads(headers), body, etag, last_modified, stored_at)
+
+    def store(self, key: str, response: requests.Response) -> Optional[CacheEntry]:
+        if 'no-store' in response.headers.get('Cache-Control', ''):
+            return None
+        # requests already decoded the transfer encoding, the stored body is plain
+        headers = {k: v for k, v in response.headers.items() if k.lower() not in ('content-encoding',
+                                                                                  'content-length',
+                                                                                  'transfer-encoding')}
+        entry = CacheEntry(response.url, response.status_code, headers, response.content,
+                           response.headers.get('ETag'), response.headers.get('Last-Modified'), time.time())
+        with self._connection() as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO responses (key, url, status, headers, body, etag, last_modified, stored_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (key, entry.url, entry.status, json.dumps(entry.headers), entry.body, entry.etag,
+                 entry.last_modified, entry.stored_at))
+        return entry
+
+    def touch(self, key: str, entry: CacheEntry) -> CacheEntry:
+        """Marks a revalidated (304) entry as fresh again."""
+        entry = entry._replace(stored_at=time.time())
+        with self._connection() as connection:
+            connection.execute('UPDATE responses SET stored_at = ? WHERE key = ?', (entry.stored_at, key))
+        return entry
+
+    def clear(self, url_prefix: str = ''):
+        with self._connection() as connection:
+            connection.execute("DELETE FROM responses WHERE url LIKE ? || '%'", (url_prefix,))
+
+
+def _open_cache() -> Optional[HttpCache]:
+    location = os.environ.get('KBC_HTTP_CACHE', DEFAULT_PATH)
+    if location.lower() == 'off':
+        return None
+    try:
+        return HttpCache(location)
+    except (OSError, sqlite3.Error):
+        # read-only home or similar: run without the cache rather than failing every request
+        return None
+
+
+cache = _open_cache()
@@ -0,0 +1,199 @@
+"""
+Organization-wide project feature inventory.
+
+Fetches the features of all projects of an organization concurrently and keeps them as a project -> features map
+plus the inverted feature -> projects index, so "which projects have feature X" is a dictionary lookup. Inventories
+are cached per process and refreshed incrementally: only projects that are new or older than `max_age` are fetched.
+"""
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import requests
+
+import kbc.kbcapi_scripts
+
+MAX_WORKERS = 8
+DEFAULT_MAX_AGE = 15 * 60
+# a plan re-reads every project not fetched within the last minute
+PLAN_MAX_AGE = 60
+
+_inventories: Dict[Tuple[str, str, str], 'FeatureInventory'] = {}
+_inventories_lock = threading.Lock()
+
+
+def _feature_name(feature) -> str:
+    return feature.get('name', '') if isinstance(feature, dict) else str(feature)
+
+
+class FeatureInventory:
+
+    def __init__(self, stack: str, organization_id: str):
+        self.stack = stack
+        self.organization_id = str(organization_id)
+        self.project_names: Dict[str, str] = {}
+        self.project_features: Dict[str, Set[str]] = {}
+        self.feature_projects: Dict[str, Set[str]] = {}
+        self.fetched_at: Dict[str, float] = {}
+        self.errors: Dict[str, str] = {}
+        self._lock = threading.RLock()
+
+    # ---- index maintenance ----
+
+    def set_project_features(self, project_id: str, features: Iterable[str]):
+        project_id = str(project_id)
+        features = set(features)
+        with self._lock:
+            for feature in self.project_features.get(project_id, set()) - features:
+                self._unindex(feature, project_id)
+            for feature in features:
+                self.feature_projects.setdefault(feature, set()).add(project_id)
+            self.project_features[project_id] = features
+            self.fetched_at[project_id] = time.time()
+            self.errors.pop(project_id, None)
+
+    def apply_change(self, project_id: str, feature: str, enabled: bool):
+        """Record a feature change made elsewhere so the inventory stays current without refetching."""
+        project_id = str(project_id)
+        with self._lock:
+            features = self.project_features.setdefault(project_id, set())
+            if enabled:
+                features.add(feature)
+                self.feature_projects.setdefault(feature, set()).add(project_id)
+            else:
+                features.discard(feature)
+                self._unindex(feature, project_id)
+
+    def drop_project(self, project_id: str):
+        project_id = str(project_id)
+        with self._lock:
+            for feature in self.project_features.pop(project_id, set()):
+                self._unindex(feature, project_id)
+            self.project_names.pop(project_id, None)
+            self.fetched_at.pop(project_id, None)
+            self.errors.pop(project_id, None)
+
+    def _unindex(self, feature: str, project_id: str):
+        projects = self.feature_projects.get(feature)
+        if projects is not None:
+            projects.discard(project_id)
+            if not projects:
+                del self.feature_projects[feature]
+
+    # ---- queries ----
+
+    @property
+    def project_ids(self) -> List[str]:
+        with self._lock:
+            return sorted(self.project_names, key=lambda p: (len(p), p))
+
+    @property
+    def features(self) -> List[str]:
+        with self._lock:
+            return sorted(self.feature_projects)
+
+    def projects_with(self, feature: str) -> Set[str]:
+        with self._lock:
+            return set(self.feature_projects.get(feature, set()))
+
+    def projects_without(self, feature: str) -> Set[str]:
+        with self._lock:
+            return set(self.project_features) - self.feature_projects.get(feature, set())
+
+    def projects_needing(self, feature: str, operation: str) -> Set[str]:
+        """Projects where an ADD / REMOVE of the feature would actually change something."""
+        return self.projects_without(feature) if operation == 'ADD' else self.projects_with(feature)
+
+    def matrix(self, features: Optional[List[str]] = None) -> Dict[str, list]:
+        """Project x feature matrix in columnar form (one list per column), ready for st.dataframe."""
+        with self._lock:
+            features = features if features is not None else self.features
+            project_ids = [p for p in self.project_ids if p in self.project_features]
+            columns = {"project_id": project_ids,
+                       "name": [self.project_names.get(p, '') for p in project_ids]}
+            for feature in features:
+                having = self.feature_projects.get(feature, set())
+                columns[feature] = [p in having for p in project_ids]
+            return columns
+
+    def stale_projects(self, max_age: float = DEFAULT_MAX_AGE) -> List[str]:
+        now = time.time()
+        with self._lock:
+            return [p for p in self.project_names if now - self.fetched_at.get(p, 0) > max_age]
+
+    # ---- refresh ----
+
+    def sync_projects(self, projects: List[dict]):
+        """Aligns the inventory with the project list of the organization detail."""
+        current = {str(p['id']): p.get('name', '') for p in projects if p.get('id')}
+        with self._lock:
+            for project_id in set(self.project_names) - set(current):
+                self.drop_project(project_id)
+            self.project_names.update(current)
+
+    def refresh(self, manage_token: str, projects: Optional[List[dict]] = None, max_age: float = DEFAULT_MAX_AGE,
+                on_progress: Optional[Callable[[dict], None]] = None, only: Optional[Iterable[str]] = None) -> int:
+        """
+        Fetches features of new or stale projects concurrently, after syncing the project list if `projects` is given.
+        `only` restricts the refresh to the listed project IDs.
+
+        Returns:
+            Number of projects fetched.
+        """
+        if projects is not None:
+            self.sync_projects(projects)
+        to_fetch = self.stale_projects(max_age)
+        if only is not None:
+            only = {str(p) for p in only}
+            to_fetch = [p for p in to_fetch if p in only]
+
+        def _fetch(project_id):
+            return kbc.kbcapi_scripts.list_project_features(self.stack, manage_token, project_id)
+
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            futures = {executor.submit(_fetch, project_id): project_id for project_id in to_fetch}
+            for future in as_completed(futures):
+                project_id = futures[future]
+                try:
+                    self.set_project_features(project_id, [_feature_name(f) for f in future.result()])
+                    outcome = {"project_id": project_id, "status": "success"}
+                except requests.RequestException as error:
+                    with self._lock:
+                        self.errors[project_id] = str(error)
+                    outcome = {"project_id": project_id, "status": "error", "message": str(error)}
+                if on_progress:
+                    on_progress(outcome)
+        return len(to_fetch)
+
+    def plan_change(self, manage_token: str, project_ids: Iterable[str], feature: str, operation: str,
+                    max_age: float = PLAN_MAX_AGE, on_progress: Optional[Callable[[dict], None]] = None) -> dict:
+        """
+        Dry run of a bulk ADD / REMOVE: re-reads the features of the given projects (those not fetched within
+        `max_age`) and splits them by whether the write would change anything.
+
+        Returns:
+            {"change": [ids], "unchanged": [ids], "unknown": {id: error}}; "unknown" projects could not be read.
+        """
+        project_ids = [str(p) for p in project_ids]
+        self.refresh(manage_token, max_age=max_age, on_progress=on_progress, only=project_ids)
+        needing = self.projects_needing(feature, operation)
+        with self._lock:
+            unknown = {p: self.errors.get(p) for p in project_ids
+                       if p in self.errors or p not in self.project_features}
+        return {
+            "change": [p for p in project_ids if p in needing and p not in unknown],
+            "unchanged": [p for p in project_ids if p not in needing and p not in unknown],
+            "unknown": {p: error or 'features not loaded' for p, error in unknown.items()},
+        }
+
+
+def get_inventory(stack: str, manage_token: str, organization_id: str) -> FeatureInventory:
+    """Process-wide inventory of the organization, shared by all sessions using the same token."""
+    token_key = hashlib.sha256(manage_token.encode()).hexdigest()[:16]
+    key = (stack, str(organization_id), token_key)
+    with _inventories_lock:
+        if key not in _inventories:
+            _inventories[key] = FeatureInventory(stack, organization_id)
+        return _inventories[key]
@@ -0,0 +1,241 @@
+"""
+Bulk launcher of component and orchestration jobs with admission control.
+
+Run requests are queued per project and admitted while the project has fewer than `per_project` and its stack fewer
+than `per_stack` jobs of this launcher running, so a backfill of hundreds of jobs never takes all job slots of a
+project. Projects are served round robin, so a long queue of one project does not hold back the others.
+
+A single scheduler loop tracks the running jobs: every `poll_interval` seconds it polls all of them at once
+(get_job_status on a small pool), and admits the next queued requests into the slots freed by finished jobs in the
+same round. No thread waits on an individual job.
+
+A job whose status cannot be read keeps its slot (it may well be running) and is polled with exponential backoff.
+When no running job's status can be read any more, the launcher stops admitting, reports those jobs as 'unknown'
+and the queued requests as 'skipped'.
+"""
+import contextlib
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Deque, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import requests
+
+import kbc.kbcapi_scripts
+import kbc.tasks
+
+PER_PROJECT = 2
+PER_STACK = 20
+POLL_INTERVAL = 10.0
+MAX_WORKERS = 8
+# consecutive failed status polls after which a job's status counts as unknown
+MAX_POLL_FAILURES = 5
+# longest wait between two polls of a job whose status could not be read
+MAX_POLL_BACKOFF = 600.0
+ORCHESTRATION = 'orchestrator'
+
+FINISHED_STATUSES = ('success', 'warning', 'error', 'cancelled', 'terminated')
+SUCCESS_STATUSES = ('success', 'warning')
+
+
+class RunRequest(NamedTuple):
+    region: str
+    project_id: str
+    token: str
+    component_id: str  # ORCHESTRATION for orchestrations
+    config_id: str
+
+    @property
+    def label(self) -> str:
+        return f"{self.region}/{self.project_id}: {self.component_id}/{self.config_id}"
+
+
+def _launch(request: RunRequest) -> dict:
+    if request.component_id == ORCHESTRATION:
+        job = kbc.kbcapi_scripts.run_orchestration(request.config_id, request.token, request.region)
+    else:
+        job = kbc.kbcapi_scripts.run_config(request.component_id, request.config_id, request.token, request.region)
+    if not job.get('url'):
+        job['url'] = f"https://syrup{kbc.kbcapi_scripts.URL_SUFFIXES[request.region]}/queue/job/{job['id']}"
+    return job
+
+
+class JobLauncher:
+
+    def __init__(self, per_project: int = PER_PROJECT, per_stack: int = PER_STACK,
+                 poll_interval: float = POLL_INTERVAL, max_workers: int = MAX_WORKERS):
+        self.per_project = per_project
+        self.per_stack = per_stack
+        self.poll_interval = poll_interval
+        self.max_workers = max_workers
+        self._queues: 'OrderedDict[Tuple[str, str], Deque[RunRequest]]' = OrderedDict()
+        self._running: Dict[str, Tuple[RunRequest, dict]] = {}  # job url -> (request, job)
+        self._poll_failures: Dict[str, int] = {}
+        self._next_poll: Dict[str, float] = {}  # job url -> monotonic time, for jobs whose last poll failed
+        self._stop = threading.Event()
+
+    # ---- queue ----
+
+    def add(self, requests_: Iterable[RunRequest]):
+        for request in requests_:
+            self._queues.setdefault((request.region, str(request.project_id)), deque()).append(request)
+
+    @property
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    @property
+    def running(self) -> int:
+        return len(self._running)
+
+    def stop(self):
+        """Stops admitting queued requests; jobs already launched keep running and are still tracked."""
+        self._stop.set()
+
+    def _running_counts(self) -> Tuple[Dict[Tuple[str, str], int], Dict[str, int]]:
+        per_project, per_stack = {}, {}
+        for request, _ in self._running.values():
+            key = (request.region, str(request.project_id))
+            per_project[key] = per_project.get(key, 0) + 1
+            per_stack[request.region] = per_stack.get(request.region, 0) + 1
+        return per_project, per_stack
+
+    def _admit(self) -> List[RunRequest]:
+        """Takes the requests that fit the free slots off the queues, one per project and pass (round robin)."""
+        per_project, per_stack = self._running_counts()
+        admitted = []
+        progress = True
+        while progress and not self._stop.is_set():
+            progress = False
+            for key in list(self._queues):
+                queue = self._queues[key]
+                region = key[0]
+                if per_project.get(key, 0) >= self.per_project or per_stack.get(region, 0) >= self.per_stack:
+                    continue
+                admitted.append(queue.popleft())
+                per_project[key] = per_project.get(key, 0) + 1
+                per_stack[region] = per_stack.get(region, 0) + 1
+                progress = True
+                if not queue:
+                    del self._queues[key]
+        return admitted
+
+    # ---- scheduler ----
+
+    def _poll(self, executor: ThreadPoolExecutor) -> List[dict]:
+        now = time.monotonic()
+        urls = [url for url in self._running if self._next_poll.get(url, 0.0) <= now]
+        statuses = executor.map(self._poll_one, urls)
+        outcomes = []
+        for url, job in zip(urls, statuses):
+            request, _ = self._running[url]
+            if job is None:
+                # the job keeps its slot until its status is known
+                continue
+            if job.get('status') not in FINISHED_STATUSES:
+                self._running[url] = (request, job)
+                continue
+            del self._running[url]
+            outcomes.append({"status": "success" if job['status'] in SUCCESS_STATUSES else "error",
+                             "message": f"Job {job.get('id')} finished: {job['status']}",
+                             "job": request.label, "job_id": job.get('id')})
+        return outcomes
+
+    def _poll_one(self, url: str) -> Optional[dict]:
+        request, _ = self._running[url]
+        try:
+            job = kbc.kbcapi_scripts.get_job_status(request.token, url)
+            self._poll_failures.pop(url, None)
+            self._next_poll.pop(url, None)
+            return job
+        except requests.RequestException:
+            failures = self._poll_failures[url] = self._poll_failures.get(url, 0) + 1
+            self._next_poll[url] = time.monotonic() + min(self.poll_interval * 2 ** failures, MAX_POLL_BACKOFF)
+            return None
+
+    def _unreadable(self) -> bool:
+        """True when jobs are running and none of their statuses could be read for MAX_POLL_FAILURES polls."""
+        return bool(self._running) and all(self._poll_failures.get(url, 0) >= MAX_POLL_FAILURES
+                                           for url in self._running)
+
+    def _give_up(self) -> List[dict]:
+        outcomes = [{"status": "unknown", "job": request.label, "job_id": job.get('id'),
+                     "message": f"Job status could not be read {self._poll_failures.get(url, 0)} times in a row; "
+                                "the job may still be running"}
+                    for url, (request, job) in self._running.items()]
+        self._running.clear()
+        return outcomes
+
+    def _start(self, executor: ThreadPoolExecutor, admitted: List[RunRequest]) -> List[dict]:
+        outcomes = []
+        futures = [(request, executor.submit(_launch, request)) for request in admitted]
+        for request, future in futures:
+            try:
+                job = future.result()
+                self._running[job['url']] = (request, job)
+            except (requests.RequestException, KeyError) as error:
+                outcomes.append({"status": "error", "job": request.label, "job_id": None,
+                                 "message": f"Launch failed: {error}"})
+        return outcomes
+
+    def run(self, on_outcome: Optional[Callable[[dict], None]] = None,
+            should_stop: Optional[Callable[[], bool]] = None) -> List[dict]:
+        """
+        Launches and tracks all queued requests until every admitted job finished.
+
+        Args:
+            on_outcome: Called with each job's outcome as soon as it is known.
+            should_stop: Checked every round; once true, nothing more is admitted (see stop()).
+
+        Returns:
+            [{"status", "job", "job_id", "message"}] with status 'success', 'error', 'unknown' (status could not be
+            read, see the module docstring) or 'skipped' (never admitted).
+        """
+        outcomes = []
+
+        def _emit(items):
+            for item in items:
+                outcomes.append(item)
+                if on_outcome:
+                    on_outcome(item)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while True:
+                if should_stop and should_stop():
+                    self.stop()
+                _emit(self._poll(executor))
+                _emit(self._start(executor, self._admit()))
+                if self._unreadable():
+                    # the slots cannot be freed safely while the jobs may still be running
+                    self.stop()
+                    _emit(self._give_up())
+                if not self._running and (not self._queues or self._stop.is_set()):
+                    break
+                time.sleep(self.poll_interval)
+
+        skipped = [request for queue in self._queues.values() for request in queue]
+        self._queues.clear()
+        _emit({"status": "skipped", "job": request.label, "job_id": None, "message": "Not launched (stopped)"}
+              for request in skipped)
+        return outcomes
+
+
+def launch_jobs(task, run_requests: List[RunRequest], per_project: int = PER_PROJECT, per_stack: int = PER_STACK,
+                poll_interval: float = POLL_INTERVAL) -> List[dict]:
+    """
+    kbc.tasks entry point. Cancelling the task stops admitting new jobs; the ones already running are awaited and
+    the rest is reported as skipped.
+    """
+    def _report(outcome):
+        # the outcome is recorded before report() raises on a cancelled task; keep tracking the running jobs
+        with contextlib.suppress(kbc.tasks.TaskCancelled):
+            task.report(outcome)
+
+    launcher = JobLauncher(per_project, per_stack, poll_interval)
+    launcher.add(run_requests)
+    # outcomes the caller reported already (e.g. projects without a token) count towards the total
+    task.set_total(task.done + len(run_requests))
+    outcomes = launcher.run(on_outcome=_report, should_stop=lambda: task.cancelled)
+    task.check_cancelled()
+    return outcomes
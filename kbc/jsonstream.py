@@ -0,0 +1,192 @@
+"""
+Incremental parsing of large JSON responses.
+
+Splits a JSON document arriving in chunks into events along one target path, e.g. ('*', 'configurations', '*')
+for the components listing. Only the value currently being read is kept in memory, so the peak memory is bounded by
+the largest single record instead of the whole response.
+"""
+import codecs
+import json
+import re
+from typing import Iterable, Iterator, Optional, Sequence, Tuple
+
+_WHITESPACE = re.compile(r'\s*')
+_STRUCTURE = re.compile(r'["\[\]{}]')
+_STRING_END = re.compile(r'["\\]')
+_SCALAR_END = re.compile(r'[\s,\]}]')
+
+
+class JsonStreamSplitter:
+    """
+    Walks a JSON document and yields (event, path, raw_json) tuples.
+
+    Containers lying on the target path are descended and reported with 'start' / 'end' events, every other value
+    (including the values at the full target path) is reported as a single 'value' event carrying its raw JSON text.
+    In the target path, '*' matches any array index and a string matches the object key.
+    """
+
+    def __init__(self, chunks: Iterable[str], target: Sequence):
+        self._chunks = iter(chunks)
+        self._target = tuple(target)
+        self._buf = ''
+        self._pos = 0
+        self._keep: Optional[int] = None
+
+    def events(self) -> Iterator[Tuple[str, tuple, Optional[str]]]:
+        yield from self._value(())
+        if self._peek():
+            raise ValueError(f'Extra data after JSON document at position {self._pos}')
+
+    # ---- buffer handling ----
+
+    def _fill(self) -> bool:
+        for chunk in self._chunks:
+            if not chunk:
+                continue
+            keep = self._keep if self._keep is not None else min(self._pos, len(self._buf))
+            self._buf = self._buf[keep:] + chunk
+            self._pos -= keep
+            if self._keep is not None:
+                self._keep = 0
+            return True
+        return False
+
+    def _peek(self) -> str:
+        while True:
+            self._pos = _WHITESPACE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ''
+
+    def _expect(self, allowed: str) -> str:
+        char = self._peek()
+        if not char or char not in allowed:
+            raise ValueError(f'Expected one of {allowed!r} at position {self._pos}, got {char!r}')
+        self._pos += 1
+        return char
+
+    # ---- scanning ----
+
+    def _skip_string(self):
+        self._pos += 1
+        while True:
+            match = _STRING_END.search(self._buf, self._pos)
+            if not match:
+                self._pos = len(self._buf)
+                if not self._fill():
+                    raise ValueError('Unterminated string')
+                continue
+            self._pos = match.end()
+            if match.group() == '"':
+                return
+            # escaped character
+            self._pos += 1
+            while self._pos > len(self._buf):
+                if not self._fill():
+                    raise ValueError('Unterminated string')
+
+    def _skip_value(self):
+        char = self._buf[self._pos]
+        if char == '"':
+            self._skip_string()
+        elif char in '[{':
+            depth = 0
+            while True:
+                match = _STRUCTURE.search(self._buf, self._pos)
+                if not match:
+                    self._pos = len(self._buf)
+                    if not self._fill():
+                        raise ValueError('Unterminated container')
+                    continue
+                if match.group() == '"':
+                    self._pos = match.start()
+                    self._skip_string()
+                    continue
+                self._pos = match.end()
+                depth += 1 if match.group() in '[{' else -1
+                if depth == 0:
+                    return
+        else:
+            while True:
+                match = _SCALAR_END.search(self._buf, self._pos)
+                if match:
+                    self._pos = match.start()
+                    return
+                self._pos = len(self._buf)
+                if not self._fill():
+                    return
+
+    def _capture(self) -> str:
+        self._keep = self._pos
+        self._skip_value()
+        text = self._buf[self._keep:self._pos]
+        self._keep = None
+        return text
+
+    def _descends(self, path: tuple, char: str) -> bool:
+        if len(path) >= len(self._target):
+            return False
+        for step, wanted in zip(path, self._target):
+            if not ((wanted == '*' and isinstance(step, int)) or wanted == step):
+                return False
+        return char == ('[' if self._target[len(path)] == '*' else '{')
+
+    def _value(self, path: tuple):
+        char = self._peek()
+        if not char:
+            raise ValueError('Unexpected end of JSON document')
+        if not self._descends(path, char):
+            yield 'value', path, self._capture()
+            return
+
+        yield 'start', path, None
+        self._pos += 1
+        if char == '[':
+            index = 0
+            if self._peek() == ']':
+                self._pos += 1
+            else:
+                while True:
+                    yield from self._value(path + (index,))
+                    index += 1
+                    if self._expect(',]') == ']':
+                        break
+        else:
+            if self._peek() == '}':
+                self._pos += 1
+            else:
+                while True:
+                    if self._peek() != '"':
+                        raise ValueError(f'Expected object key at position {self._pos}')
+                    key = json.loads(self._capture())
+                    self._expect(':')
+                    yield from self._value(path + (key,))
+                    if self._expect(',}') == '}':
+                        break
+        yield 'end', path, None
+
+
+def decode_chunks(byte_chunks: Iterable[bytes], encoding: str = 'utf-8') -> Iterator[str]:
+    decoder = codecs.getincrementaldecoder(encoding)()
+    for chunk in byte_chunks:
+        yield decoder.decode(chunk)
+    yield decoder.decode(b'', final=True)
+
+
+def project(record: dict, fields: Optional[Iterable[str]]) -> dict:
+    """
+    Keeps only the listed fields. Dotted names select nested values, e.g. 'configuration.parameters.host'.
+    """
+    if fields is None:
+        return record
+    projected = {}
+    for field in fields:
+        value = record
+        for part in field.split('.'):
+            if not isinstance(value, dict) or part not in value:
+                break
+            value = value[part]
+        else:
+            projected[field] = value
+    return projected
@@ -1,14 +1,19 @@
+import datetime
 import json
 import os
+import tempfile
 import time
 import urllib
-from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, List, Optional
 
 import requests
 from kbcstorage.base import Endpoint
 from kbcstorage.buckets import Buckets
 from kbcstorage.tables import Tables
 
+from kbc import health, jsonstream, profiler, stacks, transport
+
 URL_SUFFIXES = {"US": ".keboola.com",
                 "EU": ".eu-central-1.keboola.com",
                 "AZURE-EU": ".north-europe.azure.keboola.com",
@@ -20,6 +25,31 @@ Various Adhoc scripts for KBC api manipulations.
 """
 
 
+def url_suffix(region: str) -> str:
+    """Host suffix of a URL_SUFFIXES key ('EU') or of a kbc.stacks stack ID ('us-east4.gcp.keboola.com')."""
+    if region in URL_SUFFIXES:
+        return URL_SUFFIXES[region]
+    if region in stacks.STACKS:
+        return f'.{region}'
+    raise KeyError(f'Unknown region or stack {region}')
+
+
+def _endpoint_call(cl: Endpoint, method, url, **kwargs):
+    """
+    Equivalent of the Endpoint._get/_post/_delete helpers, sent through kbc.transport so the call is rate limited.
+    Like the Endpoint's RetryRequests session, 5xx responses are retried for every method.
+    """
+    headers = {**kwargs.pop('headers', {}), **cl._auth_header}
+    response = transport.request(method, url, headers=headers, retry=True, **kwargs)
+    try:
+        response.raise_for_status()
+    except requests.HTTPError as e:
+        raise e
+    if response.status_code == 204 or not response.content:
+        return None
+    return response.json()
+
+
 def run_config(component_id, config_id, token, region='US'):
     values = {
         "config": config_id
@@ -29,9 +59,9 @@ def run_config(component_id, config_id, token, region='US'):
         'Content-Type': 'application/json',
         'X-StorageApi-Token': token
     }
-    response = requests.post('https://syrup' + URL_SUFFIXES[region] + '/docker/' + component_id + '/run',
-                             data=json.dumps(values),
-                             headers=headers)
+    response = transport.post('https://syrup' + URL_SUFFIXES[region] + '/docker/' + component_id + '/run',
+                              data=json.dumps(values),
+                              headers=headers)
 
     try:
         response.raise_for_status()
@@ -46,7 +76,7 @@ def get_job_status(token, url):
         'Content-Type': 'application/json',
         'X-StorageApi-Token': token
     }
-    response = requests.get(url, headers=headers)
+    response = transport.get(url, headers=headers)
     try:
         response.raise_for_status()
     except requests.HTTPError as e:
@@ -78,7 +108,7 @@ def block_storage_job_until_completed(token, url):
 def list_component_configurations(token, component_id, region='US'):
     cl = Endpoint('https://connection' + URL_SUFFIXES[region], 'components', token)
     url = '{}/{}/configs'.format(cl.base_url, component_id)
-    return cl._get(url)
+    return _endpoint_call(cl, 'GET', url)
 
 
 def list_project_components(token, region='US', component_type=None, include='configuration,rows,state'):
@@ -86,7 +116,49 @@ def list_project_components(token, region='US', component_type=None, include='co
     url = cl.base_url
     params = {'componentType': component_type,
               'include': include}
-    return cl._get(url, params)
+    return _endpoint_call(cl, 'GET', url, params=params)
+
+
+def iter_project_configurations(token, region='US', component_type=None, include='configuration,rows,state',
+                                fields: Optional[Iterable[str]] = None,
+                                component_fields: Iterable[str] = ('id', 'name', 'type')) -> Iterator[dict]:
+    """
+    Streaming variant of list_project_components for large projects. The response is requested gzip compressed and
+    parsed incrementally, one configuration at a time, so the whole listing is never held in memory.
+
+    Args:
+        include: Same as in list_project_components; leave out 'rows' / 'state' to make the download itself smaller.
+        fields: Configuration fields to keep (dotted names select nested values), None keeps everything.
+        component_fields: Component fields added to each record under the 'component' key. Only fields listed
+            before 'configurations' in the API response are available (id, name, type, ... are).
+
+    Yields:
+        dict: One record per configuration.
+    """
+    url = f'https://connection{URL_SUFFIXES[region]}/v2/storage/components'
+    params = {'componentType': component_type,
+              'include': include}
+    headers = {'X-StorageApi-Token': token, 'Accept-Encoding': 'gzip'}
+    component_fields = list(component_fields)
+
+    with transport.get(url, params=params, headers=headers, stream=True) as response:
+        try:
+            response.raise_for_status()
+        except requests.HTTPError as e:
+            raise e
+
+        chunks = jsonstream.decode_chunks(response.iter_content(chunk_size=64 * 1024))
+        splitter = jsonstream.JsonStreamSplitter(chunks, ('*', 'configurations', '*'))
+        component = {}
+        for event, path, raw in splitter.events():
+            if event == 'start' and len(path) == 1:
+                component = {}
+            elif event == 'value' and len(path) == 2 and path[1] in component_fields:
+                component[path[1]] = json.loads(raw)
+            elif event == 'value' and len(path) == 3:
+                record = jsonstream.project(json.loads(raw), fields)
+                record['component'] = dict(component)
+                yield record
 
 
 def get_config_detail(token, region, component_id, config_id):
@@ -96,7 +168,7 @@ def get_config_detail(token, region, component_id, config_id):
     """
     cl = Endpoint('https://connection' + URL_SUFFIXES[region], 'components', token)
     url = '{}/{}/configs/{}'.format(cl.base_url, component_id, config_id)
-    return cl._get(url)
+    return _endpoint_call(cl, 'GET', url)
 
 
 def get_config_row_detail(token, region, component_id, config_id, row_id):
@@ -106,7 +178,7 @@ def get_config_row_detail(token, region, component_id, config_id, row_id):
     """
     cl = Endpoint('https://connection' + URL_SUFFIXES[region], 'components', token)
     url = f'{cl.base_url}/{component_id}/configs/{config_id}/rows/{row_id}'
-    return cl._get(url)
+    return _endpoint_call(cl, 'GET', url)
 
 
 def get_config_version(token, region, component_id, config_id, limit=10):
@@ -122,7 +194,7 @@ def get_config_version(token, region, component_id, config_id, limit=10):
     cl = Endpoint('https://connection' + URL_SUFFIXES[region], 'components', token)
     params = {"limit": limit}
     url = f'{cl.base_url}/{component_id}/configs/{config_id}/versions'
-    return cl._get(url, params=params)
+    return _endpoint_call(cl, 'GET', url, params=params)
 
 
 def get_config_rows(token, region, component_id, config_id):
@@ -139,7 +211,7 @@ def get_config_rows(token, region, component_id, config_id):
     cl = Endpoint('https://connection' + URL_SUFFIXES[region], 'components', token)
     url = '{}/{}/configs/{}/rows'.format(cl.base_url, component_id, config_id)
 
-    return cl._get(url)
+    return _endpoint_call(cl, 'GET', url)
 
 
 def delete_config(token, region, component_id, configuration_id, branch_id=None, **kwargs):
@@ -164,7 +236,7 @@ def delete_config(token, region, component_id, configuration_id, branch_id=None,
 
     cl = Endpoint('https://connection' + URL_SUFFIXES[region], enpoint_prefix, token)
     url = f'{cl.base_url}/{component_id}/configs/{configuration_id}'
-    return cl._delete(url)
+    return _endpoint_call(cl, 'DELETE', url)
 
 
 def create_config(token, region, component_id, name, description, configuration, configurationId=None, state=None,
@@ -206,7 +278,7 @@ def create_config(token, region, component_id, name, description, configuration,
         parameters['state'] = json.dumps(state)
     header = {'Content-Type': 'application/x-www-form-urlencoded'}
     data = urllib.parse.urlencode(parameters)
-    return cl._post(url, data=data, headers=header)
+    return _endpoint_call(cl, 'POST', url, data=data, headers=header)
 
 
 def update_config_state(token, region, component_id, configurationId, state, branch_id='default'):
@@ -220,9 +292,9 @@ def update_config_state(token, region, component_id, configurationId, state, bra
     parameters = {}
     parameters['state'] = json.dumps(state)
     headers = {'Content-Type': 'application/x-www-form-urlencoded', 'X-StorageApi-Token': token}
-    response = requests.put(url,
-                            data=parameters,
-                            headers=headers)
+    response = transport.put(url,
+                             data=parameters,
+                             headers=headers)
     try:
         response.raise_for_status()
     except requests.HTTPError as e:
@@ -258,7 +330,7 @@ def update_config(token, region, component_id, configurationId, name, descriptio
         url = f'https://connection{URL_SUFFIXES[region]}/v2/storage/branch/{branch_id}/components/{component_id}/configs/{configurationId}'
     parameters = {}
     parameters['configurationId'] = configurationId
-    if configuration:
+    if configuration is not None:
         parameters['configuration'] = json.dumps(configuration)
     parameters['name'] = name
     parameters['description'] = description
@@ -268,9 +340,9 @@ def update_config(token, region, component_id, configurationId, name, descriptio
         update_config_state(token, region, component_id, configurationId, state, branch_id)
     headers = {'Content-Type': 'application/x-www-form-urlencoded'
         , 'X-StorageApi-Token': token}
-    response = requests.put(url,
-                            data=parameters,
-                            headers=headers)
+    response = transport.put(url,
+                             data=parameters,
+                             headers=headers)
 
     try:
         response.raise_for_status()
@@ -306,9 +378,9 @@ def clone_configuration(token, region, component_id, configuration_id, name, des
 
     headers = {'Content-Type': 'application/x-www-form-urlencoded'
         , 'X-StorageApi-Token': token}
-    response = requests.post(url,
-                             data=parameters,
-                             headers=headers)
+    response = transport.post(url,
+                              data=parameters,
+                              headers=headers)
 
     try:
         response.raise_for_status()
@@ -329,9 +401,9 @@ def update_config_row_state(token, region, component_id, configurationId, row_id
     parameters = {}
     parameters['state'] = json.dumps(state)
     headers = {'Content-Type': 'application/x-www-form-urlencoded', 'X-StorageApi-Token': token}
-    response = requests.put(url,
-                            data=parameters,
-                            headers=headers)
+    response = transport.put(url,
+                             data=parameters,
+                             headers=headers)
     try:
         response.raise_for_status()
     except requests.HTTPError as e:
@@ -371,7 +443,7 @@ def update_config_row(token, region, component_id, configurationId, row_id, name
 
     parameters = {}
     parameters['configurationId'] = configurationId
-    if configuration:
+    if configuration is not None:
         parameters['configuration'] = json.dumps(configuration)
     parameters['name'] = name
     parameters['description'] = description
@@ -380,9 +452,9 @@ def update_config_row(token, region, component_id, configurationId, row_id, name
     if state is not None:
         update_config_row_state(token, region, component_id, configurationId, row_id, state, branch_id)
     headers = {'Content-Type': 'application/x-www-form-urlencoded', 'X-StorageApi-Token': token}
-    response = requests.put(url,
-                            data=parameters,
-                            headers=headers)
+    response = transport.put(url,
+                             data=parameters,
+                             headers=headers)
 
     try:
         response.raise_for_status()
@@ -435,13 +507,14 @@ def create_config_row(token, region, component_id, configuration_id, name, confi
 
     header = {'Content-Type': 'application/x-www-form-urlencoded'}
     data = urllib.parse.urlencode(parameters)
-    return cl._post(url, data=data, headers=header)
+    return _endpoint_call(cl, 'POST', url, data=data, headers=header)
 
 
 def clone_orchestration(src_token, dest_token, src_region, dst_region, orch_id):
     """
     Clones orchestration. Note that all component configs that are part of the tasks need to be migrated first using
-    the migrate_config function. Otherwise it will fail.
+    the migrate_config function. Otherwise it will fail. Use kbc.migration.migrate_orchestrations to migrate the
+    orchestration together with its configurations.
     :param src_token:
     :param orch_id:
     :param dest_token:
@@ -469,9 +542,9 @@ def create_orchestration(token, region, name, tasks, active=True, crontabRecord=
         'Content-Type': 'application/json',
         'X-StorageApi-Token': token
     }
-    response = requests.post('https://syrup' + URL_SUFFIXES[region] + '/orchestrator/orchestrations',
-                             data=json.dumps(values),
-                             headers=headers)
+    response = transport.post('https://syrup' + URL_SUFFIXES[region] + '/orchestrator/orchestrations',
+                              data=json.dumps(values),
+                              headers=headers)
 
     try:
         response.raise_for_status()
@@ -499,9 +572,9 @@ def update_orchestration(token, region, orchestration_id, name, tasks, active=Tr
         'Content-Type': 'application/json',
         'X-StorageApi-Token': token
     }
-    response = requests.put(f'https://syrup{URL_SUFFIXES[region]}/orchestrator/orchestrations/{orchestration_id}',
-                            data=json.dumps(values),
-                            headers=headers)
+    response = transport.put(f'https://syrup{URL_SUFFIXES[region]}/orchestrator/orchestrations/{orchestration_id}',
+                             data=json.dumps(values),
+                             headers=headers)
 
     try:
         response.raise_for_status()
@@ -516,7 +589,7 @@ def run_orchestration(orch_id, token, region='US'):
         'Content-Type': 'application/json',
         'X-StorageApi-Token': token
     }
-    response = requests.post(
+    response = transport.post(
         'https://syrup' + URL_SUFFIXES[region] + '/orchestrator/orchestrations/' + str(orch_id) + '/jobs',
         headers=headers)
 
@@ -532,22 +605,72 @@ def get_orchestrations(token, region='US'):
     syrup_cl = Endpoint('https://syrup' + URL_SUFFIXES[region], 'orchestrator', token)
 
     url = syrup_cl.root_url + '/orchestrator/orchestrations'
-    res = syrup_cl._get(url)
+    res = _endpoint_call(syrup_cl, 'GET', url)
     return res
 
 
-def _download_table(table, client: Tables, out_file):
+def _download_table(table, client: Tables, out_file, changed_since: Optional[str] = None):
     print('Downloading table %s into %s from source project', table['id'], out_file)
-    res_path = client.export_to_file(table['id'], out_file, is_gzip=True, changed_until='')
+    res_path = client.export_to_file(table['id'], out_file, is_gzip=True, changed_since=changed_since,
+                                     changed_until='')
 
     return res_path
 
 
 PAR_WORKDIRPATH = os.path.dirname(os.path.join(os.path.abspath('')))
+SYNC_STATE_FILE = os.path.join(PAR_WORKDIRPATH, 'data', 'table-sync-state.json')
+
+
+def _load_sync_state(state_file: str) -> dict:
+    if not os.path.exists(state_file):
+        return {}
+    with open(state_file) as f:
+        return json.load(f)
+
+
+def _save_sync_state(state_file: str, state: dict):
+    # write to a temp file and swap, so an interrupted sync never leaves a truncated state behind
+    os.makedirs(os.path.dirname(os.path.abspath(state_file)), exist_ok=True)
+    with open(state_file + '.tmp', 'w') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(state_file + '.tmp', state_file)
+
+
+# Storage API dates look like '2024-01-15T10:20:30+0100'; fromisoformat only accepts the +HHMM offset since 3.11
+_TIMESTAMP_FORMATS = ('%Y-%m-%dT%H:%M:%S%z', '%Y-%m-%dT%H:%M:%S.%f%z', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S')
+
+
+def _parse_timestamp(value: Optional[str]) -> Optional[datetime.datetime]:
+    """Storage API dates ('2024-01-15T10:20:30+0100'); dates without an offset are taken as UTC."""
+    if not isinstance(value, str):
+        return None
+    for timestamp_format in _TIMESTAMP_FORMATS:
+        try:
+            parsed = datetime.datetime.strptime(value.strip(), timestamp_format)
+        except ValueError:
+            continue
+        return parsed if parsed.tzinfo else parsed.replace(tzinfo=datetime.timezone.utc)
+    return None
 
 
 def transfer_storage_bucket(from_token, to_token, src_bucket_id, region_from='EU', region_to='EU', dest_bucket_id=None,
-                            tmp_folder=os.path.join(PAR_WORKDIRPATH, 'data')):
+                            tmp_folder=os.path.join(PAR_WORKDIRPATH, 'data'),
+                            on_progress: Optional[Callable[[dict], None]] = None,
+                            incremental: bool = False, state_file: str = SYNC_STATE_FILE):
+    """
+    Copies all tables of a bucket into the destination project. Tables already present in the destination are skipped
+    unless `incremental` is set.
+
+    :param on_progress: Optional callback receiving one dict per table ({'table_id', 'status'}), e.g.
+                        TaskHandle.report when running as a background task via kbc.tasks.submit.
+    :param incremental: Sync mode for keeping a copy current. Tables present in the destination are updated instead
+                        of skipped: only rows changed since the last sync are exported (changedSince) and loaded
+                        incrementally, so the destination upserts them by primary key. The high-water mark of each
+                        table (its lastChangeDate at the time of export) is kept in `state_file`. Tables without
+                        a primary key, or without a mark yet, are reloaded in full. Deleted rows are not propagated.
+                        Statuses: 'success' (created), 'synced', 'full_reload', 'unchanged'.
+    :param state_file: JSON file with the high-water marks, keyed by source and destination table.
+    """
     storage_api_url_from = 'https://connection' + URL_SUFFIXES[region_from]
     storage_api_url_to = 'https://connection' + URL_SUFFIXES[region_to]
     from_tables = Tables(storage_api_url_from, from_token)
@@ -563,13 +686,42 @@ def transfer_storage_bucket(from_token, to_token, src_bucket_id, region_from='EU
         new_bucket_id = src_bucket_id
 
     bucket_exists = (new_bucket_id in [b['id'] for b in to_buckets.list()])
+    existing_tables = {t['id'] for t in to_buckets.list_tables(new_bucket_id)} if bucket_exists else set()
+    sync_state = _load_sync_state(state_file) if incremental else {}
 
     for tb in tables:
         tb['new_id'] = tb['id'].replace(src_bucket_id, new_bucket_id)
         tb['new_bucket_id'] = new_bucket_id
-
-        if bucket_exists and tb['new_id'] in [b['id'] for b in to_buckets.list_tables(new_bucket_id)]:
-            print('Table %s already exists in destination bucket, skipping..', tb['new_id'])
+        state_key = f"{storage_api_url_from}/{tb['id']} -> {storage_api_url_to}/{tb['new_id']}"
+        # captured before the export, rows changed during the export are picked up again by the next sync
+        high_water_mark = tb.get('lastChangeDate') or tb.get('lastImportDate')
+
+        if tb['new_id'] in existing_tables:
+            if not incremental:
+                print('Table %s already exists in destination bucket, skipping..', tb['new_id'])
+                if on_progress:
+                    on_progress({'table_id': tb['id'], 'status': 'skipped'})
+                continue
+
+            changed_since = sync_state.get(state_key, {}).get('changed_since')
+            # compared as instants: the marks may carry different UTC offsets; unparseable ones count as changed
+            last_change, synced_until = _parse_timestamp(high_water_mark), _parse_timestamp(changed_since)
+            if last_change and synced_until and last_change <= synced_until:
+                if on_progress:
+                    on_progress({'table_id': tb['id'], 'status': 'unchanged'})
+                continue
+
+            delta = bool(changed_since and tb['primaryKey'])
+            local_path = _download_table(tb, from_tables, tmp_folder, changed_since=changed_since if delta else None)
+            print('Loading table %s into the destination project (%s)', tb['new_id'], 'delta' if delta else 'full')
+            to_tables.load(tb['new_id'], local_path, is_incremental=delta)
+            os.remove(local_path)
+
+            if high_water_mark:
+                sync_state[state_key] = {'changed_since': high_water_mark}
+                _save_sync_state(state_file, sync_state)
+            if on_progress:
+                on_progress({'table_id': tb['id'], 'status': 'synced' if delta else 'full_reload'})
             continue
 
         local_path = _download_table(tb, from_tables, tmp_folder)
@@ -590,10 +742,32 @@ def transfer_storage_bucket(from_token, to_token, src_bucket_id, region_from='EU
         print('Deleting temp file')
         os.remove(local_path)
         # os.remove(local_path + '.gz')
+        if incremental and high_water_mark:
+            sync_state[state_key] = {'changed_since': high_water_mark}
+            _save_sync_state(state_file, sync_state)
+        if on_progress:
+            on_progress({'table_id': tb['id'], 'status': 'success'})
 
     print('Finished.')
 
 
+def transfer_storage_table(from_token, to_token, table: dict, dest_bucket_id: str, region_from='EU', region_to='EU',
+                           tmp_folder=os.path.join(PAR_WORKDIRPATH, 'data')) -> str:
+    """
+    Copies a single table (as listed by Buckets.list_tables) into an existing bucket of the destination project.
+    Each call downloads into its own temporary folder, so tables can be transferred concurrently.
+
+    :return: id of the table in the destination project
+    """
+    from_tables = Tables('https://connection' + URL_SUFFIXES[region_from], from_token)
+    to_tables = Tables('https://connection' + URL_SUFFIXES[region_to], to_token)
+    os.makedirs(tmp_folder, exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=tmp_folder) as table_folder:
+        local_path = _download_table(table, from_tables, table_folder)
+        print('Creating table %s in the destination project', table['id'])
+        return to_tables.create(dest_bucket_id, table['name'], local_path, primary_key=table['primaryKey'])
+
+
 def migrate_configs(src_token, dst_token, src_config_id, component_id, src_region='EU', dst_region='EU',
                     use_src_id=False):
     """
@@ -601,7 +775,7 @@ def migrate_configs(src_token, dst_token, src_config_id, component_id, src_regio
     Includes all attributes, even the ones that are not updateble => API service will ignore them.
 
     :par use_src_id: If true the src config id will be used in the destination
-
+    :return: id of the configuration in the destination project
     """
     src_config = get_config_detail(src_token, src_region, component_id, src_config_id)
     src_config_rows = get_config_rows(src_token, src_region, component_id, src_config_id)
@@ -634,6 +808,8 @@ def migrate_configs(src_token, dst_token, src_config_id, component_id, src_regio
 
         create_config_row(**row)
 
+    return new_cfg['id']
+
 
 def create_branch(token, region, name, description=''):
     """
@@ -655,7 +831,7 @@ def create_branch(token, region, name, description=''):
     # convert objects to string
     header = {'Content-Type': 'application/x-www-form-urlencoded'}
     data = urllib.parse.urlencode(parameters)
-    resp = cl._post(url, data=data, headers=header)
+    resp = _endpoint_call(cl, 'POST', url, data=data, headers=header)
 
     job = block_storage_job_until_completed(token, resp['url'])
     return job['results']['id']
@@ -676,8 +852,8 @@ def create_new_project(storage_token, name, organisation, p_type='poc6months', r
         "defaultBackend": defaultBackend
     }
 
-    response = requests.post(
-        f'https://connection{URL_SUFFIXES[region]}/manage/organizations/' + str(organisation) + '/projects',
+    response = transport.post(
+        f'https://connection{url_suffix(region)}/manage/organizations/' + str(organisation) + '/projects',
         headers=headers, data=json.dumps(data))
     try:
         response.raise_for_status()
@@ -695,8 +871,8 @@ def invite_user_to_project(token, project_id, email, region='US'):
     data = {
         "email": email
     }
-    response = requests.post(
-        f'https://connection{URL_SUFFIXES[region]}/manage/projects/' + str(project_id) + '/users',
+    response = transport.post(
+        f'https://connection{url_suffix(region)}/manage/projects/' + str(project_id) + '/users',
         data=json.dumps(data),
         headers=headers)
 
@@ -723,10 +899,11 @@ def generate_token(decription, token, proj_id, region, expires_in=1800, manage_t
         "bucketPermissions": {"*": "write"},
         "expiresIn": expires_in
     }
+    data.update(additional_params or {})
 
-    response = requests.post(f'https://connection{URL_SUFFIXES[region]}/manage/projects/' + str(proj_id) + '/tokens',
-                             headers=headers,
-                             data=json.dumps(data))
+    response = transport.post(f'https://connection{url_suffix(region)}/manage/projects/' + str(proj_id) + '/tokens',
+                              headers=headers,
+                              data=json.dumps(data))
     try:
         response.raise_for_status()
     except requests.HTTPError as e:
@@ -741,7 +918,7 @@ def get_organization(master_token, region, org_id):
         'X-KBC-ManageApiToken': master_token,
     }
 
-    response = requests.get(
+    response = transport.get(
         f'https://connection{URL_SUFFIXES[region]}/manage/organizations/' + str(org_id),
         headers=headers)
     try:
@@ -758,7 +935,7 @@ def get_project_detail(stack, master_token, project_id):
         'X-KBC-ManageApiToken': master_token,
     }
 
-    response = requests.get(
+    response = transport.get(
         f'https://connection.{stack}/manage/projects/' + str(project_id),
         headers=headers)
     try:
@@ -784,19 +961,20 @@ def get_schedules(region: str, master_token: str):
 
         while is_complete is False:
             par_schedules['offset'] = offset
-            rsp_schedules = requests.get(url, params=par_schedules, headers=headers)
-
-            if rsp_schedules.status_code == 200:
-                js_schedules = rsp_schedules.json()
-                all_jobs += js_schedules
-                if len(js_schedules) < 100:
-                    is_complete = True
-                    return all_jobs
-                else:
-                    offset += 100
+            rsp_schedules = transport.get(url, params=par_schedules, headers=headers)
+            # HTTPError (e.g. 401 / 403 of an expired or forbidden token) so callers can handle it per project
+            try:
+                rsp_schedules.raise_for_status()
+            except requests.HTTPError as e:
+                raise e
+
+            js_schedules = rsp_schedules.json()
+            all_jobs += js_schedules
+            if len(js_schedules) < 100:
+                is_complete = True
+                return all_jobs
             else:
-                raise Exception(f"Could not download jobs for project in stack "
-                                f"{region}.\nReceived: {rsp_schedules.status_code} - {rsp_schedules.json()}.")
+                offset += 100
 
     return _get_paged_schedules(region, master_token)
 
@@ -829,7 +1007,7 @@ def list_oauth_consumers(stack: str, master_token: str, filter_response: bool =
         'Content-Type': 'application/json',
         'X-KBC-ManageApiToken': master_token,
     }
-    response = requests.get(
+    response = transport.get(
         f'https://oauth.{stack}/manage',
         headers=headers)
     try:
@@ -871,7 +1049,7 @@ def get_oauth_consumers(stack: str, master_token: str, component_id: str):
             'Content-Type': 'application/json',
             'X-KBC-ManageApiToken': master_token,
         }
-        response = requests.get(
+        response = transport.get(
             f'https://oauth.{stack}/manage/{component_id}',
             headers=headers)
         try:
@@ -889,7 +1067,7 @@ def create_oauth_consumer(stack: str, master_token: str, payload: dict, **kwargs
     }
     if 'gcp' in stack:
         payload = _convert_payload_to_camel_case(payload)
-    response = requests.post(
+    response = transport.post(
         f'https://oauth.{stack}/manage',
         headers=headers, json=payload)
     try:
@@ -907,7 +1085,7 @@ def patch_oauth_consumer(stack: str, master_token: str, component_id: str, paylo
     }
     if 'gcp' in stack:
         payload = _convert_payload_to_camel_case(payload)
-    response = requests.patch(
+    response = transport.patch(
         f'https://oauth.{stack}/manage/{component_id}',
         headers=headers, json=payload)
     try:
@@ -924,7 +1102,7 @@ def developer_portal_login(email: str, password: str):
         "password": password
     }
 
-    response = requests.post(
+    response = transport.post(
         'https://apps-api.keboola.com/auth/login', json=payload)
     try:
         response.raise_for_status()
@@ -937,7 +1115,7 @@ def developer_portal_login(email: str, password: str):
 def dev_portal_get_app_detail(access_token: str, vendor: str, component_id: str):
     headers = {'Authorization': f'{access_token}'}
 
-    response = requests.get(
+    response = transport.get(
         f'https://apps-api.keboola.com/vendors/{vendor}/apps/{component_id}', headers=headers)
     try:
         response.raise_for_status()
@@ -984,7 +1162,7 @@ def developer_portal_patch_app_permissions(access_token: str, vendor: str, compo
         "permissions": new_permissions
     }
 
-    response = requests.patch(
+    response = transport.patch(
         f'https://apps-api.keboola.com/vendors/{vendor}/apps/{component_id}', headers=headers, json=payload)
     try:
         response.raise_for_status()
@@ -1027,10 +1205,10 @@ def encrypt(string_to_encrypt: str, component_id: Optional[str] = None, project_
 
     headers = {"Content-Type": "text/plain"}
 
-    response = requests.post(url,
-                             data=string_to_encrypt,
-                             params=params,
-                             headers=headers)
+    response = transport.post(url,
+                              data=string_to_encrypt,
+                              params=params,
+                              headers=headers)
     response.raise_for_status()
     return response.text
 
@@ -1045,7 +1223,7 @@ def add_feature(stack: str, master_token, project_id: str, feature: str):
         "feature": feature
     }
 
-    response = requests.post(
+    response = transport.post(
         f'https://connection.{stack}/manage/projects/{project_id}/features',
         headers=headers, json=data)
     try:
@@ -1062,7 +1240,7 @@ def remove_feature(stack: str, master_token, project_id: str, feature: str):
         'X-KBC-ManageApiToken': master_token,
     }
 
-    response = requests.delete(
+    response = transport.delete(
         f'https://connection.{stack}/manage/projects/{project_id}/features/{feature}',
         headers=headers)
     try:
@@ -1079,7 +1257,7 @@ def list_project_features(stack: str, master_token, project_id: str):
         'X-KBC-ManageApiToken': master_token
     }
 
-    response = requests.get(
+    response = transport.get(
         f'https://connection.{stack}/manage/projects/{project_id}',
         headers=headers)
     try:
@@ -1096,7 +1274,7 @@ def list_features(stack: str, master_token):
         'X-KBC-ManageApiToken': master_token
     }
 
-    response = requests.get(
+    response = transport.get(
         f'https://connection.{stack}/manage/features?type=project',
         headers=headers)
     try:
@@ -1113,7 +1291,7 @@ def list_organizations_by_stack(stack: str, master_token: str):
         'X-KBC-ManageApiToken': master_token,
     }
 
-    response = requests.get(
+    response = transport.get(
         f'https://connection.{stack}/manage/organizations',
         headers=headers,
     )
@@ -1124,15 +1302,17 @@ def list_organizations_by_stack(stack: str, master_token: str):
     return data
 
 
-def get_organization_by_stack(stack: str, master_token: str, organization_id: str):
+def get_organization_by_stack(stack: str, master_token: str, organization_id: str, fresh: bool = False):
+    """fresh=True skips the HTTP cache, e.g. when the project list decides which projects a bulk change touches."""
     headers = {
         'Content-Type': 'application/json',
         'X-KBC-ManageApiToken': master_token,
     }
 
-    response = requests.get(
+    response = transport.get(
         f'https://connection.{stack}/manage/organizations/{organization_id}',
         headers=headers,
+        cache=not fresh,
     )
     response.raise_for_status()
 
@@ -1141,22 +1321,22 @@ def get_organization_by_stack(stack: str, master_token: str, organization_id: st
 
 def list_all_components(only_keboola: bool = False) -> dict[str, dict]:
     """
-    Get all components from the Storage API index call
+    Get all components from the Storage API index call of all available stacks
     Returns:
 
     """
-    stacks = ["eu-central-1.keboola.com",
-              "keboola.com",
-              "north-europe.azure.keboola.com",
-              "europe-west2.gcp.keboola.com",
-              "europe-west3.gcp.keboola.com",
-              "us-east4.gcp.keboola.com"]
-    all_components = dict()
-    for stack in stacks:
-        url = f"https://connection.{stack}/v2/storage"
-        response = requests.get(url)
+    def _get_components(stack):
+        response = transport.get(f"https://connection.{stack}/v2/storage")
         response.raise_for_status()
-        components = response.json()['components']
+        return response.json()['components']
+
+    # stacks with an open circuit are skipped so one degraded stack doesn't stall the whole listing
+    stacks = health.available_stacks()
+    with ThreadPoolExecutor(max_workers=len(stacks) or 1) as executor:
+        stack_components = list(executor.map(profiler.propagate(_get_components), stacks))
+
+    all_components = dict()
+    for components in stack_components:
         if components:
             all_components = {**all_components, **{component['id']: component for component in components}}
         keboola_vendors = ['keboola.', 'kds-team.']
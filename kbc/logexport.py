@@ -0,0 +1,256 @@
+"""
+Offline analysis of log exports (JSON lines, e.g. a Datadog log export).
+
+The export is read through a memory map, one line at a time, so multi-GB files never have to fit in memory. Indexing
+keeps only what the aggregations need in a SQLite file next to the export (`<export>.idx.sqlite`): per line its
+byte offset, timestamp, runId and dictionary-encoded component, priority and message fingerprint. Queries then run
+against the index and read the original lines back through the memory map only for samples.
+
+The fingerprint is the message with the variable parts (numbers, IDs, hashes, quoted values, URLs) replaced by
+placeholders, so "Job 123 failed after 45 s" and "Job 987 failed after 3 s" group together.
+An export that was appended to since the last run is indexed incrementally.
+"""
+import hashlib
+import json
+import mmap
+import os
+import re
+import sqlite3
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
+
+# candidate keys of each attribute, the first one present wins; dotted names select nested values
+FIELDS = {
+    'timestamp': ('timestamp', 'date', '@timestamp', 'attributes.timestamp'),
+    'component': ('component', 'attributes.component', 'attributes.componentId', 'componentId',
+                  'attributes.context.component'),
+    'run_id': ('runId', 'attributes.runId', 'attributes.context.runId', 'jobId', 'attributes.jobId'),
+    'priority': ('priority', 'attributes.priority', 'status', 'level', 'attributes.level'),
+    'message': ('message', 'attributes.message', 'content.message', 'msg'),
+}
+GROUP_COLUMNS = ('component', 'run_id', 'priority', 'fingerprint')
+ERROR_PRIORITIES = ('ERROR', 'CRITICAL', 'ALERT', 'EMERGENCY')
+
+_NORMALIZERS = [
+    (re.compile(r'https?://\S+'), '<url>'),
+    (re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}', re.I), '<uuid>'),
+    (re.compile(r'\b[0-9a-f]{16,}\b', re.I), '<hash>'),
+    (re.compile(r'"[^"]*"|\'[^\']*\''), '<str>'),
+    (re.compile(r'\d+(\.\d+)?'), '<num>'),
+]
+_MAX_FINGERPRINT = 300
+_HEAD_BYTES = 64 * 1024
+_BATCH = 5000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS dictionary (id INTEGER PRIMARY KEY, kind TEXT NOT NULL, value TEXT NOT NULL,
+                                       UNIQUE (kind, value));
+CREATE TABLE IF NOT EXISTS lines (
+    offset INTEGER PRIMARY KEY,
+    ts TEXT,
+    run_id TEXT,
+    component INTEGER,
+    priority INTEGER,
+    fingerprint INTEGER
+) WITHOUT ROWID;
+"""
+
+
+def fingerprint(message: str) -> str:
+    message = message.strip().splitlines()[0] if message.strip() else ''
+    for pattern, placeholder in _NORMALIZERS:
+        message = pattern.sub(placeholder, message)
+    return message[:_MAX_FINGERPRINT]
+
+
+def _lookup(record: dict, names: Sequence[str]):
+    for name in names:
+        value = record
+        for part in name.split('.'):
+            if not isinstance(value, dict) or part not in value:
+                break
+            value = value[part]
+        else:
+            if value not in (None, ''):
+                return value
+    return None
+
+
+def iter_lines(buffer, start: int = 0) -> Iterator[Tuple[int, bytes]]:
+    """(offset, line) for every complete line of the buffer from `start`; a trailing partial line is left out."""
+    offset = start
+    size = len(buffer)
+    while offset < size:
+        end = buffer.find(b'\n', offset)
+        if end == -1:
+            return
+        yield offset, buffer[offset:end]
+        offset = end + 1
+
+
+class LogIndex:
+
+    def __init__(self, export_path: str, index_path: Optional[str] = None, check_same_thread: bool = True):
+        self.export_path = export_path
+        self.index_path = index_path or export_path + '.idx.sqlite'
+        # check_same_thread=False lets a Streamlit session keep one index across reruns, which run on other threads
+        self.connection = sqlite3.connect(self.index_path, check_same_thread=check_same_thread)
+        self.connection.executescript(_SCHEMA)
+        self._dictionary = {(kind, value): id_ for id_, kind, value in
+                            self.connection.execute('SELECT id, kind, value FROM dictionary')}
+
+    # ---- state ----
+
+    def _meta(self, key: str) -> Optional[str]:
+        row = self.connection.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, **values):
+        self.connection.executemany('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                                    [(k, str(v)) for k, v in values.items()])
+
+    @staticmethod
+    def _head_digest(buffer, length: int) -> str:
+        return hashlib.sha256(buffer[:min(length, _HEAD_BYTES)]).hexdigest()
+
+    @property
+    def indexed_bytes(self) -> int:
+        return int(self._meta('indexed_bytes') or 0)
+
+    def is_current(self) -> bool:
+        return self.indexed_bytes > 0 and self.indexed_bytes >= os.path.getsize(self.export_path) - 1
+
+    def _reset(self):
+        with self.connection:
+            self.connection.executescript('DELETE FROM lines; DELETE FROM dictionary; DELETE FROM meta;')
+        self._dictionary = {}
+
+    def _code(self, kind: str, value: Optional[str]) -> Optional[int]:
+        if value is None:
+            return None
+        key = (kind, value)
+        if key not in self._dictionary:
+            cursor = self.connection.execute('INSERT INTO dictionary (kind, value) VALUES (?, ?)', key)
+            self._dictionary[key] = cursor.lastrowid
+        return self._dictionary[key]
+
+    # ---- indexing ----
+
+    def build(self, on_progress: Optional[Callable[[int, int], None]] = None) -> int:
+        """
+        Indexes the lines appended since the last run (or the whole file if it was replaced).
+
+        Args:
+            on_progress: Called with (bytes indexed, total bytes) after every batch.
+
+        Returns:
+            Number of lines indexed by this call.
+        """
+        size = os.path.getsize(self.export_path)
+        if size == 0:
+            return 0
+        indexed = 0
+        with open(self.export_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            start = self.indexed_bytes
+            if start > size or self._meta('head_digest') != self._head_digest(buffer, start):
+                self._reset()
+                start = 0
+
+            rows = []
+            position = start
+            for offset, line in iter_lines(buffer, start):
+                position = offset + len(line) + 1
+                row = self._parse(offset, line)
+                if row:
+                    rows.append(row)
+                if len(rows) >= _BATCH:
+                    indexed += self._flush(rows, position, self._head_digest(buffer, position))
+                    rows = []
+                    if on_progress:
+                        on_progress(position, size)
+            indexed += self._flush(rows, position, self._head_digest(buffer, position))
+            if on_progress:
+                on_progress(position, size)
+        return indexed
+
+    def _parse(self, offset: int, line: bytes) -> Optional[tuple]:
+        line = line.strip()
+        if not line:
+            return None
+        try:
+            record = json.loads(line)
+        except ValueError:
+            return None
+        if not isinstance(record, dict):
+            return None
+        message = _lookup(record, FIELDS['message'])
+        priority = _lookup(record, FIELDS['priority'])
+        run_id = _lookup(record, FIELDS['run_id'])
+        timestamp = _lookup(record, FIELDS['timestamp'])
+        component = _lookup(record, FIELDS['component'])
+        return (offset, str(timestamp) if timestamp is not None else None,
+                str(run_id) if run_id is not None else None,
+                self._code('component', str(component) if component is not None else None),
+                self._code('priority', str(priority).upper() if priority is not None else None),
+                self._code('fingerprint', fingerprint(str(message)) if message is not None else None))
+
+    def _flush(self, rows: List[tuple], position: int, digest: str) -> int:
+        with self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO lines VALUES (?, ?, ?, ?, ?, ?)', rows)
+            self._set_meta(indexed_bytes=position, head_digest=digest)
+        return len(rows)
+
+    # ---- queries ----
+
+    def values(self, kind: str) -> List[str]:
+        return sorted(value for k, value in self._dictionary if k == kind)
+
+    def _where(self, components: Sequence[str] = (), priorities: Sequence[str] = (), run_id: Optional[str] = None,
+               fingerprint_contains: Optional[str] = None) -> Tuple[str, list]:
+        clauses, params = [], []
+        for column, values in (('component', components), ('priority', priorities)):
+            if values:
+                codes = [self._dictionary.get((column, v), -1) for v in values]
+                clauses.append(f'l.{column} IN ({", ".join("?" * len(codes))})')
+                params += codes
+        if run_id:
+            clauses.append('l.run_id = ?')
+            params.append(run_id)
+        if fingerprint_contains:
+            clauses.append('f.value LIKE ?')
+            params.append(f'%{fingerprint_contains}%')
+        return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+    def aggregate(self, group_by: Sequence[str] = ('component', 'fingerprint'), limit: int = 500,
+                  **filters) -> List[dict]:
+        """
+        Line counts grouped by any of GROUP_COLUMNS, largest groups first.
+
+        Args:
+            filters: components, priorities, run_id, fingerprint_contains.
+
+        Returns:
+            [{<group columns>, "count", "first", "last", "sample_offset"}]
+        """
+        unknown = set(group_by) - set(GROUP_COLUMNS)
+        if unknown:
+            raise ValueError(f'Cannot group by {sorted(unknown)}')
+        select = {'component': 'c.value', 'priority': 'p.value', 'fingerprint': 'f.value', 'run_id': 'l.run_id'}
+        columns = [f'{select[column]} AS {column}' for column in group_by]
+        where, params = self._where(**filters)
+        sql = (f'SELECT {", ".join(columns + ["COUNT(*)", "MIN(l.ts)", "MAX(l.ts)", "MIN(l.offset)"])} '
+               'FROM lines l LEFT JOIN dictionary c ON c.id = l.component '
+               'LEFT JOIN dictionary p ON p.id = l.priority LEFT JOIN dictionary f ON f.id = l.fingerprint'
+               f'{where} GROUP BY {", ".join(group_by) or "NULL"} ORDER BY COUNT(*) DESC LIMIT ?')
+        rows = self.connection.execute(sql, params + [limit]).fetchall()
+        keys = list(group_by) + ['count', 'first', 'last', 'sample_offset']
+        return [dict(zip(keys, row)) for row in rows]
+
+    def read_line(self, offset: int) -> dict:
+        """The original record at the byte offset (e.g. an aggregate's sample_offset)."""
+        with open(self.export_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            end = buffer.find(b'\n', offset)
+            return json.loads(buffer[offset:end if end != -1 else len(buffer)])
+
+    def close(self):
+        self.connection.close()
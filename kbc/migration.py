@@ -0,0 +1,191 @@
+"""
+Dependency-aware migration of orchestrations together with the configurations they run.
+
+clone_orchestration only works once every configuration referenced by the orchestration's tasks was migrated with
+migrate_configs. This module parses the tasks into a dependency graph (orchestration -> component configurations and
+nested orchestrations), migrates all configurations concurrently and creates each orchestration as soon as all of its
+dependencies are in place, with the task references rewritten to the IDs in the destination project.
+
+Both the legacy orchestrator ('orchestrator', tasks with actionParameters.config) and flows
+('keboola.orchestrator', tasks with task.componentId / task.configId) are supported.
+"""
+import copy
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import requests
+
+import kbc.kbcapi_scripts
+
+MAX_WORKERS = 8
+ORCHESTRATOR_COMPONENTS = ('orchestrator', 'keboola.orchestrator')
+
+Node = Tuple[str, str]  # (component_id, config_id)
+
+
+def _task_reference(task: dict) -> Optional[Node]:
+    if 'task' in task:
+        component_id, config_id = task['task'].get('componentId'), task['task'].get('configId')
+    else:
+        component_id, config_id = task.get('component'), (task.get('actionParameters') or {}).get('config')
+    if not component_id or not config_id:
+        return None
+    return component_id, str(config_id)
+
+
+def _rewrite_task(task: dict, config_id: str) -> dict:
+    task = copy.deepcopy(task)
+    if 'task' in task:
+        task['task']['configId'] = config_id
+    else:
+        task['actionParameters']['config'] = config_id
+    return task
+
+
+def _tasks_of(orchestration: dict) -> List[dict]:
+    return (orchestration.get('configuration') or {}).get('tasks') or []
+
+
+class OrchestrationMigrator:
+
+    def __init__(self, src_token: str, dst_token: str, src_region: str = 'EU', dst_region: str = 'EU',
+                 use_src_id: bool = False, max_workers: int = MAX_WORKERS):
+        self.src_token = src_token
+        self.dst_token = dst_token
+        self.src_region = src_region
+        self.dst_region = dst_region
+        self.use_src_id = use_src_id
+        self.max_workers = max_workers
+        self.orchestrations: Dict[Node, dict] = {}
+        self.dependencies: Dict[Node, Set[Node]] = {}
+        self.results: Dict[Node, dict] = {}
+
+    # ---- graph ----
+
+    def build_graph(self, orchestrations: Iterable[Node]):
+        """Fetches the orchestrations (and, recursively, the orchestrations they run) and records dependencies."""
+        to_fetch = {(component_id, str(config_id)) for component_id, config_id in orchestrations}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while to_fetch:
+                details = executor.map(lambda node: kbc.kbcapi_scripts.get_config_detail(
+                    self.src_token, self.src_region, node[0], node[1]), to_fetch)
+                fetched = dict(zip(to_fetch, details))
+                to_fetch = set()
+                for node, detail in fetched.items():
+                    self.orchestrations[node] = detail
+                    references = {ref for ref in map(_task_reference, _tasks_of(detail)) if ref}
+                    self.dependencies[node] = references
+                    to_fetch |= {ref for ref in references
+                                 if ref[0] in ORCHESTRATOR_COMPONENTS and ref not in self.orchestrations}
+                    for ref in references:
+                        self.dependencies.setdefault(ref, set())
+
+    @property
+    def configurations(self) -> List[Node]:
+        return [node for node in self.dependencies if node[0] not in ORCHESTRATOR_COMPONENTS]
+
+    def plan(self) -> List[List[Node]]:
+        """Topological layers of the graph: every node only depends on nodes of earlier layers."""
+        remaining = {node: set(deps) for node, deps in self.dependencies.items()}
+        layers = []
+        while remaining:
+            layer = [node for node, deps in remaining.items() if not deps]
+            if not layer:
+                raise ValueError(f'Circular orchestration references: {sorted(remaining)}')
+            layers.append(layer)
+            for node in layer:
+                del remaining[node]
+            for deps in remaining.values():
+                deps.difference_update(layer)
+        return layers
+
+    # ---- execution ----
+
+    def _migrate_configuration(self, node: Node) -> str:
+        return kbc.kbcapi_scripts.migrate_configs(self.src_token, self.dst_token, node[1], node[0],
+                                                  self.src_region, self.dst_region, use_src_id=self.use_src_id)
+
+    def _create_orchestration(self, node: Node) -> str:
+        detail = self.orchestrations[node]
+        tasks = []
+        for task in _tasks_of(detail):
+            ref = _task_reference(task)
+            tasks.append(_rewrite_task(task, self.results[ref]['new_id']) if ref else task)
+
+        if node[0] == 'orchestrator':
+            created = kbc.kbcapi_scripts.create_orchestration(self.dst_token, self.dst_region, detail['name'], tasks)
+        else:
+            configuration = {**detail['configuration'], 'tasks': tasks}
+            created = kbc.kbcapi_scripts.create_config(
+                self.dst_token, self.dst_region, node[0], detail['name'], detail.get('description', ''),
+                configuration, configurationId=node[1] if self.use_src_id else None)
+        return str(created['id'])
+
+    def run(self, on_progress: Optional[Callable[[dict], None]] = None) -> Dict[Node, dict]:
+        """
+        Migrates all nodes of the graph. Nodes are submitted as soon as their dependencies succeeded; nodes with a
+        failed dependency are skipped.
+        """
+        self.plan()  # fails early on cycles
+        waiting = {node: set(deps) for node, deps in self.dependencies.items()}
+        dependents: Dict[Node, Set[Node]] = {}
+        for node, deps in self.dependencies.items():
+            for dep in deps:
+                dependents.setdefault(dep, set()).add(node)
+
+        def _submit(executor, node):
+            fn = self._create_orchestration if node[0] in ORCHESTRATOR_COMPONENTS and node in self.orchestrations \
+                else self._migrate_configuration
+            return executor.submit(fn, node)
+
+        def _skip(node, reason):
+            if node in self.results:
+                return
+            self.results[node] = {"component_id": node[0], "config_id": node[1], "status": "skipped",
+                                  "error": reason}
+            if on_progress:
+                on_progress(self.results[node])
+            for dependent in dependents.get(node, ()):
+                _skip(dependent, f'dependency {node[0]}/{node[1]} was not migrated')
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = {_submit(executor, node): node for node, deps in waiting.items() if not deps}
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    node = pending.pop(future)
+                    try:
+                        new_id = future.result()
+                    except (requests.RequestException, KeyError, ValueError) as error:
+                        self.results[node] = {"component_id": node[0], "config_id": node[1], "status": "error",
+                                              "error": str(error)}
+                        if on_progress:
+                            on_progress(self.results[node])
+                        for dependent in dependents.get(node, ()):
+                            _skip(dependent, f'dependency {node[0]}/{node[1]} failed')
+                        continue
+
+                    self.results[node] = {"component_id": node[0], "config_id": node[1], "status": "success",
+                                          "new_id": new_id}
+                    if on_progress:
+                        on_progress(self.results[node])
+                    for dependent in dependents.get(node, ()):
+                        waiting[dependent].discard(node)
+                        if not waiting[dependent] and dependent not in self.results:
+                            pending[_submit(executor, dependent)] = dependent
+        return self.results
+
+
+def migrate_orchestrations(src_token: str, dst_token: str, orchestration_ids: Iterable[str],
+                           src_region: str = 'EU', dst_region: str = 'EU', component_id: str = 'orchestrator',
+                           use_src_id: bool = False, max_workers: int = MAX_WORKERS,
+                           on_progress: Optional[Callable[[dict], None]] = None) -> Dict[Node, dict]:
+    """
+    Migrates the orchestrations with every configuration and nested orchestration they depend on.
+
+    Returns:
+        (component_id, config_id) -> {"status": "success" | "error" | "skipped", "new_id" | "error"}
+    """
+    migrator = OrchestrationMigrator(src_token, dst_token, src_region, dst_region, use_src_id, max_workers)
+    migrator.build_graph((component_id, orchestration_id) for orchestration_id in orchestration_ids)
+    return migrator.run(on_progress)
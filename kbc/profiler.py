@@ -0,0 +1,165 @@
+"""
+Opt-in profiler of Streamlit script reruns.
+
+A rerun is wrapped in `rerun()`; code inside marks blocks with `span(name, category)`. Categories used by the app:
+
+    api        - outgoing HTTP calls (recorded by kbc.transport)
+    render     - building a tab / section of the page
+    serialize  - handing data to a Streamlit element (st.json, st.dataframe, st.data_editor)
+
+Spans nest per thread. Spans on other threads belong to a rerun only when the work was handed over with
+`propagate(fn)` (e.g. API calls of a ThreadPoolExecutor started by the rerun); they appear as separate lanes in the
+trace. Spans of threads no rerun handed work to (background tasks, other sessions' pools) are not recorded, so one
+session's profile never shows another session's work.
+
+Profiles export to the Chrome trace event format (open in Perfetto, chrome://tracing or speedscope) and to folded
+stacks for flamegraph.pl. When no rerun is being profiled, span() costs one list check.
+"""
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional
+
+ENABLED = os.environ.get('KBC_PROFILE', '').lower() in ('1', 'true', 'yes')
+
+_local = threading.local()
+_active: List['RerunProfile'] = []
+_active_lock = threading.Lock()
+
+
+class Span(NamedTuple):
+    name: str
+    category: str
+    stack: tuple  # names of the enclosing spans, outermost first, including this one
+    thread: str
+    start: float  # seconds since the start of the rerun
+    duration: float
+    self_time: float  # duration minus the time of the nested spans on the same thread
+
+
+class RerunProfile:
+
+    def __init__(self, label: str):
+        self.label = label
+        self.started_at = time.time()
+        self._origin = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.spans: List[Span] = []
+        self.thread = threading.current_thread().name
+        self._lock = threading.Lock()
+
+    def _add(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    def totals(self) -> Dict[str, float]:
+        """Self time per category on the rerun thread; API time of other threads is reported as 'api (parallel)'."""
+        totals = defaultdict(float)
+        for span in self.spans:
+            category = span.category if span.thread == self.thread else f'{span.category} (parallel)'
+            totals[category] += span.self_time
+        return dict(totals)
+
+    def slowest(self, count: int = 5) -> List[Span]:
+        return sorted((s for s in self.spans if s.stack != (self.label,)), key=lambda s: s.self_time,
+                      reverse=True)[:count]
+
+    def trace_events(self, thread_ids: Dict[str, int], pid: int = 1) -> List[dict]:
+        offset_us = self.started_at * 1e6
+        return [{"name": span.name, "cat": span.category, "ph": "X", "pid": pid,
+                 "tid": thread_ids.setdefault(span.thread, len(thread_ids) + 1),
+                 "ts": round(offset_us + span.start * 1e6), "dur": round(span.duration * 1e6),
+                 "args": {"rerun": self.label}}
+                for span in self.spans]
+
+    def folded(self) -> List[str]:
+        """Folded stacks ('rerun;tab;GET ... <microseconds>') of the self time of every span."""
+        lines = defaultdict(int)
+        for span in self.spans:
+            stack = span.stack if span.thread == self.thread else (self.label, f'[{span.thread}]') + span.stack
+            lines[';'.join(name.replace(';', ',') for name in stack)] += round(span.self_time * 1e6)
+        return [f'{stack} {us}' for stack, us in lines.items() if us > 0]
+
+
+def _stack() -> list:
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+def _current_profile() -> Optional[RerunProfile]:
+    return getattr(_local, 'profile', None)
+
+
+def propagate(fn: Callable) -> Callable:
+    """Wraps fn so its spans are recorded in the profile of the calling rerun, on whatever thread it runs."""
+    profile = _current_profile()
+    if profile is None:
+        return fn
+
+    def wrapper(*args, **kwargs):
+        previous = getattr(_local, 'profile', None)
+        _local.profile = profile
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.profile = previous
+    return wrapper
+
+
+@contextmanager
+def span(name: str, category: str = 'other'):
+    if not _active:
+        yield
+        return
+    profile = _current_profile()
+    stack = _stack()
+    frame = [name, 0.0]  # name, time of nested spans
+    stack.append(frame)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - started
+        stack.pop()
+        if stack:
+            stack[-1][1] += duration
+        if profile is not None:
+            profile._add(Span(name, category, tuple(f[0] for f in stack) + (name,), threading.current_thread().name,
+                              started - profile._origin, duration, max(duration - frame[1], 0.0)))
+
+
+@contextmanager
+def rerun(label: str, enabled: bool = ENABLED):
+    """Profiles the enclosed block as one rerun; yields the RerunProfile, or None when disabled."""
+    if not enabled:
+        yield None
+        return
+    profile = RerunProfile(label)
+    _local.profile = profile
+    with _active_lock:
+        _active.append(profile)
+    try:
+        with span(label, 'other'):
+            yield profile
+    finally:
+        profile.duration = time.perf_counter() - profile._origin
+        with _active_lock:
+            _active.remove(profile)
+        _local.profile = None
+
+
+def chrome_trace(profiles: Iterable[RerunProfile]) -> dict:
+    events, thread_ids = [], {}
+    for profile in profiles:
+        events.extend(profile.trace_events(thread_ids))
+    events.extend({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": name}}
+                  for name, tid in thread_ids.items())
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+def folded(profiles: Iterable[RerunProfile]) -> str:
+    return '\n'.join(line for profile in profiles for line in profile.folded()) + '\n'
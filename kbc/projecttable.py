@@ -0,0 +1,103 @@
+"""
+Columnar project table for organizations with thousands of projects.
+
+The projects of an organization are kept as numpy columns; filtering by name, type and ID range is a vectorized mask,
+and only the current page is ever turned into rows for the browser. The selection is stored as "everything matching
+a filter" plus explicit inclusions and exclusions, so selecting all 5000 matching projects does not materialize 5000
+checkbox values anywhere.
+"""
+from typing import Iterable, List, NamedTuple, Optional, Sequence, Set
+
+import numpy as np
+
+
+class ProjectFilter(NamedTuple):
+    name: str = ''
+    types: tuple = ()
+    id_min: Optional[int] = None
+    id_max: Optional[int] = None
+
+
+class ProjectTable:
+
+    def __init__(self, projects: Sequence[dict]):
+        self.projects = list(projects)
+        self.ids = np.array([int(p.get('id') or 0) for p in self.projects], dtype=np.int64)
+        self.names = np.array([p.get('name') or '' for p in self.projects], dtype=str)
+        self._lower_names = np.char.lower(self.names)
+        self.types = np.array([p.get('type') or '' for p in self.projects], dtype=str)
+
+    def __len__(self):
+        return len(self.projects)
+
+    @property
+    def available_types(self) -> List[str]:
+        return sorted(set(self.types.tolist()) - {''})
+
+    def matching(self, project_filter: Optional[ProjectFilter]) -> np.ndarray:
+        """Boolean mask of the projects matching the filter; None matches nothing."""
+        if project_filter is None:
+            return np.zeros(len(self), dtype=bool)
+        mask = np.ones(len(self), dtype=bool)
+        if project_filter.name:
+            mask &= np.char.find(self._lower_names, project_filter.name.lower()) >= 0
+        if project_filter.types:
+            mask &= np.isin(self.types, list(project_filter.types))
+        if project_filter.id_min is not None:
+            mask &= self.ids >= project_filter.id_min
+        if project_filter.id_max is not None:
+            mask &= self.ids <= project_filter.id_max
+        return mask
+
+    def id_mask(self, project_ids: Iterable) -> np.ndarray:
+        return np.isin(self.ids, np.fromiter((int(i) for i in project_ids), dtype=np.int64))
+
+    def page(self, mask: np.ndarray, page: int, page_size: int) -> np.ndarray:
+        """Row positions of the requested page (0-based) among the rows of the mask."""
+        positions = np.flatnonzero(mask)
+        return positions[page * page_size:(page + 1) * page_size]
+
+    def select(self, mask: np.ndarray) -> List[dict]:
+        return [self.projects[i] for i in np.flatnonzero(mask)]
+
+
+class ProjectSelection:
+    """
+    Selected projects: everything matching `matching_filter`, minus `excluded`, plus `included`.
+    Starts with all projects selected.
+    """
+
+    def __init__(self):
+        self.matching_filter: Optional[ProjectFilter] = ProjectFilter()
+        self.included: Set[int] = set()
+        self.excluded: Set[int] = set()
+
+    def select_matching(self, project_filter: ProjectFilter):
+        self.matching_filter = project_filter
+        self.included.clear()
+        self.excluded.clear()
+
+    def clear(self):
+        self.matching_filter = None
+        self.included.clear()
+        self.excluded.clear()
+
+    def mask(self, table: ProjectTable) -> np.ndarray:
+        mask = table.matching(self.matching_filter)
+        if self.excluded:
+            mask &= ~table.id_mask(self.excluded)
+        if self.included:
+            mask |= table.id_mask(self.included)
+        return mask
+
+    def set(self, table: ProjectTable, project_id: int, selected: bool):
+        project_id = int(project_id)
+        by_filter = bool(table.matching(self.matching_filter)[table.ids == project_id].any())
+        if selected:
+            self.excluded.discard(project_id)
+            if not by_filter:
+                self.included.add(project_id)
+        else:
+            self.included.discard(project_id)
+            if by_filter:
+                self.excluded.add(project_id)
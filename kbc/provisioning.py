@@ -0,0 +1,131 @@
+"""
+Parallel project provisioning from a manifest.
+
+Manifest format (JSON):
+
+    {
+      "defaults": {"organization": 123, "type": "poc6months", "defaultBackend": "snowflake",
+                   "users": ["support@keboola.com"], "tokens": [{"description": "workshop", "expires_in": 86400}]},
+      "projects": [
+        {"name": "Workshop 01", "users": ["attendee1@example.com"]},
+        {"name": "Workshop 02", "users": ["attendee2@example.com"], "tokens": []}
+      ]
+    }
+
+Project keys override the defaults. Projects are created concurrently and as soon as a project exists its user
+invitations and tokens are issued on the same worker pool, so no project waits for the others to be created.
+"""
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+import kbc.kbcapi_scripts
+
+MAX_WORKERS = 8
+
+
+def _error_message(error: Exception) -> str:
+    response = getattr(error, 'response', None)
+    if response is not None:
+        try:
+            return f'{response.status_code}: {response.json()}'
+        except ValueError:
+            return f'{response.status_code}: {response.text}'
+    return str(error)
+
+
+def load_specs(manifest: dict) -> List[dict]:
+    defaults = manifest.get('defaults', {})
+    specs = []
+    for project in manifest.get('projects', []):
+        spec = {**defaults, **project}
+        if not spec.get('name') or not spec.get('organization'):
+            raise ValueError(f'Each project needs a name and an organization: {project}')
+        specs.append(spec)
+    return specs
+
+
+def provision_projects(manage_token: str, manifest: dict, region: str = 'EU', max_workers: int = MAX_WORKERS,
+                       on_progress: Optional[Callable[[dict], None]] = None) -> Dict[str, list]:
+    """
+    Creates the projects of the manifest, invites their users and generates their tokens.
+
+    Args:
+        manage_token: Manage API token of the stack.
+        region: Key of kbc.kbcapi_scripts.URL_SUFFIXES or a kbc.stacks stack ID.
+        on_progress: Called with the result record of each project once all its steps are finished.
+
+    Returns:
+        Result manifest: {"projects": [{"name", "id", "status", "error", "users": {email: "invited" | error},
+        "tokens": [{"description", "id", "token"} | {"description", "error"}]}]}.
+        Status is "success", "partial" (project exists, some invite/token failed) or "error".
+    """
+    specs = load_specs(manifest)
+    results = [{"name": spec['name'], "id": None, "status": "pending", "error": None, "users": {}, "tokens": []}
+               for spec in specs]
+    outstanding = [0] * len(specs)
+
+    def _finish(index):
+        result = results[index]
+        if result['status'] == 'pending':
+            failed = any(v != 'invited' for v in result['users'].values()) or \
+                     any('error' in t for t in result['tokens'])
+            result['status'] = 'partial' if failed else 'success'
+        if on_progress:
+            on_progress(result)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {}
+        for index, spec in enumerate(specs):
+            future = executor.submit(kbc.kbcapi_scripts.create_new_project, manage_token, spec['name'],
+                                     spec['organization'], p_type=spec.get('type', 'poc6months'), region=region,
+                                     defaultBackend=spec.get('defaultBackend', 'snowflake'))
+            pending[future] = ('project', index, None)
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                step, index, detail = pending.pop(future)
+                result = results[index]
+                try:
+                    value = future.result()
+                except (requests.RequestException, ValueError) as error:
+                    value, message = None, _error_message(error)
+                else:
+                    message = None
+
+                if step == 'project':
+                    if message:
+                        result.update(status='error', error=message)
+                        _finish(index)
+                        continue
+                    result['id'] = value['id']
+                    spec = specs[index]
+                    for email in spec.get('users', []):
+                        pending[executor.submit(kbc.kbcapi_scripts.invite_user_to_project, manage_token,
+                                                value['id'], email, region)] = ('user', index, email)
+                    for token_spec in spec.get('tokens', []):
+                        pending[executor.submit(kbc.kbcapi_scripts.generate_token,
+                                                token_spec.get('description', spec['name']), manage_token,
+                                                value['id'], region,
+                                                expires_in=token_spec.get('expires_in', 1800),
+                                                manage_tokens=token_spec.get('manage_tokens', False))] = \
+                            ('token', index, token_spec)
+                    outstanding[index] = len(spec.get('users', [])) + len(spec.get('tokens', []))
+                elif step == 'user':
+                    result['users'][detail] = message or 'invited'
+                    outstanding[index] -= 1
+                else:
+                    description = detail.get('description', result['name'])
+                    if message:
+                        result['tokens'].append({"description": description, "error": message})
+                    else:
+                        result['tokens'].append({"description": description, "id": value.get('id'),
+                                                 "token": value.get('token')})
+                    outstanding[index] -= 1
+
+                if outstanding[index] == 0:
+                    _finish(index)
+
+    return {"projects": results}
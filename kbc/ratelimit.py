@@ -0,0 +1,126 @@
+"""
+Process-wide request rate limiting, keyed by API host and token.
+
+All Streamlit sessions and background tasks of one server process share the buckets below, so two bulk operations
+against the same stack with the same token draw from one budget instead of tripping the Manage API throttling.
+
+Budgets are configurable via the KBC_RATE_LIMITS environment variable (JSON), keyed by host or "*":
+
+    KBC_RATE_LIMITS='{"*": {"rate": 10, "burst": 20}, "connection.keboola.com": {"rate": 5}}'
+"""
+import email.utils
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+DEFAULT_BUDGET = {"rate": 10.0, "burst": 20.0}
+
+# after a 429 the refill rate is halved, down to this fraction of the budget
+MIN_RATE_FACTOR = 0.1
+# every successful call gives back this fraction of the budget (additive increase)
+RECOVERY_FACTOR = 0.02
+MAX_RETRY_AFTER = 120.0
+
+
+def _load_budgets() -> Dict[str, dict]:
+    budgets = {"*": dict(DEFAULT_BUDGET)}
+    raw = os.environ.get('KBC_RATE_LIMITS')
+    if raw:
+        for host, budget in json.loads(raw).items():
+            budgets[host] = {**DEFAULT_BUDGET, **budgets.get(host, {}), **budget}
+    return budgets
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After is either delta-seconds or an HTTP date."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(retry_at.timestamp() - time.time(), 0.0)
+
+
+class TokenBucket:
+    """
+    Token bucket with AIMD rate adaption: 429 responses halve the refill rate and block the bucket for the
+    Retry-After period, successful responses slowly restore the configured rate.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.base_rate = float(rate)
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.blocked_until = 0.0
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """Blocks until a request may be sent."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.blocked_until:
+                    wait = self.blocked_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                else:
+                    wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.base_rate, self.rate + self.base_rate * RECOVERY_FACTOR)
+
+    def on_throttled(self, retry_after: Optional[float] = None):
+        with self._lock:
+            now = time.monotonic()
+            self.rate = max(self.base_rate * MIN_RATE_FACTOR, self.rate / 2)
+            self.tokens = 0.0
+            self.updated = now
+            if retry_after is not None:
+                self.blocked_until = max(self.blocked_until, now + min(retry_after, MAX_RETRY_AFTER))
+
+
+class RateLimiter:
+
+    def __init__(self, budgets: Optional[Dict[str, dict]] = None):
+        self.budgets = budgets if budgets is not None else _load_budgets()
+        self._buckets: Dict[Tuple[str, str], TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, host: str, rate: float, burst: Optional[float] = None):
+        """Set the budget of a host ("*" for the default). Applies to buckets created afterwards."""
+        self.budgets[host] = {"rate": rate, "burst": burst if burst is not None else rate * 2}
+
+    def bucket_for(self, url: str, token: Optional[str]) -> TokenBucket:
+        host = urlparse(url).hostname or ''
+        token_key = hashlib.sha256(token.encode()).hexdigest()[:16] if token else ''
+        key = (host, token_key)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                budget = self.budgets.get(host) or self.budgets['*']
+                bucket = TokenBucket(budget['rate'], budget['burst'])
+                self._buckets[key] = bucket
+            return bucket
+
+
+limiter = RateLimiter()
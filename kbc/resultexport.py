@@ -0,0 +1,175 @@
+"""
+Incremental export of bulk operation outcomes.
+
+A ResultWriter appends each outcome record to a file in EXPORT_DIR the moment it is known: CSV is flushed record by
+record, so the file is complete up to the last finished item at any time; Parquet is written in row groups of
+ROW_GROUP records and becomes readable when the writer is closed. Nested values (dicts, lists) are stored as JSON
+text, and all columns are strings so records with differing value types share one schema.
+
+    with ResultWriter('feature-change', ('project', 'status', 'message')) as writer:
+        for outcome in outcomes:
+            writer.write(outcome)
+
+append_record adds one record to a CSV export without keeping the file open, for logs that grow across script
+runs. without_credentials drops secret fields (OAuth app secrets, passwords, tokens) from API responses that are
+exported as they came. csv_to_parquet converts a finished or still growing CSV export batch by batch, e.g. for a download button.
+
+Exports not written to for RETENTION_DAYS (KBC_EXPORT_RETENTION_DAYS, default 7) are deleted when new exports are
+created, at most once per PRUNE_INTERVAL.
+"""
+import csv
+import datetime
+import io
+import json
+import os
+import re
+import threading
+import time
+from typing import Iterable, Optional, Sequence
+
+import pyarrow as pa
+import pyarrow.csv
+import pyarrow.parquet
+
+import kbc.kbcapi_scripts
+
+EXPORT_DIR = os.path.join(kbc.kbcapi_scripts.PAR_WORKDIRPATH, 'data', 'bulk-results')
+FORMATS = ('csv', 'parquet')
+ROW_GROUP = 1000
+RETENTION_DAYS = float(os.environ.get('KBC_EXPORT_RETENTION_DAYS', '7'))
+PRUNE_INTERVAL = 3600
+
+CREDENTIAL_FIELDS = re.compile(r'secret|password|token', re.IGNORECASE)
+
+_append_lock = threading.Lock()
+_pruned_at: dict = {}  # directory -> time of the last prune
+
+
+def _cell(value) -> str:
+    if value is None:
+        return ''
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return str(value)
+
+
+def without_credentials(value):
+    """Copy of a decoded JSON value without the dict keys matching CREDENTIAL_FIELDS, at any depth."""
+    if isinstance(value, dict):
+        return {k: without_credentials(v) for k, v in value.items() if not CREDENTIAL_FIELDS.search(str(k))}
+    if isinstance(value, list):
+        return [without_credentials(item) for item in value]
+    return value
+
+
+def _file_name(name: str, format: str) -> str:
+    slug = re.sub(r'[^A-Za-z0-9_.-]+', '-', name).strip('-') or 'results'
+    return f"{slug}-{datetime.datetime.now().strftime('%Y%m%d-%H%M%S-%f')}.{format}"
+
+
+def prune(directory: str = EXPORT_DIR, max_age: float = RETENTION_DAYS * 86400) -> int:
+    """Deletes export files not modified for `max_age` seconds; returns how many were deleted."""
+    _pruned_at[directory] = time.time()
+    removed = 0
+    cutoff = time.time() - max_age
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            try:
+                if entry.is_file() and entry.name.endswith(FORMATS) and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+    return removed
+
+
+def export_path(name: str, format: str = 'csv', directory: str = EXPORT_DIR) -> str:
+    """Path of a new export file; creates the directory and prunes old exports."""
+    if format not in FORMATS:
+        raise ValueError(f'Unsupported export format {format}, use one of {FORMATS}')
+    os.makedirs(directory, exist_ok=True)
+    if time.time() - _pruned_at.get(directory, 0) > PRUNE_INTERVAL:
+        prune(directory)
+    return os.path.join(directory, _file_name(name, format))
+
+
+def append_record(path: str, fields: Sequence[str], record: dict):
+    """Appends one record to a CSV export (writing the header first if the file is new); the file is closed again."""
+    with _append_lock, open(path, 'a', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        if f.tell() == 0:
+            writer.writerow(fields)
+        writer.writerow([_cell(record.get(field)) for field in fields])
+
+
+class ResultWriter:
+    """Thread-safe; records may be written from the worker threads of the operation."""
+
+    def __init__(self, name: str, fields: Sequence[str], format: str = 'csv', directory: str = EXPORT_DIR):
+        self.path = export_path(name, format, directory)
+        self.fields = list(fields)
+        self.format = format
+        self.count = 0
+        self._lock = threading.Lock()
+        self._schema = pa.schema([(field, pa.string()) for field in self.fields])
+        self._buffer = []
+        if format == 'csv':
+            self._file = open(self.path, 'w', newline='', encoding='utf-8')
+            self._csv = csv.writer(self._file)
+            self._csv.writerow(self.fields)
+            self._file.flush()
+        else:
+            self._parquet = pa.parquet.ParquetWriter(self.path, self._schema)
+
+    def write(self, record: dict):
+        row = [_cell(record.get(field)) for field in self.fields]
+        with self._lock:
+            self.count += 1
+            if self.format == 'csv':
+                self._csv.writerow(row)
+                self._file.flush()
+            else:
+                self._buffer.append(row)
+                if len(self._buffer) >= ROW_GROUP:
+                    self._flush_row_group()
+
+    def write_many(self, records: Iterable[dict]):
+        for record in records:
+            self.write(record)
+
+    def _flush_row_group(self):
+        if self._buffer:
+            columns = list(zip(*self._buffer))
+            self._parquet.write_table(pa.table([pa.array(c, pa.string()) for c in columns], schema=self._schema))
+            self._buffer = []
+
+    def close(self):
+        with self._lock:
+            if self.format == 'csv':
+                self._file.close()
+            else:
+                self._flush_row_group()
+                self._parquet.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def csv_to_parquet(csv_path: str, parquet_path: Optional[str] = None) -> bytes:
+    """
+    Converts a CSV export to Parquet without loading it whole; all columns are read as strings.
+    Returns the Parquet bytes, or writes them to `parquet_path` and returns b''.
+    """
+    with open(csv_path, 'rb') as f:
+        header = next(csv.reader(io.TextIOWrapper(f, encoding='utf-8', newline='')), [])
+    convert = pa.csv.ConvertOptions(column_types={field: pa.string() for field in header},
+                                    strings_can_be_null=False)
+    reader = pa.csv.open_csv(csv_path, convert_options=convert)
+    sink = parquet_path or pa.BufferOutputStream()
+    with pa.parquet.ParquetWriter(sink, reader.schema) as writer:
+        for batch in reader:
+            writer.write_batch(batch)
+    return b'' if parquet_path else sink.getvalue().to_pybytes()
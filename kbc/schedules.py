@@ -0,0 +1,231 @@
+"""
+Cron load analysis over all schedules returned by get_schedules.
+
+Schedules are loaded into a pandas frame (one row per schedule). Every distinct (cron expression, timezone) pair is
+compiled once into boolean masks over minute/hour/day/month/weekday and expanded over the whole time window with
+numpy broadcasting, so tens of thousands of schedules cost about as much as their distinct expressions. The result
+is a per-minute trigger histogram that can be broken down by stack, project or component.
+"""
+import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import requests
+
+import kbc.kbcapi_scripts
+import kbc.tokenbroker
+
+# (name, lowest, highest) of the five cron fields
+CRON_FIELDS = (('minute', 0, 59), ('hour', 0, 23), ('day', 1, 31), ('month', 1, 12), ('weekday', 0, 6))
+_NAMES = {
+    'month': {name: i + 1 for i, name in enumerate(
+        ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'])},
+    'weekday': {name: i for i, name in enumerate(['sun', 'mon', 'tue', 'wed', 'thu', 'fri', 'sat'])},
+}
+_MACROS = {'@yearly': '0 0 1 1 *', '@annually': '0 0 1 1 *', '@monthly': '0 0 1 * *', '@weekly': '0 0 * * 0',
+           '@daily': '0 0 * * *', '@midnight': '0 0 * * *', '@hourly': '0 * * * *'}
+
+
+def _parse_value(value: str, field: str) -> Optional[int]:
+    return _NAMES.get(field, {}).get(value.lower(), None) if not value.isdigit() else int(value)
+
+
+def _parse_field(expression: str, field: str, low: int, high: int) -> np.ndarray:
+    mask = np.zeros(high + 1, dtype=bool)
+    for part in expression.split(','):
+        value_range, _, step = part.partition('/')
+        step = int(step) if step else 1
+        if value_range == '*':
+            start, end = low, high
+        elif '-' in value_range:
+            start, end = (_parse_value(v, field) for v in value_range.split('-', 1))
+        else:
+            start = _parse_value(value_range, field)
+            end = high if step > 1 else start
+        if start is None or end is None or step < 1:
+            raise ValueError(f'Invalid {field} field: {expression}')
+        if field == 'weekday':
+            # 7 is an alias of Sunday
+            for value in range(start, end + 1, step):
+                mask[value % 7] = True
+            continue
+        if not low <= start <= end <= high:
+            raise ValueError(f'{field} out of range: {expression}')
+        mask[start:end + 1:step] = True
+    return mask[low:] if field != 'weekday' else mask[:7]
+
+
+def parse_cron(expression: str) -> Tuple[Dict[str, np.ndarray], bool, bool]:
+    """
+    Compiles a 5-field cron expression.
+
+    Returns:
+        (masks per field, day restricted, weekday restricted). When both day and weekday are restricted, cron
+        fires if either matches. As in Vixie cron / cronie, a day or weekday field starting with '*' (also a step
+        like */2) is not restricted, so '0 0 */2 * 1' fires on odd days that are Mondays, not on either.
+    """
+    expression = _MACROS.get(expression.strip().lower(), expression.strip())
+    fields = expression.split()
+    if len(fields) != 5:
+        raise ValueError(f'Expected 5 cron fields: {expression}')
+    masks = {name: _parse_field(value, name, low, high)
+             for value, (name, low, high) in zip(fields, CRON_FIELDS)}
+    return masks, not fields[2].startswith('*'), not fields[4].startswith('*')
+
+
+def schedules_frame(schedules: Iterable[dict], stack: str = '', project_id: Optional[str] = None) -> pd.DataFrame:
+    """One row per schedule as returned by get_schedules."""
+    rows = []
+    for schedule in schedules:
+        cron = schedule.get('schedule') or {}
+        target = schedule.get('target') or {}
+        rows.append({
+            "stack": stack,
+            "project_id": str(schedule.get('projectId') or project_id or ''),
+            "schedule_id": str(schedule.get('id', '')),
+            "component_id": target.get('componentId', ''),
+            "config_id": str(target.get('configurationId', '')),
+            "cron": cron.get('cronTab', ''),
+            "timezone": cron.get('timezone') or 'UTC',
+            "enabled": cron.get('state', 'enabled') == 'enabled',
+        })
+    return pd.DataFrame(rows, columns=["stack", "project_id", "schedule_id", "component_id", "config_id", "cron",
+                                       "timezone", "enabled"])
+
+
+def load_schedules(region_tokens: Iterable[Tuple[str, str, str]],
+                   max_workers: int = 8) -> Tuple[pd.DataFrame, Dict[str, str]]:
+    """
+    Loads the schedules of many projects concurrently.
+
+    Args:
+        region_tokens: (region, project_id, storage token) triples; region is a key of URL_SUFFIXES.
+
+    Returns:
+        (schedules frame, {project_id: error}) - projects that failed are left out of the frame.
+    """
+    frames, errors = [], {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(kbc.kbcapi_scripts.get_schedules, region, token): (region, str(project_id))
+                   for region, project_id, token in region_tokens}
+        for future in as_completed(futures):
+            region, project_id = futures[future]
+            try:
+                stack = kbc.kbcapi_scripts.URL_SUFFIXES[region].lstrip('.')
+                frames.append(schedules_frame(future.result(), stack=stack, project_id=project_id))
+            except (requests.RequestException, ValueError) as error:
+                errors[project_id] = str(error)
+    return (pd.concat(frames, ignore_index=True) if frames else schedules_frame([])), errors
+
+
+def load_organization_schedules(manage_token: str, region: str, project_ids: Iterable,
+                                max_workers: int = 8) -> Tuple[pd.DataFrame, Dict[str, str]]:
+    """
+    Loads the schedules of the projects using short-lived read-only storage tokens from the token broker, so
+    repeated analyses of the same organization do not mint new tokens.
+
+    Returns:
+        (schedules frame, {project_id: error}) - projects that failed are left out of the frame.
+    """
+    tokens, token_errors = kbc.tokenbroker.broker.tokens_for(manage_token, region, project_ids,
+                                                             permissions=kbc.tokenbroker.READ_ONLY,
+                                                             max_workers=max_workers)
+    errors = {project_id: f"No storage token: {error}" for project_id, error in token_errors.items()}
+    stack = kbc.kbcapi_scripts.URL_SUFFIXES[region].lstrip('.')
+    frames = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(kbc.kbcapi_scripts.get_schedules, region, token): project_id
+                   for project_id, token in tokens.items()}
+        for future in as_completed(futures):
+            try:
+                frames.append(schedules_frame(future.result(), stack=stack, project_id=futures[future]))
+            except (requests.RequestException, ValueError) as error:
+                errors[futures[future]] = str(error)
+    return (pd.concat(frames, ignore_index=True) if frames else schedules_frame([])), errors
+
+
+def _window(start: datetime.datetime, end: datetime.datetime) -> pd.DatetimeIndex:
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    start = start.tz_localize('UTC') if start.tzinfo is None else start.tz_convert('UTC')
+    end = end.tz_localize('UTC') if end.tzinfo is None else end.tz_convert('UTC')
+    return pd.date_range(start.ceil('min'), end, freq='min', inclusive='left')
+
+
+def trigger_matrix(crons: List[Tuple[str, str]], minutes: pd.DatetimeIndex) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Boolean (len(crons) x len(minutes)) matrix: does cron i fire at minute j.
+
+    Returns:
+        (matrix, valid) where valid marks expressions that could be parsed; invalid rows are all False.
+    """
+    matrix = np.zeros((len(crons), len(minutes)), dtype=bool)
+    valid = np.ones(len(crons), dtype=bool)
+    local_parts = {}
+    for i, (expression, timezone) in enumerate(crons):
+        try:
+            masks, day_restricted, weekday_restricted = parse_cron(expression)
+            if timezone not in local_parts:
+                local = minutes.tz_convert(timezone)
+                local_parts[timezone] = (local.minute.values, local.hour.values, local.day.values - 1,
+                                         local.month.values - 1, (local.dayofweek.values + 1) % 7)
+        except (ValueError, KeyError, TypeError):
+            valid[i] = False
+            continue
+        minute, hour, day, month, weekday = local_parts[timezone]
+        day_match = masks['day'][day]
+        weekday_match = masks['weekday'][weekday]
+        if day_restricted and weekday_restricted:
+            day_match = day_match | weekday_match
+        else:
+            day_match = day_match & weekday_match
+        matrix[i] = masks['minute'][minute] & masks['hour'][hour] & masks['month'][month] & day_match
+    return matrix, valid
+
+
+def trigger_histogram(frame: pd.DataFrame, start: datetime.datetime, end: datetime.datetime,
+                      by: Optional[str] = None, include_disabled: bool = False) -> pd.DataFrame:
+    """
+    Number of triggered schedules per minute of the window [start, end).
+
+    Args:
+        by: Optional breakdown column ('stack', 'project_id', 'component_id').
+
+    Returns:
+        Without `by`: frame indexed by minute (UTC) with a 'triggers' column, one row per minute of the window.
+        With `by`: long frame with columns minute, <by>, triggers; minutes without triggers are omitted.
+    """
+    if not include_disabled:
+        frame = frame[frame['enabled']]
+    minutes = _window(start, end)
+    group_columns = ['cron', 'timezone'] + ([by] if by else [])
+    counts = frame.groupby(group_columns, sort=False).size().rename('count').reset_index()
+
+    crons = counts[['cron', 'timezone']].drop_duplicates().reset_index(drop=True)
+    matrix, valid = trigger_matrix(list(crons.itertuples(index=False, name=None)), minutes)
+    counts = counts.merge(crons.reset_index().rename(columns={'index': 'cron_index'}), on=['cron', 'timezone'])
+
+    if not by:
+        weights = np.zeros(len(crons))
+        np.add.at(weights, counts['cron_index'].to_numpy(), counts['count'].to_numpy())
+        return pd.DataFrame({'triggers': (weights @ matrix).astype(int)}, index=pd.Index(minutes, name='minute'))
+
+    cron_index, minute_index = np.nonzero(matrix)
+    fired = pd.DataFrame({'cron_index': cron_index, 'minute': minutes[minute_index]})
+    long = fired.merge(counts[['cron_index', by, 'count']], on='cron_index')
+    return (long.groupby(['minute', by], sort=True)['count'].sum().rename('triggers').reset_index())
+
+
+def invalid_schedules(frame: pd.DataFrame) -> pd.DataFrame:
+    """Schedules whose cron expression or timezone cannot be evaluated (excluded from the histograms)."""
+    crons = frame[['cron', 'timezone']].drop_duplicates()
+    _, valid = trigger_matrix(list(crons.itertuples(index=False, name=None)), _window(
+        datetime.datetime(2000, 1, 1), datetime.datetime(2000, 1, 1, 0, 1)))
+    bad = crons[~valid]
+    return frame.merge(bad, on=['cron', 'timezone'])
+
+
+def peak_minutes(histogram: pd.DataFrame, top: int = 20) -> pd.DataFrame:
+    """Busiest minutes of a histogram returned by trigger_histogram (without `by`)."""
+    return histogram.sort_values('triggers', ascending=False).head(top)
@@ -0,0 +1,39 @@
+"""
+Registry of the Keboola stacks the tools work with.
+"""
+from typing import Dict, List, Optional
+
+# order is the order of the selectors; the standalone tools open on the first entry (AWS us-east-1)
+STACKS = {
+    "keboola.com": {"label": "AWS us-east-1", "multitenant": True},
+    "eu-central-1.keboola.com": {"label": "AWS eu-central-1", "multitenant": True},
+    "north-europe.azure.keboola.com": {"label": "Azure North Europe", "multitenant": True},
+    "us-east4.gcp.keboola.com": {"label": "GCP US East4", "multitenant": True},
+    "europe-west3.gcp.keboola.com": {"label": "GCP Europe West3", "multitenant": True},
+    "europe-west2.gcp.keboola.com": {"label": "GCP Europe West2", "multitenant": False},
+}
+# the tabs of streamlit_app.py open on this stack instead
+APP_DEFAULT_STACK = "eu-central-1.keboola.com"
+
+# services hosted per stack as <service>.<stack>
+SERVICES = ('connection', 'oauth', 'syrup', 'scheduler', 'encryption', 'queue')
+
+
+def stack_ids(multitenant_only: bool = False) -> List[str]:
+    return [stack for stack, meta in STACKS.items() if meta['multitenant'] or not multitenant_only]
+
+
+def labels(multitenant_only: bool = False) -> Dict[str, str]:
+    """stack -> human readable label, e.g. for selectbox format_func."""
+    return {stack: STACKS[stack]['label'] for stack in stack_ids(multitenant_only)}
+
+
+def stack_of(host: str) -> Optional[str]:
+    """
+    Stack a service host belongs to, e.g. 'oauth.eu-central-1.keboola.com' -> 'eu-central-1.keboola.com'.
+    Returns None for hosts that are not stack services (developer portal, custom stacks, ...).
+    """
+    service, _, stack = (host or '').partition('.')
+    if service in SERVICES and stack in STACKS:
+        return stack
+    return None
@@ -0,0 +1,185 @@
+"""
+Size-aware migration of the whole Storage of a project.
+
+All buckets and tables of the source project are listed with their rowsCount / dataSizeBytes and the tables are
+transferred largest-first on a worker pool (longest-processing-time scheduling): the big tables start immediately and
+the small ones fill the gaps at the end, so the total time stays close to the time of the largest table instead of
+depending on the order in which the buckets happen to be listed.
+
+The plan carries a projected duration based on the throughput measured by earlier migrations between the same two
+stacks (kept in THROUGHPUT_FILE); the actual throughput of each run is reported and folded back into the estimate.
+"""
+import heapq
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, List, Optional
+
+import requests
+from kbcstorage.buckets import Buckets
+
+import kbc.kbcapi_scripts
+
+MAX_WORKERS = 4
+# bytes per second of one transfer, used until a stack pair has been measured
+DEFAULT_THROUGHPUT = 10 * 1024 * 1024
+# weight of the latest run in the stored estimate
+SMOOTHING = 0.5
+THROUGHPUT_FILE = os.path.join(kbc.kbcapi_scripts.PAR_WORKDIRPATH, 'data', 'storage-throughput.json')
+
+_throughput_lock = threading.Lock()
+
+
+def _stack_pair(region_from: str, region_to: str) -> str:
+    return f"{kbc.kbcapi_scripts.URL_SUFFIXES[region_from].lstrip('.')} -> " \
+           f"{kbc.kbcapi_scripts.URL_SUFFIXES[region_to].lstrip('.')}"
+
+
+def _load_throughputs() -> Dict[str, float]:
+    if not os.path.exists(THROUGHPUT_FILE):
+        return {}
+    with open(THROUGHPUT_FILE) as f:
+        return json.load(f)
+
+
+def estimated_throughput(region_from: str, region_to: str) -> float:
+    """Bytes per second of a single table transfer between the two stacks."""
+    return _load_throughputs().get(_stack_pair(region_from, region_to), DEFAULT_THROUGHPUT)
+
+
+def _record_throughput(pair: str, measured: float):
+    with _throughput_lock:
+        throughputs = _load_throughputs()
+        previous = throughputs.get(pair)
+        throughputs[pair] = measured if previous is None else SMOOTHING * measured + (1 - SMOOTHING) * previous
+        os.makedirs(os.path.dirname(THROUGHPUT_FILE), exist_ok=True)
+        with open(THROUGHPUT_FILE + '.tmp', 'w') as f:
+            json.dump(throughputs, f, indent=2)
+        os.replace(THROUGHPUT_FILE + '.tmp', THROUGHPUT_FILE)
+
+
+def projected_duration(sizes: List[int], workers: int, throughput: float) -> float:
+    """Makespan in seconds of transferring tables of the given sizes largest-first on `workers` workers."""
+    finish_times = [0.0] * max(workers, 1)
+    for size in sorted(sizes, reverse=True):
+        earliest = heapq.heappop(finish_times)
+        heapq.heappush(finish_times, earliest + size / throughput)
+    return max(finish_times)
+
+
+def plan_project_migration(from_token: str, to_token: str, region_from: str = 'EU', region_to: str = 'EU',
+                           max_workers: int = MAX_WORKERS) -> dict:
+    """
+    Lists the storage of both projects and orders the tables to transfer.
+
+    Returns:
+        {"stack_pair", "workers", "tables": [{"table_id", "bucket_id", "rows", "bytes", "table"}] (largest first),
+        "skipped": [table ids already present in the destination], "missing_buckets": [bucket ids],
+        "source_buckets": {bucket id: source bucket detail} of the missing buckets, "total_bytes", "throughput",
+        "projected_seconds"}
+    """
+    from_buckets = Buckets('https://connection' + kbc.kbcapi_scripts.URL_SUFFIXES[region_from], from_token)
+    to_buckets = Buckets('https://connection' + kbc.kbcapi_scripts.URL_SUFFIXES[region_to], to_token)
+
+    src_buckets = from_buckets.list()
+    dst_bucket_ids = {b['id'] for b in to_buckets.list()}
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        src_tables = list(executor.map(lambda b: from_buckets.list_tables(b['id']), src_buckets))
+        dst_tables = set()
+        for tables in executor.map(to_buckets.list_tables, [b['id'] for b in src_buckets if b['id'] in dst_bucket_ids]):
+            dst_tables.update(t['id'] for t in tables)
+
+    to_transfer, skipped = [], []
+    for bucket, tables in zip(src_buckets, src_tables):
+        for table in tables:
+            if table.get('isAlias'):
+                continue
+            if table['id'] in dst_tables:
+                skipped.append(table['id'])
+                continue
+            to_transfer.append({"table_id": table['id'], "bucket_id": bucket['id'],
+                                "rows": table.get('rowsCount') or 0, "bytes": table.get('dataSizeBytes') or 0,
+                                "table": table})
+    to_transfer.sort(key=lambda t: (t['bytes'], t['rows']), reverse=True)
+
+    missing_buckets = sorted({t['bucket_id'] for t in to_transfer} - dst_bucket_ids)
+    throughput = estimated_throughput(region_from, region_to)
+    return {
+        "stack_pair": _stack_pair(region_from, region_to),
+        "workers": max_workers,
+        "tables": to_transfer,
+        "skipped": skipped,
+        "missing_buckets": missing_buckets,
+        "source_buckets": {b['id']: b for b in src_buckets if b['id'] in missing_buckets},
+        "total_bytes": sum(t['bytes'] for t in to_transfer),
+        "throughput": throughput,
+        "projected_seconds": projected_duration([t['bytes'] for t in to_transfer], max_workers, throughput),
+    }
+
+
+def _create_bucket(buckets: Buckets, bucket_id: str, source: Optional[dict] = None):
+    # the copy keeps the source's backend and description
+    source = source or {}
+    stage, name = bucket_id.split('.', 1)
+    buckets.create(name.replace('c-', '', 1), stage, description=source.get('description') or '',
+                   backend=source.get('backend'))
+
+
+def run_project_migration(from_token: str, to_token: str, plan: dict, region_from: str = 'EU',
+                          region_to: str = 'EU', tmp_folder: Optional[str] = None,
+                          on_progress: Optional[Callable[[dict], None]] = None) -> dict:
+    """
+    Executes a plan from plan_project_migration: creates the missing buckets, then transfers the tables largest-first.
+
+    Returns:
+        The plan extended with "results" ([{"table_id", "bytes", "status", "seconds", "error"}]),
+        "actual_seconds" and "actual_throughput" (bytes per second of one transfer).
+    """
+    to_buckets = Buckets('https://connection' + kbc.kbcapi_scripts.URL_SUFFIXES[region_to], to_token)
+    for bucket_id in plan['missing_buckets']:
+        _create_bucket(to_buckets, bucket_id, plan.get('source_buckets', {}).get(bucket_id))
+
+    tmp_folder = tmp_folder or os.path.join(kbc.kbcapi_scripts.PAR_WORKDIRPATH, 'data')
+    results = []
+    started = time.monotonic()
+
+    def _transfer(item):
+        table_started = time.monotonic()
+        kbc.kbcapi_scripts.transfer_storage_table(from_token, to_token, item['table'], item['bucket_id'],
+                                                  region_from, region_to, tmp_folder)
+        return time.monotonic() - table_started
+
+    with ThreadPoolExecutor(max_workers=plan['workers']) as executor:
+        # the plan is sorted largest-first and the pool starts tasks in submission order
+        pending = {executor.submit(_transfer, item): item for item in plan['tables']}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = pending.pop(future)
+                result = {"table_id": item['table_id'], "bytes": item['bytes'], "status": "success",
+                          "seconds": None, "error": None}
+                try:
+                    result['seconds'] = round(future.result(), 1)
+                except (requests.RequestException, RuntimeError, OSError) as error:
+                    result.update(status='error', error=str(error))
+                results.append(result)
+                if on_progress:
+                    on_progress(result)
+
+    transferred = [r for r in results if r['status'] == 'success' and r['seconds']]
+    busy_seconds = sum(r['seconds'] for r in transferred)
+    actual_throughput = sum(r['bytes'] for r in transferred) / busy_seconds if busy_seconds else None
+    if actual_throughput:
+        _record_throughput(plan['stack_pair'], actual_throughput)
+    return {**plan, "results": results, "actual_seconds": round(time.monotonic() - started, 1),
+            "actual_throughput": actual_throughput}
+
+
+def migrate_project_storage(from_token: str, to_token: str, region_from: str = 'EU', region_to: str = 'EU',
+                            max_workers: int = MAX_WORKERS, on_progress: Optional[Callable[[dict], None]] = None):
+    plan = plan_project_migration(from_token, to_token, region_from, region_to, max_workers)
+    print(f"Transferring {len(plan['tables'])} tables ({plan['total_bytes'] / 1024 ** 3:.1f} GB) "
+          f"{plan['stack_pair']}, projected {plan['projected_seconds'] / 60:.0f} min")
+    return run_project_migration(from_token, to_token, plan, region_from, region_to, on_progress=on_progress)
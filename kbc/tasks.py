@@ -0,0 +1,167 @@
+"""
+Background execution of long-running operations.
+
+Streamlit reruns the whole script on every widget interaction, which interrupts (or repeats) loops that run inline
+in the script thread. Work submitted here runs on a process-wide thread pool instead. The returned TaskHandle is
+kept in st.session_state and polled by the UI for progress and partial results.
+
+Task functions must not call Streamlit themselves; they report their progress through the handle.
+"""
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import kbc.resultexport
+
+MAX_WORKERS = int(os.environ.get('KBC_TASK_WORKERS', '8'))
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='kbc-task')
+_tasks: Dict[str, 'TaskHandle'] = {}
+_tasks_lock = threading.Lock()
+
+
+class TaskCancelled(Exception):
+    pass
+
+
+class TaskHandle:
+    """
+    Shared state of one background task. Written by the worker thread, read by any number of script runs.
+    """
+
+    def __init__(self, name: str, total: Optional[int] = None):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.total = total
+        self.done = 0
+        self.status = 'pending'
+        self.result = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._results: List[Any] = []
+        # dict results are also appended to this file as they are reported (see submit's export_fields)
+        self.export: Optional[kbc.resultexport.ResultWriter] = None
+        self._lock = threading.Lock()
+        self._cancel_event = threading.Event()
+
+    # ---- worker side ----
+
+    def set_total(self, total: int):
+        with self._lock:
+            self.total = total
+
+    def report(self, item: Any = None, advance: int = 1):
+        """
+        Record one unit of progress, optionally with a partial result.
+        Raises TaskCancelled when the task was cancelled from the UI, so loops stop at the next item.
+        """
+        with self._lock:
+            if item is not None:
+                self._results.append(item)
+            self.done += advance
+        if self.export is not None and isinstance(item, dict):
+            self.export.write(item)
+        self.check_cancelled()
+
+    def check_cancelled(self):
+        if self._cancel_event.is_set():
+            raise TaskCancelled(f'Task {self.name} was cancelled.')
+
+    # ---- UI side ----
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def results(self, since: int = 0) -> List[Any]:
+        """Copy of the partial results reported so far, starting at index `since`."""
+        with self._lock:
+            return list(self._results[since:])
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel_event.is_set()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ('success', 'error', 'cancelled')
+
+    @property
+    def progress(self) -> Optional[float]:
+        if not self.total:
+            return None
+        return min(self.done / self.total, 1.0)
+
+    @property
+    def elapsed(self) -> float:
+        if not self.started_at:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    def __repr__(self):
+        return f'<TaskHandle {self.name} {self.status} {self.done}/{self.total}>'
+
+
+def _run(handle: TaskHandle, fn: Callable, args, kwargs):
+    handle.status = 'running'
+    handle.started_at = time.time()
+    try:
+        handle.result = fn(handle, *args, **kwargs)
+        handle.status = 'success'
+    except TaskCancelled:
+        handle.status = 'cancelled'
+    except Exception as e:
+        handle.error = str(e)
+        handle.status = 'error'
+    finally:
+        if handle.export is not None:
+            handle.export.close()
+        handle.finished_at = time.time()
+
+
+def submit(fn: Callable, *args, name: Optional[str] = None, total: Optional[int] = None,
+           export_fields: Optional[Sequence[str]] = None, **kwargs) -> TaskHandle:
+    """
+    Run `fn(handle, *args, **kwargs)` on the background pool.
+
+    Args:
+        fn: Task function, receives the TaskHandle as its first argument.
+        name: Human readable label, defaults to the function name.
+        total: Number of expected progress units, if known up front.
+        export_fields: Columns of a CSV export (kbc.resultexport) to which every reported dict result is appended.
+
+    Returns:
+        TaskHandle to be stored in session state and polled.
+    """
+    handle = TaskHandle(name or fn.__name__, total)
+    if export_fields:
+        handle.export = kbc.resultexport.ResultWriter(handle.name, export_fields)
+    with _tasks_lock:
+        _tasks[handle.id] = handle
+    _executor.submit(_run, handle, fn, args, kwargs)
+    return handle
+
+
+def get_task(task_id: str) -> Optional[TaskHandle]:
+    with _tasks_lock:
+        return _tasks.get(task_id)
+
+
+def list_tasks(include_finished: bool = True) -> List[TaskHandle]:
+    with _tasks_lock:
+        handles = list(_tasks.values())
+    if not include_finished:
+        handles = [h for h in handles if not h.finished]
+    return sorted(handles, key=lambda h: h.created_at)
+
+
+def forget_finished(max_age: float = 3600):
+    """Drop finished tasks older than `max_age` seconds from the registry."""
+    now = time.time()
+    with _tasks_lock:
+        for task_id in [t for t, h in _tasks.items() if h.finished and now - (h.finished_at or now) > max_age]:
+            del _tasks[task_id]
@@ -0,0 +1,118 @@
+"""
+Reuse of short-lived Storage tokens across operations that touch many projects.
+
+generate_token mints a new token on every call. The broker keeps the minted tokens per (stack, project, permission
+set, manage token) and hands out the same token until it is REFRESH_MARGIN seconds from expiry, so a sweep over an
+organization mints each project's token once instead of once per call. Tokens for many projects are minted
+concurrently by tokens_for; a project whose token cannot be minted is reported, not fatal to the sweep.
+
+Callers that only read (indexing, snapshots, schedule analysis) ask for READ_ONLY tokens.
+"""
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+
+import kbc.kbcapi_scripts
+
+EXPIRES_IN = 3600
+# a token is replaced when less than this many seconds of its lifetime are left
+REFRESH_MARGIN = 300
+MAX_WORKERS = 8
+DESCRIPTION = 'kbc-support-tooling'
+# generate_token defaults to write access to all buckets
+READ_ONLY = {"canManageBuckets": False, "bucketPermissions": {"*": "read"}}
+
+
+class CachedToken(NamedTuple):
+    id: str
+    token: str
+    expires_at: float
+
+
+def _permission_key(manage_tokens: bool, permissions: Optional[dict]) -> str:
+    return json.dumps({"manage_tokens": manage_tokens, **(permissions or {})}, sort_keys=True)
+
+
+class TokenBroker:
+
+    def __init__(self, expires_in: int = EXPIRES_IN, refresh_margin: int = REFRESH_MARGIN):
+        self.expires_in = expires_in
+        self.refresh_margin = refresh_margin
+        self._tokens: Dict[Tuple, CachedToken] = {}
+        self._locks: Dict[Tuple, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(manage_token: str, region: str, project_id, manage_tokens: bool, permissions: Optional[dict]) -> Tuple:
+        return (region, str(project_id), _permission_key(manage_tokens, permissions),
+                hashlib.sha256(manage_token.encode()).hexdigest()[:16])
+
+    def _lock_for(self, key: Tuple) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _valid(self, key: Tuple) -> Optional[CachedToken]:
+        cached = self._tokens.get(key)
+        if cached and cached.expires_at - self.refresh_margin > time.time():
+            return cached
+        return None
+
+    def token_for(self, manage_token: str, region: str, project_id, manage_tokens: bool = False,
+                  permissions: Optional[dict] = None) -> str:
+        """
+        Storage token of the project, minted with generate_token on the first call or when the cached one is about
+        to expire. Concurrent callers for the same key wait for a single mint.
+
+        Args:
+            permissions: Extra token attributes passed to generate_token, e.g. {"bucketPermissions": {"*": "read"}}.
+        """
+        key = self._key(manage_token, region, project_id, manage_tokens, permissions)
+        cached = self._valid(key)
+        if cached:
+            return cached.token
+        with self._lock_for(key):
+            cached = self._valid(key)
+            if cached:
+                return cached.token
+            requested_at = time.time()
+            created = kbc.kbcapi_scripts.generate_token(DESCRIPTION, manage_token, project_id, region,
+                                                        expires_in=self.expires_in, manage_tokens=manage_tokens,
+                                                        additional_params=permissions)
+            self._tokens[key] = CachedToken(str(created.get('id')), created['token'],
+                                            requested_at + self.expires_in)
+            return created['token']
+
+    def tokens_for(self, manage_token: str, region: str, project_ids: Iterable, manage_tokens: bool = False,
+                   permissions: Optional[dict] = None,
+                   max_workers: int = MAX_WORKERS) -> Tuple[Dict[str, str], Dict[str, Exception]]:
+        """
+        Tokens of many projects; the missing ones are minted concurrently.
+
+        Returns:
+            ({project_id: token}, {project_id: error}) - projects whose token could not be minted are in the second
+            dict only, so one deleted project or missing permission does not abort the whole sweep.
+        """
+        tokens, errors = {}, {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(self.token_for, manage_token, region, project_id, manage_tokens, permissions):
+                       project_id for project_id in dict.fromkeys(str(p) for p in project_ids)}
+            for future in as_completed(futures):
+                try:
+                    tokens[futures[future]] = future.result()
+                except Exception as error:
+                    errors[futures[future]] = error
+        return tokens, errors
+
+    def invalidate(self, manage_token: str, region: str, project_id, manage_tokens: bool = False,
+                   permissions: Optional[dict] = None):
+        """Drops a cached token, e.g. after the API rejected it (revoked or project deleted)."""
+        self._tokens.pop(self._key(manage_token, region, project_id, manage_tokens, permissions), None)
+
+    def clear(self):
+        self._tokens.clear()
+
+
+broker = TokenBroker()
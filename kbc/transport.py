@@ -0,0 +1,240 @@
+"""
+Single entry point for outgoing HTTP calls.
+
+Mirrors the requests module API (request/get/post/put/patch/delete) so callers only swap the module name, and
+routes every call through the shared rate limiter. 429 responses are retried after the Retry-After period.
+Idempotent calls (and calls made with retry=True) are also retried with backoff on 5xx responses and connection
+errors, like the RetryRequests session of kbcstorage's Endpoint.
+Calls to a stack whose circuit breaker is open fail fast with kbc.health.StackUnavailable.
+
+Identical concurrent GETs (same URL, params, headers and token) are coalesced: the first caller sends the request,
+the others wait for it and receive the same response. Several sessions opening the same stack at once therefore
+produce one upstream call instead of one per session.
+
+GETs of catalog endpoints listed in kbc.httpcache.POLICIES are served from the persistent cache while fresh, and
+revalidated in the background while stale. cache=False fetches from the API and refreshes the stored entry.
+"""
+import hashlib
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Hashable, Optional
+from urllib.parse import urlparse
+
+import requests
+
+from kbc import health, httpcache, profiler
+from kbc.ratelimit import limiter, parse_retry_after
+
+TOKEN_HEADERS = ('X-KBC-ManageApiToken', 'X-StorageApi-Token', 'Authorization')
+MAX_THROTTLE_RETRIES = 5
+MAX_SERVER_RETRIES = 4
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+# 501 Not Implemented will not change on a retry
+_RETRY_EXCLUDED_STATUSES = (501,)
+# responses that count against the stack's health; other errors come from a reachable stack (e.g. one broken config)
+HEALTH_FAILURE_STATUSES = (502, 503, 504)
+# (connect, read) timeout so a hanging host counts as a failure instead of blocking the caller forever
+DEFAULT_TIMEOUT = (10, 300)
+# numeric path segments are collapsed in profiler labels, so calls to the same endpoint aggregate
+_ID_SEGMENT = re.compile(r'/\d+(?=/|$)')
+
+
+def _token_from_headers(headers: Optional[dict]) -> Optional[str]:
+    if not headers:
+        return None
+    for name in TOKEN_HEADERS:
+        if headers.get(name):
+            return headers[name]
+    return None
+
+
+class _InFlight:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.response: Optional[requests.Response] = None
+        self.error: Optional[BaseException] = None
+
+
+_in_flight: dict = {}
+_in_flight_lock = threading.Lock()
+
+
+def _freeze(value) -> Hashable:
+    if isinstance(value, dict):
+        return tuple(sorted((str(k), _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value if isinstance(value, (str, int, float, bool, type(None))) else repr(value)
+
+
+def _coalescing_key(url: str, kwargs: dict) -> Optional[Hashable]:
+    if kwargs.get('stream') or set(kwargs) - {'params', 'headers', 'timeout'}:
+        return None
+    headers = dict(kwargs.get('headers') or {})
+    token = _token_from_headers(headers)
+    for name in TOKEN_HEADERS:
+        headers.pop(name, None)
+    token_hash = hashlib.sha256(token.encode()).hexdigest() if token else None
+    return url, _freeze(kwargs.get('params')), _freeze(headers), token_hash
+
+
+def _single_flight(key: Hashable, send) -> requests.Response:
+    with _in_flight_lock:
+        call = _in_flight.get(key)
+        leader = call is None
+        if leader:
+            call = _InFlight()
+            _in_flight[key] = call
+
+    if not leader:
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.response
+
+    try:
+        call.response = send()
+        return call.response
+    except BaseException as e:
+        call.error = e
+        raise
+    finally:
+        with _in_flight_lock:
+            _in_flight.pop(key, None)
+        call.done.set()
+
+
+_revalidation_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='kbc-cache-revalidate')
+
+
+def _fetch_into_cache(cache_key: str, entry: Optional[httpcache.CacheEntry], url: str,
+                      kwargs: dict) -> requests.Response:
+    if entry is not None:
+        kwargs = {**kwargs, 'headers': {**(kwargs.get('headers') or {}), **entry.conditional_headers()}}
+    response = _send('GET', url, **kwargs)
+    if response.status_code == 304 and entry is not None:
+        return httpcache.cache.touch(cache_key, entry).to_response()
+    if response.status_code == 200:
+        httpcache.cache.store(cache_key, response)
+    return response
+
+
+def _revalidate(key: Hashable, cache_key: str, entry: httpcache.CacheEntry, url: str, kwargs: dict):
+    try:
+        _single_flight(key, lambda: _fetch_into_cache(cache_key, entry, url, kwargs))
+    except requests.RequestException:
+        # keep serving the stale entry; the next caller after the stale window fetches synchronously
+        pass
+
+
+def _cached_get(policy: httpcache.CachePolicy, key: Hashable, url: str, kwargs: dict) -> requests.Response:
+    cache_key = httpcache.HttpCache.key_for(key)
+    entry = httpcache.cache.get(cache_key)
+    if entry is not None:
+        age = entry.age()
+        if age < policy.ttl:
+            return entry.to_response()
+        if age < policy.ttl + policy.stale:
+            _revalidation_executor.submit(_revalidate, key, cache_key, entry, url, kwargs)
+            return entry.to_response()
+    return _single_flight(key, lambda: _fetch_into_cache(cache_key, entry, url, kwargs))
+
+
+def _endpoint_label(method: str, url: str) -> str:
+    parsed = urlparse(url)
+    return f'{method.upper()} {parsed.netloc}{_ID_SEGMENT.sub("/{id}", parsed.path)}'
+
+
+def request(method: str, url: str, retry: Optional[bool] = None, cache: bool = True, **kwargs) -> requests.Response:
+    """
+    Args:
+        retry: Retry on 5xx responses and connection errors; defaults to True for IDEMPOTENT_METHODS only.
+        cache: False bypasses the cached copy of a catalog endpoint (the fresh response still updates the cache).
+    """
+    if retry is None:
+        retry = method.upper() in IDEMPOTENT_METHODS
+    with profiler.span(_endpoint_label(method, url), 'api'):
+        if method.upper() == 'GET':
+            key = _coalescing_key(url, kwargs)
+            if key is not None:
+                policy = httpcache.policy_for(url)
+                if policy is not None and not cache:
+                    return _single_flight(key, lambda: _fetch_into_cache(httpcache.HttpCache.key_for(key), None, url,
+                                                                         kwargs))
+                if policy is not None:
+                    return _cached_get(policy, key, url, kwargs)
+                return _single_flight(key, lambda: _send(method, url, retry=retry, **kwargs))
+        return _send(method, url, retry=retry, **kwargs)
+
+
+def _send(method: str, url: str, retry: bool = True, **kwargs) -> requests.Response:
+    kwargs.setdefault('timeout', DEFAULT_TIMEOUT)
+    bucket = limiter.bucket_for(url, _token_from_headers(kwargs.get('headers')))
+    breaker = health.breaker_for_url(url)
+    throttled = server_errors = 0
+
+    # the breaker is consulted and informed once per call, so the retries of one failing request neither open the
+    # circuit on their own nor get cut short by it
+    if not breaker.allow():
+        raise health.StackUnavailable(f'{breaker.name} is currently failing ({breaker.last_error}), '
+                                      f'request to {url} was not sent.')
+    while True:
+        bucket.acquire()
+        started = time.monotonic()
+        try:
+            response = requests.request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            # a read timeout of a non-idempotent call may mean the server already acted on it
+            resend = retry and (method.upper() in IDEMPOTENT_METHODS or not isinstance(e, requests.ReadTimeout))
+            if not resend or server_errors >= MAX_SERVER_RETRIES:
+                breaker.record_failure(str(e))
+                raise
+            time.sleep(min(2 ** server_errors, 30))
+            server_errors += 1
+            continue
+        except requests.RequestException:
+            breaker.release()
+            raise
+
+        if response.status_code >= 500 and response.status_code not in _RETRY_EXCLUDED_STATUSES and retry \
+                and server_errors < MAX_SERVER_RETRIES:
+            time.sleep(min(2 ** server_errors, 30))
+            server_errors += 1
+            continue
+
+        if response.status_code == 429 and throttled < MAX_THROTTLE_RETRIES:
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            bucket.on_throttled(retry_after if retry_after is not None else min(2 ** throttled, 30))
+            throttled += 1
+            continue
+
+        if response.status_code in HEALTH_FAILURE_STATUSES:
+            breaker.record_failure(f'HTTP {response.status_code}')
+        else:
+            breaker.record_success(time.monotonic() - started)
+        if response.status_code != 429:
+            bucket.on_success()
+        return response
+
+
+def get(url: str, params=None, **kwargs) -> requests.Response:
+    return request('GET', url, params=params, **kwargs)
+
+
+def post(url: str, data=None, json=None, **kwargs) -> requests.Response:
+    return request('POST', url, data=data, json=json, **kwargs)
+
+
+def put(url: str, data=None, **kwargs) -> requests.Response:
+    return request('PUT', url, data=data, **kwargs)
+
+
+def patch(url: str, data=None, **kwargs) -> requests.Response:
+    return request('PATCH', url, data=data, **kwargs)
+
+
+def delete(url: str, **kwargs) -> requests.Response:
+    return request('DELETE', url, **kwargs)
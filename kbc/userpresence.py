@@ -0,0 +1,138 @@
+"""
+Cross-stack user presence index for offboarding audits.
+
+For each (email, stack) pair the index records whether the user exists on the stack and which projects they are a
+member of. Lookups of many emails query all (email, stack) pairs concurrently and cache the answers for `ttl`
+seconds, keyed by a hash of the manage token, so repeating an audit or drilling into one user costs no API calls.
+"""
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+from urllib.parse import quote
+
+import requests
+
+from kbc import transport
+
+DEFAULT_TTL = 15 * 60
+MAX_WORKERS = 16
+USER_PATH = '/manage/users/{user}'
+USER_PROJECTS_PATH = '/manage/users/{user}/projects'
+
+
+class Presence(NamedTuple):
+    stack: str
+    found: bool
+    user_id: Optional[int]
+    projects: Optional[List[dict]]  # [{"id", "name", "organization"}]; None when the list could not be loaded
+    error: Optional[str]
+    fetched_at: float
+
+
+def _headers(token: str) -> dict:
+    return {"X-KBC-ManageApiToken": token, "Accept": "application/json"}
+
+
+def _organization_name(project: dict) -> str:
+    organization = project.get('organization')
+    return organization.get('name', '') if isinstance(organization, dict) else str(organization or '')
+
+
+def fetch_presence(stack: str, token: str, email: str) -> Presence:
+    base = f'https://connection.{stack}'
+    user = quote(email, safe='')
+    found, user_id = False, None
+    try:
+        response = transport.get(base + USER_PATH.format(user=user), headers=_headers(token))
+        if response.status_code == 404:
+            return Presence(stack, False, None, [], None, time.time())
+        response.raise_for_status()
+        found, user_id = True, response.json().get('id')
+
+        response = transport.get(base + USER_PROJECTS_PATH.format(user=user_id or user), headers=_headers(token))
+        response.raise_for_status()
+        projects = [{"id": p.get('id'), "name": p.get('name', ''), "organization": _organization_name(p)}
+                    for p in response.json()]
+        return Presence(stack, True, user_id, projects, None, time.time())
+    except requests.RequestException as error:
+        return Presence(stack, found, user_id, None, str(error), time.time())
+
+
+class UserPresenceIndex:
+
+    def __init__(self, ttl: float = DEFAULT_TTL):
+        self.ttl = ttl
+        self._entries: Dict[Tuple[str, str, str], Presence] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(email: str, stack: str, token: str) -> Tuple[str, str, str]:
+        return email.strip().lower(), stack, hashlib.sha256(token.encode()).hexdigest()[:16]
+
+    def _fresh(self, key) -> Optional[Presence]:
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and entry.error is None and time.time() - entry.fetched_at <= self.ttl:
+            return entry
+        return None
+
+    def lookup(self, emails: Iterable[str], stack_tokens: Dict[str, str], max_workers: int = MAX_WORKERS,
+               on_progress: Optional[Callable[[Presence], None]] = None) -> Dict[str, Dict[str, Presence]]:
+        """
+        Presence of every email on every stack of `stack_tokens` ({stack: manage token}).
+        Pairs not cached (or older than ttl, or failed last time) are fetched concurrently.
+
+        Returns:
+            {email: {stack: Presence}}
+        """
+        emails = sorted({e.strip() for e in emails if e.strip()}, key=str.lower)
+        result: Dict[str, Dict[str, Presence]] = {email: {} for email in emails}
+        to_fetch = []
+        for email in emails:
+            for stack, token in stack_tokens.items():
+                cached = self._fresh(self._key(email, stack, token))
+                if cached is not None:
+                    result[email][stack] = cached
+                else:
+                    to_fetch.append((email, stack, token))
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(fetch_presence, stack, token, email): (email, stack, token)
+                       for email, stack, token in to_fetch}
+            for future in as_completed(futures):
+                email, stack, token = futures[future]
+                presence = future.result()
+                with self._lock:
+                    self._entries[self._key(email, stack, token)] = presence
+                result[email][stack] = presence
+                if on_progress:
+                    on_progress(presence)
+        return result
+
+    def invalidate(self, email: Optional[str] = None):
+        """Forgets one user (e.g. after deleting them) or everything."""
+        with self._lock:
+            if email is None:
+                self._entries.clear()
+            else:
+                for key in [k for k in self._entries if k[0] == email.strip().lower()]:
+                    del self._entries[key]
+
+
+def flatten(presence: Dict[str, Dict[str, Presence]]) -> Dict[str, list]:
+    """Columnar email x stack rows, ready for a table."""
+    rows = [(email, p) for email, stacks in presence.items() for p in stacks.values()]
+    return {
+        "email": [email for email, _ in rows],
+        "stack": [p.stack for _, p in rows],
+        "found": [p.found for _, p in rows],
+        "user_id": [p.user_id for _, p in rows],
+        "projects": [len(p.projects) if p.projects is not None else None for _, p in rows],
+        "project_names": [", ".join(f"{x['name']} ({x['id']})" for x in p.projects or []) for _, p in rows],
+        "error": [p.error or '' for _, p in rows],
+    }
+
+
+index = UserPresenceIndex()
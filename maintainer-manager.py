@@ -1,14 +1,22 @@
-import streamlit as st
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import requests
+import streamlit as st
+
+import kbc.stacks
+import kbc.tasks
+from kbc import transport
+from tabs import components
 
 # Keboola API token (ensure you keep this secure)
 
-hostname_suffix_options = {
-    "keboola.com": "AWS us-east-1",
-    "eu-central-1.keboola.com": "AWS eu-central-1",
-    "north-europe.azure.keboola.com": "Azure North Europe",
-    "us-east4.gcp.keboola.com": "GCP US East4",
-    "europe-west3.gcp.keboola.com": "GCP Europe West3"
+hostname_suffix_options = kbc.stacks.labels(multitenant_only=True)
+
+MAX_WORKERS = 8
+BULK_MODES = {
+    "sync": "Exactly the selected maintainers",
+    "add": "Add to the selected maintainers",
+    "remove": "Remove from the selected maintainers",
 }
 
 def get_headers(token):
@@ -19,27 +27,72 @@ def get_headers(token):
 
 
 # Helper functions for API interactions
-def ensure_membership(st, api_url, token, user_email, member_checkboxes, nonmember_checkboxes):
-    for maintainer_id, checked in member_checkboxes.items():
-        if not checked:
-            requests.post(
-                f"{api_url}/maintainers/{maintainer_id}/users",
-                headers=get_headers(token),
-                json={"email": user_email}
-            )
-            st.write(f"removing from maintainer {maintainer_id}")
-    for maintainer_id, checked in nonmember_checkboxes.items():
-        if checked:
-            st.write(f"adding to maintainer {maintainer_id}")
-            requests.post(
-                f"{api_url}/maintainers/{maintainer_id}/users",
-                headers=get_headers(token),
-                json={"email": user_email}
-            )
+def add_maintainer_user(api_url, token, maintainer_id, user_email):
+    response = transport.post(
+        f"{api_url}/maintainers/{maintainer_id}/users",
+        headers=get_headers(token),
+        json={"email": user_email}
+    )
+    response.raise_for_status()
+
+
+def remove_maintainer_user(api_url, token, maintainer_id, user_id):
+    response = transport.delete(
+        f"{api_url}/maintainers/{maintainer_id}/users/{user_id}",
+        headers=get_headers(token)
+    )
+    response.raise_for_status()
+
+
+def apply_membership_changes(task, api_url, token, changes):
+    """
+    Runs the add / remove calls of `changes` (see diff_memberships) concurrently and reports one outcome per change.
+
+    Returns:
+        Consolidated report {email: {"added": [maintainer], "removed": [maintainer], "errors": [message]}}.
+    """
+    report = {}
+
+    def _apply(change):
+        if change['action'] == 'add':
+            add_maintainer_user(api_url, token, change['maintainer_id'], change['email'])
+        else:
+            remove_maintainer_user(api_url, token, change['maintainer_id'], change['user_id'])
+
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {executor.submit(_apply, change): change for change in changes}
+        for future in as_completed(futures):
+            change = futures[future]
+            user_report = report.setdefault(change['email'], {"added": [], "removed": [], "errors": []})
+            verb = "Added to" if change['action'] == 'add' else "Removed from"
+            try:
+                future.result()
+                user_report["added" if change['action'] == 'add' else "removed"].append(change['maintainer'])
+                outcome = {"status": "success", "message": f"{verb} {change['maintainer']}"}
+            except requests.RequestException as error:
+                user_report["errors"].append(f"{change['action']} {change['maintainer']}: {error}")
+                outcome = {"status": "error", "message": f"{verb} {change['maintainer']} failed: {error}"}
+            task.report({**outcome, "user": change['email']})
+    return report
+
+
+def ensure_membership(task, api_url, token, user_email, user_id, member_checkboxes, nonmember_checkboxes,
+                      maintainer_names):
+    changes = [{"action": "remove", "maintainer_id": maintainer_id, "maintainer": maintainer_names[maintainer_id],
+                "email": user_email, "user_id": user_id}
+               for maintainer_id, checked in member_checkboxes.items() if not checked]
+    changes += [{"action": "add", "maintainer_id": maintainer_id, "maintainer": maintainer_names[maintainer_id],
+                 "email": user_email, "user_id": user_id}
+                for maintainer_id, checked in nonmember_checkboxes.items() if checked]
+    return apply_membership_changes(task, api_url, token, changes)
+
+
+def render_membership_messages(messages):
+    components.render_bulk_results(messages, key='membership_results', item_key='user')
 
 
 def add_project_feature(api_url, token, project_id, feature_name):
-    response = requests.post(
+    response = transport.post(
         f"{api_url}/projects/{project_id}/features",
         headers=get_headers(token),
         json={"feature": feature_name}
@@ -48,7 +101,7 @@ def add_project_feature(api_url, token, project_id, feature_name):
 
 
 def remove_project_feature(api_url, token, project_id, feature_name):
-    response = requests.delete(
+    response = transport.delete(
         f"{api_url}/projects/{project_id}/features/{feature_name}",
         headers=get_headers(token)
     )
@@ -56,7 +109,7 @@ def remove_project_feature(api_url, token, project_id, feature_name):
 
 
 def get_maintainer_users(api_url, token, maintainer_id):
-    response = requests.get(
+    response = transport.get(
         f"{api_url}/maintainers/{maintainer_id}/users",
         headers=get_headers(token)
     )
@@ -64,7 +117,7 @@ def get_maintainer_users(api_url, token, maintainer_id):
 
 
 def get_user_details(api_url, token, user_email):
-    response = requests.get(
+    response = transport.get(
         f"{api_url}/users/{user_email}",
         headers=get_headers(token)
     )
@@ -72,18 +125,139 @@ def get_user_details(api_url, token, user_email):
 
 
 def get_maintainers(api_url, token):
-    response = requests.get(
+    response = transport.get(
         f"{api_url}/maintainers",
         headers=get_headers(token)
     )
     return response.json()
 
-def user_in_maintainer(api_url, token, user_email, maintainer):
-    maintainer_users = get_maintainer_users(api_url, token, maintainer['id'])
-    for user in maintainer_users:
-        if user['email'] == user_email:
-            return True
-    return False
+
+def get_memberships(api_url, token, maintainers):
+    """Current members of all maintainers, fetched concurrently: {maintainer_id: {email (lowercase): user_id}}."""
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        users = executor.map(lambda m: get_maintainer_users(api_url, token, m['id']), maintainers)
+        return {maintainer['id']: {user['email'].lower(): user['id'] for user in maintainer_users}
+                for maintainer, maintainer_users in zip(maintainers, users)}
+
+
+def diff_memberships(memberships, maintainer_names, emails, selected_ids, mode):
+    """
+    Changes needed to bring each email to the desired maintainer set.
+
+    mode: 'sync' - member of exactly `selected_ids`; 'add' - member of at least them; 'remove' - of none of them.
+    Only emails that are members already can be removed (the API removes by user ID).
+    """
+    changes = []
+    for email in emails:
+        for maintainer_id, members in memberships.items():
+            is_member = email.lower() in members
+            wanted = maintainer_id in selected_ids
+            if wanted and not is_member and mode in ('add', 'sync'):
+                action = 'add'
+            elif is_member and (mode == 'remove' and wanted or mode == 'sync' and not wanted):
+                action = 'remove'
+            else:
+                continue
+            changes.append({"action": action, "maintainer_id": maintainer_id,
+                            "maintainer": maintainer_names[maintainer_id], "email": email,
+                            "user_id": members.get(email.lower())})
+    return changes
+
+
+def render_membership_report(report):
+    st.dataframe({"user": list(report),
+                  "added": [", ".join(r["added"]) for r in report.values()],
+                  "removed": [", ".join(r["removed"]) for r in report.values()],
+                  "errors": [len(r["errors"]) for r in report.values()]},
+                 hide_index=True, use_container_width=True)
+
+
+def render_single_user(api_url, token):
+    user_email = st.text_input("Enter User Email")
+
+    if user_email:
+        st.header(f"Manage Maintainers for user {user_email}")
+        user_details = get_user_details(api_url, token, user_email)
+        st.write(user_details)
+
+        maintainers = get_maintainers(api_url, token)
+        memberships = get_memberships(api_url, token, maintainers)
+
+        member_maintainers = []
+        nonmember_maintainers = []
+
+        for maintainer in maintainers:
+            if user_email.lower() in memberships[maintainer['id']]:
+                member_maintainers.append(maintainer)
+            else:
+                nonmember_maintainers.append(maintainer)
+
+        member_checkboxes = {}
+        st.subheader(f"{user_email} is a member of:")
+        for maintainer in member_maintainers:
+            member_checkboxes[maintainer['id']] = st.checkbox(maintainer["name"], True)
+
+        st.subheader(f"{user_email} is NOT a member of:")
+
+        nonmember_checkboxes = {}
+        check_all_box = st.checkbox('Check All the below')
+        for maintainer in nonmember_maintainers:
+            if check_all_box:
+                nonmember_checkboxes[maintainer['id']] = st.checkbox(maintainer["name"], True)
+            else:
+                nonmember_checkboxes[maintainer['id']] = st.checkbox(maintainer["name"])
+
+        if st.button(f"Ensure {user_email} is a member of all selected"):
+            changes = sum(not c for c in member_checkboxes.values()) + sum(nonmember_checkboxes.values())
+            maintainer_names = {m['id']: m['name'] for m in maintainers}
+            st.session_state['membership_task'] = kbc.tasks.submit(
+                ensure_membership, api_url, token, user_email, user_details.get('id'), member_checkboxes,
+                nonmember_checkboxes, maintainer_names, name=f"Membership of {user_email}", total=changes,
+                export_fields=('user', 'status', 'message'))
+
+
+def render_bulk(api_url, token):
+    emails_input = st.text_area("User emails", help="One email per line (or separated by commas).")
+    emails = sorted({e.strip() for e in emails_input.replace(',', '\n').splitlines() if e.strip()})
+
+    maintainers = get_maintainers(api_url, token)
+    maintainer_names = {m['id']: m['name'] for m in maintainers}
+    selected_ids = set(st.multiselect("Maintainers", list(maintainer_names),
+                                      format_func=lambda m: maintainer_names[m]))
+    mode = st.radio("Desired membership", list(BULK_MODES), format_func=lambda m: BULK_MODES[m])
+
+    if not emails or not (selected_ids or mode == 'sync'):
+        st.info("Enter the user emails and select the maintainers.")
+        return
+    if not selected_ids and not st.checkbox(f"No maintainer selected: remove the {len(emails)} user(s) from every "
+                                            "maintainer", key='membership_remove_all'):
+        st.info("Select the maintainers the users should be members of, or confirm removing them from all.")
+        return
+
+    # a plan is only applied to the inputs it was computed from
+    plan_key = (api_url, tuple(emails), frozenset(selected_ids), mode)
+    if st.button("Plan membership changes"):
+        memberships = get_memberships(api_url, token, maintainers)
+        st.session_state['membership_plan'] = diff_memberships(memberships, maintainer_names, emails,
+                                                               selected_ids, mode)
+        st.session_state['membership_plan_key'] = plan_key
+
+    changes = st.session_state.get('membership_plan')
+    if changes is None:
+        return
+    if st.session_state.get('membership_plan_key') != plan_key:
+        st.info("The users, maintainers or mode changed since the last plan; plan again before applying.")
+        return
+    st.write(f"{sum(c['action'] == 'add' for c in changes)} addition(s), "
+             f"{sum(c['action'] == 'remove' for c in changes)} removal(s) for {len(emails)} user(s).")
+    components.render_grid({"user": [c['email'] for c in changes], "action": [c['action'] for c in changes],
+                            "maintainer": [c['maintainer'] for c in changes]}, key='membership_plan_grid')
+    if changes and st.button(f"Apply {len(changes)} change(s)", type="primary"):
+        st.session_state['membership_task'] = kbc.tasks.submit(
+            apply_membership_changes, api_url, token, changes, name="Bulk membership", total=len(changes),
+            export_fields=('user', 'status', 'message'))
+        del st.session_state['membership_plan']
+        del st.session_state['membership_plan_key']
 
 
 # Streamlit UI
@@ -102,38 +276,12 @@ link_to_tokens = f"[Go get token](https://connection.{hostname_suffix}/admin/acc
 st.markdown(link_to_tokens, unsafe_allow_html=True)
 token = st.text_input("Keboola Manage Token", type="password")
 
-user_email = st.text_input("Enter User Email")
-
-if user_email:
-    st.header(f"Manage Maintainers for user {user_email}")
-    user_details = get_user_details(api_url, token, user_email)
-    st.write(user_details)
-
-    maintainers = get_maintainers(api_url, token)
-
-    member_maintainers = []
-    nonmember_maintainers = []
-
-    for maintainer in maintainers:
-        if user_in_maintainer(api_url, token, user_email, maintainer):
-            member_maintainers.append(maintainer)
-        else:
-            nonmember_maintainers.append(maintainer)
-
-    member_checkboxes = {}
-    st.subheader(f"{user_email} is a member of:")
-    for maintainer in member_maintainers:
-        member_checkboxes[maintainer['id']] = st.checkbox(maintainer["name"], True)
-
-    st.subheader(f"{user_email} is NOT a member of:")
-
-    nonmember_checkboxes = {}
-    check_all_box = st.checkbox('Check All the below')
-    for maintainer in nonmember_maintainers:
-        if check_all_box:
-            nonmember_checkboxes[maintainer['id']] = st.checkbox(maintainer["name"], True)
-        else:
-            nonmember_checkboxes[maintainer['id']] = st.checkbox(maintainer["name"])
+if st.radio("Mode", ["Single user", "Bulk"], horizontal=True) == "Single user":
+    render_single_user(api_url, token)
+else:
+    render_bulk(api_url, token)
 
-    if st.button(f"Ensure {user_email} is a member of all selected"):
-        ensure_membership(st, api_url, token, user_email, member_checkboxes, nonmember_checkboxes)
+membership_task = st.session_state.get('membership_task')
+components.render_task(membership_task, render_membership_messages, key='membership_task')
+if membership_task is not None and membership_task.status == 'success':
+    render_membership_report(membership_task.result)
@@ -0,0 +1,59 @@
+import json
+
+import streamlit as st
+
+import kbc.kbcapi_scripts
+import kbc.provisioning
+import kbc.stacks
+import kbc.tasks
+from tabs import components
+
+# Streamlit UI
+st.title("Keboola Project Provisioning")
+
+stack_options = kbc.stacks.labels(multitenant_only=True)
+region = st.selectbox("Stack", stack_options.keys(), format_func=lambda key: stack_options[key])
+
+connection_url = f"https://connection{kbc.kbcapi_scripts.url_suffix(region)}"
+link_to_tokens = f"[Go get token]({connection_url}/admin/account/access-tokens)"
+
+st.markdown(link_to_tokens, unsafe_allow_html=True)
+token = st.text_input("Keboola Manage Token", type="password")
+
+manifest_file = st.file_uploader("Provisioning manifest (JSON)", type=["json"],
+                                 help="See kbc/provisioning.py for the manifest format.")
+
+if manifest_file and token:
+    try:
+        manifest = json.loads(manifest_file.getvalue())
+        specs = kbc.provisioning.load_specs(manifest)
+    except ValueError as e:
+        st.error(f"Invalid manifest: {e}")
+        st.stop()
+
+    st.write(f"{len(specs)} project(s) to create:")
+    st.dataframe([{"name": s['name'], "organization": s['organization'], "type": s.get('type', 'poc6months'),
+                   "users": len(s.get('users', [])), "tokens": len(s.get('tokens', []))} for s in specs],
+                 hide_index=True, use_container_width=True)
+
+    # a second submit while the first one runs would create every project twice
+    running = st.session_state.get('provisioning_task')
+    if (running is None or running.finished) and st.button(f"Provision {len(specs)} project(s)", type="primary"):
+        st.session_state['provisioning_task'] = kbc.tasks.submit(
+            lambda task: kbc.provisioning.provision_projects(token, manifest, region, on_progress=task.report),
+            name="Provisioning", total=len(specs), export_fields=('name', 'id', 'status', 'error'))
+
+task = st.session_state.get('provisioning_task')
+
+
+def render_provisioned(results):
+    st.dataframe([{"name": r['name'], "id": r['id'], "status": r['status'], "error": r['error']} for r in results],
+                 hide_index=True, use_container_width=True)
+
+
+components.render_task(task, render_provisioned, key='provisioning_task')
+
+if task is not None and task.status == 'success':
+    st.download_button("Download result manifest", json.dumps(task.result, indent=2),
+                       file_name="provisioning-result.json", mime="application/json")
+    st.caption("The result manifest contains the generated tokens; store it securely.")
@@ -1,20 +1,21 @@
 import streamlit as st
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import quote
 
+import kbc.resultexport
+import kbc.stacks
+import kbc.userpresence
+from kbc import transport
+from tabs import components
+
 st.set_page_config(page_title="Keboola User Management", page_icon="🧹", layout="centered")
 
 st.title("Keboola User Management")
 st.subheader("Manage API Tokens")
 
 # ---- Stack config (host -> label) ----
-STACKS = [
-    ("connection.keboola.com", "AWS us-east-1"),
-    ("connection.eu-central-1.keboola.com", "AWS eu-central-1"),
-    ("connection.north-europe.azure.keboola.com", "Azure North Europe"),
-    ("connection.us-east4.gcp.keboola.com", "GCP US East4"),
-    ("connection.europe-west3.gcp.keboola.com", "GCP Europe West3"),
-]
+STACKS = [(f"connection.{stack}", label) for stack, label in kbc.stacks.labels(multitenant_only=True).items()]
 
 st.write(
     "Provide a **Manage API** token for each stack you want to target. "
@@ -66,7 +67,7 @@ def parse_response(resp: requests.Response):
 def api_call(host: str, token: str, method: str, path: str, timeout=30):
     url = f"https://{host}{path}"
     try:
-        resp = requests.request(method=method, url=url, headers=headers_for(token), timeout=timeout)
+        resp = transport.request(method=method, url=url, headers=headers_for(token), timeout=timeout)
         return {
             "ok": resp.ok,
             "status_code": resp.status_code,
@@ -89,6 +90,15 @@ def delete_user(host: str, token: str, user_id_or_email: str):
 def selected_stacks():
     return [(label, host, tokens[host]) for (host, label) in STACKS if tokens.get(host)]
 
+REMOVAL_FIELDS = ("email", "stack", "status", "status_code", "response")
+
+def log_removal(record: dict):
+    # one CSV per session; the file is opened per deletion, so no handle outlives the script run
+    if "removal_export" not in st.session_state:
+        st.session_state["removal_export"] = kbc.resultexport.export_path("user-removals")
+    kbc.resultexport.append_record(st.session_state["removal_export"], REMOVAL_FIELDS, record)
+    st.session_state["removal_count"] = st.session_state.get("removal_count", 0) + 1
+
 # ---- Session-state buckets for per-stack results ----
 for host, _ in STACKS:
     st.session_state.setdefault(f"user_detail_{host}", None)
@@ -105,8 +115,12 @@ else:
         # ---------- USER DETAILS ----------
         st.markdown("### User Details\nFetched per stack using the provided Manage API tokens.")
         with st.spinner("Fetching user details across selected stacks..."):
-            for label, host, token in selected:
-                st.session_state[f"user_detail_{host}"] = get_user_details(host, token, user_email)
+            # all stacks at once; a stack with an open circuit answers immediately with an error
+            with ThreadPoolExecutor(max_workers=len(selected)) as executor:
+                futures = {host: executor.submit(get_user_details, host, token, user_email)
+                           for label, host, token in selected}
+            for host, future in futures.items():
+                st.session_state[f"user_detail_{host}"] = future.result()
 
         for label, host, _ in selected:
             res = st.session_state.get(f"user_detail_{host}")
@@ -148,7 +162,13 @@ else:
                     help=f"DELETE /manage/users/{{user}} on {label}",
                 ):
                     with st.spinner(f"Deleting {user_email} on {label}..."):
-                        st.session_state[f"delete_result_{host}"] = delete_user(host, token, user_email)
+                        res = delete_user(host, token, user_email)
+                        st.session_state[f"delete_result_{host}"] = res
+                    kbc.userpresence.index.invalidate(user_email)
+                    log_removal({"email": user_email, "stack": host,
+                                 "status": "success" if res["ok"] else "error",
+                                 "status_code": res["status_code"],
+                                 "response": res.get("error") or res.get("body")})
 
             with col2:
                 res = st.session_state.get(f"delete_result_{host}")
@@ -170,3 +190,37 @@ else:
                                 st.code(err)
                             else:
                                 st.json(res.get("body"))
+
+        if "removal_export" in st.session_state:
+            st.caption(f"{st.session_state['removal_count']} deletion(s) logged this session.")
+            components.render_export(st.session_state["removal_export"], key="removal_export")
+
+st.markdown("---")
+
+# ---------- BULK OFFBOARDING AUDIT ----------
+st.markdown("### Offboarding Audit")
+st.caption(
+    "Where are these users still present? All stacks are queried at once; answers are cached for "
+    f"{kbc.userpresence.DEFAULT_TTL // 60} minutes."
+)
+audit_input = st.text_area("User emails", key="audit_emails", help="One email per line (or separated by commas).")
+audit_emails = sorted({e.strip() for e in audit_input.replace(",", "\n").splitlines() if e.strip()})
+audit_tokens = {host.removeprefix("connection."): token for _, host, token in selected_stacks()}
+
+if audit_emails and audit_tokens and st.button(f"Audit {len(audit_emails)} user(s)", key="audit_run"):
+    with st.spinner(f"Querying {len(audit_emails) * len(audit_tokens)} user / stack pair(s)..."):
+        st.session_state["audit_result"] = kbc.userpresence.index.lookup(audit_emails, audit_tokens)
+    rows = kbc.userpresence.flatten(st.session_state["audit_result"])
+    with kbc.resultexport.ResultWriter("offboarding-audit", list(rows)) as export:
+        export.write_many(dict(zip(rows, values)) for values in zip(*rows.values()))
+    st.session_state["audit_export"] = export.path
+
+audit_result = st.session_state.get("audit_result")
+if audit_result:
+    rows = kbc.userpresence.flatten(audit_result)
+    present = sorted({email for email, found in zip(rows["email"], rows["found"]) if found})
+    st.write(f"{len(present)} of {len(audit_result)} user(s) still present on at least one stack, "
+             f"{sum(p or 0 for p in rows['projects'])} project membership(s) in total.")
+    components.render_grid(rows, key="audit_grid",
+                           column_labels={"project_names": "project memberships", "user_id": "user ID"})
+    components.render_export(st.session_state.get("audit_export"), key="audit_export")
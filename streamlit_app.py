@@ -2,11 +2,16 @@ import base64
 import json
 import os
 import typing
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import streamlit as st
 
+import kbc.health
 import kbc.kbcapi_scripts
-from tabs import encryptor, projectmgr, ddmonitoring
+import kbc.profiler
+import kbc.resultexport
+import kbc.stacks
+from tabs import components, configsearch, configsnapshots, encryptor, projectmgr, ddmonitoring, joblaunch, scheduleload
 
 image_path = os.path.dirname(os.path.abspath(__file__))
 
@@ -21,8 +26,14 @@ st.markdown(f"{logo_html}", unsafe_allow_html=True)
 st.title('Keboola Admin Tools 👩🏻‍🔬')
 
 
-def render_responses(consumer_responses: dict, type: str = 'json'):
+def _is_record_list(value) -> bool:
+    return isinstance(value, list) and bool(value) and all(isinstance(item, dict) for item in value)
+
+
+def render_responses(consumer_responses: dict, type: str = 'json', key: str = 'responses',
+                     export_path: typing.Optional[str] = None):
     if consumer_responses:
+        components.render_export(export_path, key=f'{key}_export')
         with st.container(border=False):
             for i, (stack, response) in enumerate(consumer_responses.items()):
                 if response['status'] == "success":
@@ -31,10 +42,13 @@ def render_responses(consumer_responses: dict, type: str = 'json'):
                     color = "red"
                 with st.expander(f":{color}[{stack}]", expanded=False):
                     if response['status'] == "success":
-                        if type == 'json':
-                            st.json(response['response'], expanded=True)
-                        else:
-                            st.dataframe(response['response'], use_container_width=True, )
+                        with kbc.profiler.span(f'render_responses {stack}', 'serialize'):
+                            if _is_record_list(response['response']):
+                                components.render_grid(response['response'], key=f'{key}_{stack}')
+                            elif type == 'json':
+                                st.json(response['response'], expanded=True)
+                            else:
+                                st.dataframe(response['response'], use_container_width=True, )
                     else:
                         st.error(response['response'])
 
@@ -53,35 +67,42 @@ def _perform_consumer_operation(stack_tokens: dict,
     else:
         raise ValueError(f"Invalid operation: {operation}")
 
-    consumer_responses = {}
-    for stack, token in stack_tokens.items():
+    def _call(stack, token):
         try:
             response = method(stack, token, **params)
-            consumer_responses[stack] = {"status": "success", "response": response}
+            return {"status": "success", "response": response}
         except Exception as e:
             json_response = {}
             try:
                 json_response = e.response.json()
             except Exception:
                 pass
-            consumer_responses[stack] = {"status": "error", "response": f'{str(e)}  {json_response}'}
+            return {"status": "error", "response": f'{str(e)}  {json_response}'}
+
+    # stacks are called concurrently; failing stacks fail fast on their open circuit, so the
+    # whole fan-out takes about as long as the slowest healthy stack
+    # each stack's outcome is appended to the export as soon as it arrives; consumers carry their OAuth app
+    # secrets, which must not end up in a file on disk
+    with kbc.resultexport.ResultWriter(f'oauth-{operation.lower()}', ('stack', 'status', 'response')) as export, \
+            ThreadPoolExecutor(max_workers=max(len(stack_tokens), 1)) as executor:
+        call = kbc.profiler.propagate(_call)
+        futures = {executor.submit(call, stack, token): stack for stack, token in stack_tokens.items()}
+        for future in as_completed(futures):
+            outcome = future.result()
+            export.write({"stack": futures[future], "status": outcome['status'],
+                          "response": kbc.resultexport.without_credentials(outcome['response'])})
+    consumer_responses = {stack: future.result() for future, stack in futures.items()}
 
     if operation in ['GET', 'LIST']:
         st.session_state[f'{operation}_consumer_responses'] = consumer_responses
+    st.session_state[f'{operation}_consumer_export'] = export.path
 
     return consumer_responses
 
 
 def display_main_content():
     # streamlit text element to input formatted JSON data
-    default_value = {
-        "eu-central-1.keboola.com": "TOKEN",
-        "keboola.com": "TOKEN",
-        "europe-west2.gcp.keboola.com": "TOKEN",
-        "europe-west3.gcp.keboola.com": "TOKEN",
-        "us-east4.gcp.keboola.com": "TOKEN",
-        "north-europe.azure.keboola.com": "TOKEN"
-    }
+    default_value = {stack: "TOKEN" for stack in kbc.stacks.stack_ids()}
     placeholder = json.dumps(default_value, indent=2)
     stack_tokens = st.text_area("Stack OAuth tokens", value=placeholder, height=200, help="Enter JSON data")
     stack_tokens_json = json.loads(stack_tokens)
@@ -97,7 +118,8 @@ def display_main_content():
     if st.button("List Existing Consumers", type="primary"):
         consumer_list = _perform_consumer_operation(stack_tokens_json, 'LIST')
 
-    render_responses(consumer_list, type='table')
+    render_responses(consumer_list, type='table', key='consumer_list',
+                     export_path=st.session_state.get('LIST_consumer_export'))
 
     st.divider()
 
@@ -106,7 +128,8 @@ def display_main_content():
     consumer_responses = st.session_state.get('GET_consumer_responses') or {}
     if st.button("List Consumer Details", type="primary"):
         consumer_responses = _perform_consumer_operation(stack_tokens_json, 'GET', component_id=component_id)
-    render_responses(consumer_responses)
+    render_responses(consumer_responses, key='consumer_details',
+                     export_path=st.session_state.get('GET_consumer_export'))
     enabled_stacks = [stack for stack, response in consumer_responses.items() if response['status'] == 'success']
 
     st.divider()
@@ -141,7 +164,8 @@ def display_main_content():
             filtered_stack_tokens = {stack: stack_tokens_json[stack] for stack in selected_stacks}
             consumer_responses = _perform_consumer_operation(filtered_stack_tokens, operation, payload=payload_json,
                                                              component_id=component_id)
-            render_responses(consumer_responses)
+            render_responses(consumer_responses, key='consumer_update',
+                             export_path=st.session_state.get(f'{operation}_consumer_export'))
 
     st.divider()
     st.subheader("Update Developer Portal")
@@ -195,19 +219,51 @@ def display_main_content():
         })
 
 
+def render_stack_health():
+    kbc.health.start_probe()
+    with st.sidebar.expander("Stack health", expanded=False):
+        for row in kbc.health.snapshot():
+            latency = f"{row['latency_ms']} ms" if row['latency_ms'] is not None else "n/a"
+            color = "green" if row['state'] == 'closed' else ("orange" if row['state'] == 'half-open' else "red")
+            st.markdown(f":{color}[●] `{row['stack']}` · {latency}")
+            if row['state'] != 'closed' and row['last_error']:
+                st.caption(row['last_error'])
+
+
 def main():
-    tab1, tab2, tab3, tab4 = st.tabs(["OAuth Manager", "Encryption API", "Project Features", "DD Monitoring"])
-    with tab1:
-        display_main_content()
+    # opt-in: KBC_PROFILE=1 or ?profile=1 in the URL
+    profiling = kbc.profiler.ENABLED or st.query_params.get('profile') == '1'
+    with kbc.profiler.rerun('streamlit_app', enabled=profiling) as profile:
+        with kbc.profiler.span('stack health', 'render'):
+            render_stack_health()
+
+        tab1, tab2, tab3, tab4, tab5, tab6, tab7, tab8 = st.tabs(["OAuth Manager", "Encryption API",
+                                                                  "Project Features", "DD Monitoring", "Config Search",
+                                                                  "Schedule Load", "Config Snapshots", "Job Launcher"])
+        with tab1, kbc.profiler.span('OAuth Manager', 'render'):
+            display_main_content()
+
+        with tab2, kbc.profiler.span('Encryption API', 'render'):
+            encryptor.display_content()
+
+        with tab3, kbc.profiler.span('Project Features', 'render'):
+            projectmgr.display_content()
+
+        with tab4, kbc.profiler.span('DD Monitoring', 'render'):
+            ddmonitoring.display_content()
+
+        with tab5, kbc.profiler.span('Config Search', 'render'):
+            configsearch.display_content()
 
-    with tab2:
-        encryptor.display_content()
+        with tab6, kbc.profiler.span('Schedule Load', 'render'):
+            scheduleload.display_content()
 
-    with tab3:
-        projectmgr.display_content()
+        with tab7, kbc.profiler.span('Config Snapshots', 'render'):
+            configsnapshots.display_content()
 
-    with tab4:
-        ddmonitoring.display_content()
+        with tab8, kbc.profiler.span('Job Launcher', 'render'):
+            joblaunch.display_content()
+    components.render_profile_summary(profile)
 
     hide_streamlit_style = """
         <style>
@@ -0,0 +1,193 @@
+import json
+import os
+from collections import deque
+from typing import Callable, Dict, Iterable, List, Optional, Union
+
+import pandas as pd
+import streamlit as st
+from st_aggrid import AgGrid, AgGridReturn, GridOptionsBuilder
+
+import kbc.profiler
+import kbc.resultexport
+from kbc.tasks import TaskHandle
+
+POLL_INTERVAL = 1.0
+GRID_HEIGHT = 420
+# rows rendered outside the visible range; everything else stays virtual
+GRID_ROW_BUFFER = 20
+PROFILE_HISTORY = 20
+
+
+def _format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds}s"
+    return f"{seconds // 60}m {seconds % 60:02d}s"
+
+
+def _render_task_body(handle: TaskHandle, render_results: Optional[Callable[[List], None]], key: str):
+    progress = handle.progress
+    label = f"{handle.name}: {handle.done}/{handle.total if handle.total is not None else '?'}" \
+            f" · {_format_duration(handle.elapsed)}"
+    if handle.done and handle.elapsed:
+        rate = handle.done / handle.elapsed
+        label += f" · {rate:.1f}/s"
+        if not handle.finished and handle.total:
+            label += f" · ETA {_format_duration((handle.total - handle.done) / rate)}"
+    if progress is not None:
+        st.progress(progress, text=label)
+    else:
+        st.caption(label)
+
+    if handle.status == 'error':
+        st.error(f"Task failed: {handle.error}")
+    elif handle.status == 'cancelled':
+        st.warning("Task was cancelled.")
+    elif handle.status == 'success':
+        st.success("Task finished.")
+    elif st.button("Cancel", key=f"{key}_cancel"):
+        handle.cancel()
+
+    if handle.export is not None:
+        render_export(handle.export.path, key=f"{key}_export")
+
+    if render_results:
+        render_results(handle.results())
+
+
+def _read_bytes(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def render_export(path: Optional[str], key: str):
+    """
+    Download buttons of a CSV result export (kbc.resultexport). The file is read, or converted to Parquet, only when
+    a button is clicked, so large exports cost nothing on reruns.
+    """
+    if not path or not os.path.exists(path):
+        return
+    base_name = os.path.splitext(os.path.basename(path))[0]
+    col1, col2 = st.columns(2)
+    col1.download_button("Results (CSV)", lambda: _read_bytes(path), file_name=f"{base_name}.csv", mime="text/csv",
+                         key=f"{key}_csv", use_container_width=True)
+    col2.download_button("Results (Parquet)", lambda: kbc.resultexport.csv_to_parquet(path),
+                         file_name=f"{base_name}.parquet", mime="application/octet-stream", key=f"{key}_parquet",
+                         use_container_width=True)
+
+
+def _grid_cell(value):
+    return json.dumps(value) if isinstance(value, (dict, list)) else value
+
+
+def render_grid(data: Union[pd.DataFrame, List[dict], Dict[str, list]], key: str, height: int = GRID_HEIGHT,
+                selection: Optional[str] = None, pre_selected: Optional[Iterable[int]] = None,
+                column_labels: Optional[Dict[str, str]] = None) -> AgGridReturn:
+    """
+    Virtualized AgGrid table with client-side sorting and filtering. Only the visible row range is rendered, and
+    sorting / filtering never reruns the script.
+
+    Args:
+        selection: None, 'single' or 'multiple'; selection changes rerun the script.
+        pre_selected: Row positions selected when the grid is drawn.
+    """
+    frame = data if isinstance(data, pd.DataFrame) else pd.DataFrame(data)
+    frame = frame.apply(lambda column: column.map(_grid_cell)) if not frame.empty else frame
+    builder = GridOptionsBuilder.from_dataframe(frame)
+    builder.configure_default_column(sortable=True, filter=True, resizable=True)
+    for column, label in (column_labels or {}).items():
+        builder.configure_column(column, header_name=label)
+    if selection:
+        builder.configure_selection(selection, use_checkbox=True, header_checkbox=selection == 'multiple',
+                                    pre_selected_rows=list(pre_selected or []))
+    builder.configure_grid_options(rowBuffer=GRID_ROW_BUFFER, animateRows=False)
+    return AgGrid(frame, gridOptions=builder.build(), height=height, key=key,
+                  update_on=['selectionChanged'] if selection else [])
+
+
+def grid_selected_rows(response: AgGridReturn) -> Optional[List[dict]]:
+    """Rows selected in the grid, or None while the grid has not reported back yet."""
+    nodes = (response.grid_response or {}).get('nodes') if isinstance(response.grid_response, dict) else None
+    if nodes is None:
+        return None
+    return [node.get('data') or {} for node in nodes if node.get('isSelected')]
+
+
+BULK_STATUSES = ('success', 'skipped', 'error')
+
+
+def render_bulk_results(results: List[dict], key: str = 'bulk_results', item_key: str = 'project',
+                        live: bool = False):
+    """
+    Aggregate view of per-item outcomes ({"status", <item_key>, "message"}): counts per status and one filterable
+    table, so the page holds the same few elements whether the batch has 10 or 10,000 items.
+
+    Args:
+        live: The outcomes of a still running task, redrawn every POLL_INTERVAL; only the counters are rendered and
+            the table is built once, when the task has finished.
+    """
+    if not results:
+        return
+    counts = {status: 0 for status in BULK_STATUSES}
+    for outcome in results:
+        counts[outcome['status']] = counts.get(outcome['status'], 0) + 1
+    for column, (status, count) in zip(st.columns(len(counts)), counts.items()):
+        column.metric(status.capitalize(), count)
+    if live:
+        st.caption("The table of outcomes is shown when the task finishes.")
+        return
+
+    shown = st.multiselect("Show", list(counts), default=list(BULK_STATUSES), key=f"{key}_filter")
+    rows = [outcome for outcome in results if outcome['status'] in shown]
+    render_grid({item_key: [r.get(item_key, '') for r in rows], "status": [r['status'] for r in rows],
+                 "message": [r.get('message', '') for r in rows]}, key=f"{key}_grid")
+
+
+def render_task(handle: Optional[TaskHandle], render_results: Optional[Callable[[List], None]] = None,
+                key: str = 'task'):
+    """
+    Render progress and partial results of a background task.
+    While the task runs, only this block is redrawn every POLL_INTERVAL seconds; the rest of the page stays idle.
+    """
+    if handle is None:
+        return
+
+    seen_key = f"{key}_finished_seen"
+    if handle.finished:
+        _render_task_body(handle, render_results, key)
+        return
+
+    st.session_state[seen_key] = False
+
+    def _poll():
+        _render_task_body(handle, render_results, key)
+        if handle.finished and not st.session_state.get(seen_key):
+            # one full rerun so the page drops the polling fragment and reacts to the final state
+            st.session_state[seen_key] = True
+            st.rerun()
+
+    st.fragment(_poll, run_every=POLL_INTERVAL)()
+
+
+def render_profile_summary(profile: Optional[kbc.profiler.RerunProfile]):
+    """
+    Sidebar summary of a profiled rerun plus trace downloads of the last PROFILE_HISTORY reruns.
+    Call at the very end of the script, after the profiled block was closed.
+    """
+    if profile is None:
+        return
+    history = st.session_state.setdefault('profiler_history', deque(maxlen=PROFILE_HISTORY))
+    history.append(profile)
+
+    with st.sidebar.expander(f"Rerun profile · {profile.duration * 1000:.0f} ms", expanded=True):
+        totals = profile.totals()
+        st.dataframe({"category": list(totals), "ms": [round(v * 1000, 1) for v in totals.values()]},
+                     hide_index=True, use_container_width=True)
+        st.caption("Slowest blocks (self time)")
+        for span in profile.slowest():
+            st.markdown(f"`{span.self_time * 1000:.0f} ms` {span.category} · {span.name}")
+        st.caption("Previous reruns: " + ", ".join(f"{p.duration * 1000:.0f}" for p in list(history)[-6:-1]))
+        st.download_button("Trace (Chrome / Perfetto)", json.dumps(kbc.profiler.chrome_trace(history)),
+                           file_name="rerun-trace.json", mime="application/json", key='profiler_trace')
+        st.download_button("Folded stacks (flamegraph.pl)", kbc.profiler.folded(history),
+                           file_name="rerun-stacks.folded", mime="text/plain", key='profiler_folded')
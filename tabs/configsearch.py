@@ -0,0 +1,78 @@
+import sqlite3
+
+import streamlit as st
+
+import kbc.configindex
+import kbc.kbcapi_scripts
+import kbc.tasks
+from tabs import components
+
+REGIONS = [region for region in kbc.kbcapi_scripts.URL_SUFFIXES if region != 'CURRENT_STACK']
+
+
+def _index_projects(task, manage_token, region, project_ids):
+    index = kbc.configindex.ConfigIndex()
+    try:
+        return index.index_organization(manage_token, region, project_ids, on_progress=task.report)
+    finally:
+        index.close()
+
+
+def _render_indexing():
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        region = st.selectbox("Region", REGIONS, key='cfgidx_region')
+    with col2:
+        manage_token = st.text_input("Manage token", type="password", key='cfgidx_token')
+    projects_input = st.text_area("Project IDs", key='cfgidx_projects', help="One ID per line (or separated by commas).")
+    project_ids = sorted({p.strip() for p in projects_input.replace(',', '\n').splitlines() if p.strip()}, key=str)
+
+    task = st.session_state.get('cfgidx_task')
+    if manage_token and project_ids and (task is None or task.finished):
+        if st.button(f"Index {len(project_ids)} project(s)", key='cfgidx_run'):
+            task = kbc.tasks.submit(_index_projects, manage_token, region, project_ids,
+                                    name="Indexing configurations", total=len(project_ids),
+                                    export_fields=('region', 'project', 'status', 'updated', 'removed', 'message'))
+            st.session_state['cfgidx_task'] = task
+    components.render_task(task, lambda results: components.render_bulk_results(
+        results, key='cfgidx_results', live=not task.finished), key='cfgidx_task')
+
+
+def _render_search(index: kbc.configindex.ConfigIndex):
+    projects = index.projects()
+    st.caption(f"{sum(p['documents'] for p in projects)} configurations and rows of {len(projects)} project(s) "
+               "indexed.")
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        query = st.text_input("Search", key='cfgidx_query', placeholder="db.example.com")
+    with col2:
+        raw = st.checkbox("FTS5 syntax", key='cfgidx_raw', help="OR / NOT / NEAR, prefix*, column:term")
+    if not query:
+        return
+    try:
+        rows = index.search(query, raw=raw)
+    except sqlite3.OperationalError as error:
+        st.error(f"Invalid query: {error}")
+        return
+    st.caption(f"{len(rows)} match(es)")
+    if not rows:
+        return
+    response = components.render_grid(rows, key='cfgidx_grid', selection='single')
+    selected = components.grid_selected_rows(response)
+    if selected:
+        row = selected[0]
+        st.json(index.document(row['region'], row['project_id'], row['component_id'], row['config_id'],
+                               row['row_id']))
+
+
+def display_content():
+    st.subheader("Configuration search")
+    _render_indexing()
+    task = st.session_state.get('cfgidx_task')
+    if task is not None and not task.finished:
+        return
+    index = kbc.configindex.ConfigIndex()
+    try:
+        _render_search(index)
+    finally:
+        index.close()
@@ -0,0 +1,82 @@
+import streamlit as st
+
+import kbc.configsnapshots
+import kbc.kbcapi_scripts
+import kbc.tasks
+import kbc.tokenbroker
+from tabs import components
+
+REGIONS = [region for region in kbc.kbcapi_scripts.URL_SUFFIXES if region != 'CURRENT_STACK']
+
+
+def _snapshot_projects(task, manage_token, region, project_ids, label):
+    return kbc.configsnapshots.SnapshotStore().snapshot_organization(manage_token, region, project_ids, label=label,
+                                                                     on_progress=task.report)
+
+
+def _restore_snapshot(task, manage_token, snapshot_id, only):
+    manifest = kbc.configsnapshots.SnapshotStore().load_manifest(snapshot_id)
+    # restoring writes configurations, so it needs a token with the default (write) permissions
+    token = kbc.tokenbroker.broker.token_for(manage_token, manifest['region'], manifest['project_id'])
+    return kbc.configsnapshots.SnapshotStore().restore(snapshot_id, token, only=only, on_progress=task.report)
+
+
+def _render_snapshot(region, manage_token):
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        projects_input = st.text_area("Project IDs", key='cfgsnap_projects',
+                                      help="One ID per line (or separated by commas).")
+    with col2:
+        label = st.text_input("Label", key='cfgsnap_label', placeholder="before migration")
+    project_ids = sorted({p.strip() for p in projects_input.replace(',', '\n').splitlines() if p.strip()}, key=str)
+
+    task = st.session_state.get('cfgsnap_task')
+    if manage_token and project_ids and (task is None or task.finished):
+        if st.button(f"Snapshot {len(project_ids)} project(s)", key='cfgsnap_run'):
+            task = kbc.tasks.submit(_snapshot_projects, manage_token, region, project_ids, label.strip(),
+                                    name="Snapshotting configurations", total=len(project_ids),
+                                    export_fields=('project', 'status', 'message'))
+            st.session_state['cfgsnap_task'] = task
+    components.render_task(task, lambda results: components.render_bulk_results(
+        results, key='cfgsnap_results', live=not task.finished), key='cfgsnap_task')
+
+
+def _render_restore(region, manage_token):
+    store = kbc.configsnapshots.SnapshotStore()
+    snapshot_ids = list(reversed(store.list_snapshots(region)))
+    if not snapshot_ids:
+        st.info(f"No snapshots of {region} projects yet.")
+        return
+    snapshot_id = st.selectbox("Snapshot", snapshot_ids, key='cfgsnap_snapshot')
+    manifest = store.load_manifest(snapshot_id)
+    configurations = [f"{entry['component_id']}/{entry['config_id']}" for entry in manifest['configurations']]
+    label = f" · {manifest['label']}" if manifest.get('label') else ''
+    st.caption(f"Project {manifest['project_id']}, taken {manifest['created_at']}{label} · "
+               f"{len(configurations)} configuration(s)")
+    only = st.multiselect("Restore only", configurations, key='cfgsnap_only',
+                          help="Leave empty to restore every configuration that differs from the snapshot.")
+
+    task = st.session_state.get('cfgsnap_restore_task')
+    if manage_token and (task is None or task.finished):
+        confirmed = st.checkbox(f"Overwrite the differing configurations of project {manifest['project_id']}",
+                                key='cfgsnap_confirm')
+        if st.button("Restore", type="primary", key='cfgsnap_restore', disabled=not confirmed):
+            task = kbc.tasks.submit(_restore_snapshot, manage_token, snapshot_id, only or None,
+                                    name=f"Restoring {snapshot_id}", total=len(only or configurations),
+                                    export_fields=('configuration', 'status', 'message'))
+            st.session_state['cfgsnap_restore_task'] = task
+    components.render_task(task, lambda results: components.render_bulk_results(
+        results, key='cfgsnap_restore_results', item_key='configuration', live=not task.finished),
+                           key='cfgsnap_restore_task')
+
+
+def display_content():
+    st.subheader("Configuration snapshots")
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        region = st.selectbox("Region", REGIONS, key='cfgsnap_region')
+    with col2:
+        manage_token = st.text_input("Manage token", type="password", key='cfgsnap_token')
+    _render_snapshot(region, manage_token)
+    st.divider()
+    _render_restore(region, manage_token)
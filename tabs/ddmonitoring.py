@@ -1,8 +1,14 @@
 import datetime
+import os
 
 import streamlit as st
 from streamlit.components.v1 import html
 
+import kbc.logexport
+import kbc.stacks
+import kbc.tasks
+from tabs import components
+
 LIVE_TAIL_URL = "https://app.datadoghq.eu/logs/livetail?query=%40component%3A{component_id}%20%40priority%3A%28ERROR%20OR%20CRITICAL%20OR%20EMERGENCY%29%20&agg_m=count&agg_m_source=base&agg_t=count&cols=host%2Cservice&fromUser=true&messageDisplay=inline&refresh_mode=sliding&storage=live&stream_sort=desc&view=spans&viz=stream&live=true"
 
 POD_STATS = "https://app.datadoghq.eu/dashboard/9ku-8g9-5b2/job-queue-daemon?fromUser=true&refresh_mode=paused&tpl_var_componentid[0]={component_id}&tpl_var_container_name[0]={job_id}-{job_id}--0-{component_id_norm}&tpl_var_pod_name[0]=job-{job_id}&from_ts={timestamp_from}&to_ts={timestamp_to}&live=false"
@@ -22,12 +28,7 @@ def open_page(url):
 
 
 def display_content():
-    # stack = st.multiselect("Stack", ["eu-central-1.keboola.com",
-    #                                  "keboola.com",
-    #                                  "north-europe.azure.keboola.com",
-    #                                  "europe-west2.gcp.keboola.com",
-    #                                  "europe-west3.gcp.keboola.com",
-    #                                  "us-east4.gcp.keboola.com"], key='ddstack')
+    # stack = st.multiselect("Stack", kbc.stacks.stack_ids(), key='ddstack')
 
     # only_keboola = st.checkbox("Show Only Keboola components", key='ddkeboola')
     # components = kbc.kbcapi_scripts.list_all_components(only_keboola)
@@ -35,12 +36,8 @@ def display_content():
     #                             key='ddcomp')
 
     st.subheader("Component monitoring")
-    stack = st.selectbox("Stack", ["eu-central-1.keboola.com",
-                                   "keboola.com",
-                                   "north-europe.azure.keboola.com",
-                                   "europe-west2.gcp.keboola.com",
-                                   "europe-west3.gcp.keboola.com",
-                                   "us-east4.gcp.keboola.com"], key='ddstack')
+    stack = st.selectbox("Stack", kbc.stacks.stack_ids(),
+                         index=kbc.stacks.stack_ids().index(kbc.stacks.APP_DEFAULT_STACK), key='ddstack')
 
     component_id = st.text_input('Enter the Component ID', help="e.g. kds-team.ex-hubspot", key='ddcomp')
     run_id = st.text_input('Job ID', help="e.g. 123123", key='ddrun')
@@ -102,4 +99,88 @@ def display_content():
                    url=LIVE_TAIL_URL.format(component_id=component_id))
 
     st.divider()
+
+    render_log_export_analysis()
     st.empty()
+
+
+def _index_export(task, path):
+    mb = 1024 * 1024
+    task.set_total(max(os.path.getsize(path) // mb, 1))
+    reported = [0]
+
+    def _progress(position, size):
+        task.report(advance=position // mb - reported[0])
+        reported[0] = position // mb
+
+    index = kbc.logexport.LogIndex(path)
+    try:
+        return index.build(on_progress=_progress)
+    finally:
+        index.close()
+
+
+def _log_index(path, task):
+    """The session's index of the export, reopened when the path changes or an indexing task finishes."""
+    key = (path, id(task), task.finished if task is not None else None)
+    cached = st.session_state.get('ddlog_log_index')
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    if cached is not None:
+        cached[1].close()
+    index = kbc.logexport.LogIndex(path, check_same_thread=False)
+    st.session_state['ddlog_log_index'] = (key, index)
+    return index
+
+
+def render_log_export_analysis():
+    st.subheader("Log export analysis")
+    path = st.text_input("Path to a local log export (JSON lines)", key='ddlog_path',
+                         help="Indexed once into <export>.idx.sqlite next to the file; appended lines are "
+                              "picked up incrementally.")
+    if not path:
+        return
+    if not os.path.isfile(path):
+        st.error(f"File {path} does not exist.")
+        return
+
+    task = st.session_state.get('ddlog_task')
+    if st.session_state.get('ddlog_task_path') != path:
+        task = None
+    if task is None or task.finished:
+        current = _log_index(path, task).is_current()
+        label = "Re-index export" if current else "Index export"
+        if st.button(label, key='ddlog_index', type="secondary" if current else "primary"):
+            task = kbc.tasks.submit(_index_export, path, name="Indexing log export")
+            st.session_state['ddlog_task'] = task
+            st.session_state['ddlog_task_path'] = path
+    components.render_task(task, key='ddlog_task')
+    if task is not None and not task.finished:
+        return
+
+    index = _log_index(path, task)
+    if not index.indexed_bytes:
+        return
+    _render_log_aggregates(index)
+
+
+def _render_log_aggregates(index: kbc.logexport.LogIndex):
+    priorities = index.values('priority')
+    col1, col2 = st.columns(2)
+    with col1:
+        selected_components = st.multiselect("Components", index.values('component'), key='ddlog_components')
+        selected_priorities = st.multiselect("Priorities", priorities, key='ddlog_priorities',
+                                             default=[p for p in priorities if p in kbc.logexport.ERROR_PRIORITIES])
+    with col2:
+        run_id = st.text_input("Run ID", key='ddlog_run')
+        contains = st.text_input("Fingerprint contains", key='ddlog_contains')
+    group_by = st.multiselect("Group by", kbc.logexport.GROUP_COLUMNS, default=['component', 'fingerprint'],
+                              key='ddlog_group')
+
+    rows = index.aggregate(group_by, components=selected_components, priorities=selected_priorities,
+                           run_id=run_id or None, fingerprint_contains=contains or None)
+    st.caption(f"{sum(r['count'] for r in rows)} matching lines in {len(rows)} groups")
+    event = st.dataframe(rows, hide_index=True, use_container_width=True, on_select="rerun",
+                         selection_mode="single-row", column_config={"sample_offset": None}, key='ddlog_table')
+    if event.selection.rows:
+        st.json(index.read_line(rows[event.selection.rows[0]]['sample_offset']))
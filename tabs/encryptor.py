@@ -1,15 +1,12 @@
 import streamlit as st
 
 import kbc.kbcapi_scripts
+import kbc.stacks
 
 
 def display_content():
-    stack = st.selectbox("Stack", ["eu-central-1.keboola.com",
-                                   "keboola.com",
-                                   "north-europe.azure.keboola.com",
-                                   "europe-west2.gcp.keboola.com",
-                                   "europe-west3.gcp.keboola.com",
-                                   "us-east4.gcp.keboola.com"])
+    stack = st.selectbox("Stack", kbc.stacks.stack_ids(),
+                         index=kbc.stacks.stack_ids().index(kbc.stacks.APP_DEFAULT_STACK))
     project_id = st.text_input("Project ID")
     component_id = st.text_input("Component ID")
     config_id = st.text_input("Config ID")
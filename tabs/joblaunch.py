@@ -0,0 +1,69 @@
+import streamlit as st
+
+import kbc.joblauncher
+import kbc.kbcapi_scripts
+import kbc.tasks
+import kbc.tokenbroker
+from tabs import components
+
+REGIONS = [region for region in kbc.kbcapi_scripts.URL_SUFFIXES if region != 'CURRENT_STACK']
+
+
+def _parse_jobs(value: str):
+    """Lines of '<project_id> <component_id> <config_id>' (spaces or commas); returns (jobs, invalid lines)."""
+    jobs, invalid = [], []
+    for line in value.splitlines():
+        parts = line.replace(',', ' ').split()
+        if not parts:
+            continue
+        if len(parts) != 3:
+            invalid.append(line)
+            continue
+        jobs.append(tuple(parts))
+    return jobs, invalid
+
+
+def _launch_jobs(task, manage_token, region, jobs, per_project, per_stack):
+    tokens, errors = kbc.tokenbroker.broker.tokens_for(manage_token, region, {project_id for project_id, _, _ in jobs})
+    run_requests = []
+    for project_id, component_id, config_id in jobs:
+        if project_id in tokens:
+            run_requests.append(kbc.joblauncher.RunRequest(region, project_id, tokens[project_id], component_id,
+                                                           config_id))
+        else:
+            task.report({"status": "error", "job": f"{region}/{project_id}: {component_id}/{config_id}",
+                         "job_id": None, "message": f"No storage token: {errors[project_id]}"})
+    return kbc.joblauncher.launch_jobs(task, run_requests, per_project=per_project, per_stack=per_stack)
+
+
+def display_content():
+    st.subheader("Job launcher")
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        region = st.selectbox("Region", REGIONS, key='joblaunch_region')
+    with col2:
+        manage_token = st.text_input("Manage token", type="password", key='joblaunch_token')
+    jobs, invalid = _parse_jobs(st.text_area(
+        "Jobs", key='joblaunch_jobs', placeholder="1234 keboola.ex-db-snowflake 987654",
+        help=f"One job per line: project ID, component ID and configuration ID. Use `{kbc.joblauncher.ORCHESTRATION}` "
+             "as the component of legacy orchestrations."))
+    if invalid:
+        st.error(f"{len(invalid)} line(s) are not '<project_id> <component_id> <config_id>': {invalid[:5]}")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        per_project = st.number_input("Concurrent jobs per project", min_value=1, max_value=20,
+                                      value=kbc.joblauncher.PER_PROJECT, key='joblaunch_per_project')
+    with col2:
+        per_stack = st.number_input("Concurrent jobs on the stack", min_value=1, max_value=200,
+                                    value=kbc.joblauncher.PER_STACK, key='joblaunch_per_stack')
+
+    task = st.session_state.get('joblaunch_task')
+    if manage_token and jobs and not invalid and (task is None or task.finished):
+        if st.button(f"Launch {len(jobs)} job(s)", type="primary", key='joblaunch_run'):
+            task = kbc.tasks.submit(_launch_jobs, manage_token, region, jobs, int(per_project), int(per_stack),
+                                    name="Launching jobs", total=len(jobs),
+                                    export_fields=('job', 'job_id', 'status', 'message'))
+            st.session_state['joblaunch_task'] = task
+    components.render_task(task, lambda results: components.render_bulk_results(
+        results, key='joblaunch_results', item_key='job', live=not task.finished), key='joblaunch_task')
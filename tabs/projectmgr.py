@@ -1,19 +1,24 @@
+import hashlib
+
+import numpy as np
+import pandas as pd
 import streamlit as st
 import requests
+from typing import Optional
 from urllib.parse import urlparse
 
+import kbc.inventory
 import kbc.kbcapi_scripts
+import kbc.profiler
+import kbc.projecttable
+import kbc.stacks
+import kbc.tasks
+from tabs import components
 
 
-STACK_OPTIONS = [
-    "eu-central-1.keboola.com",
-    "keboola.com",
-    "north-europe.azure.keboola.com",
-    "europe-west2.gcp.keboola.com",
-    "europe-west3.gcp.keboola.com",
-    "us-east4.gcp.keboola.com",
-    "Other (manual entry)",
-]
+STACK_OPTIONS = kbc.stacks.stack_ids() + ["Other (manual entry)"]
+# the grid renders only the visible rows, so pages can be large
+PAGE_SIZES = [500, 1000, 2000]
 
 
 def _clean_stack_value(raw_stack: str) -> str:
@@ -63,7 +68,8 @@ def _format_project_option(project: dict) -> str:
 
 
 def display_content():
-    stack_selection = st.selectbox("Stack", STACK_OPTIONS, key='pgm_stack')
+    stack_selection = st.selectbox("Stack", STACK_OPTIONS, index=STACK_OPTIONS.index(kbc.stacks.APP_DEFAULT_STACK),
+                                   key='pgm_stack')
     if stack_selection == "Other (manual entry)":
         raw_stack = st.text_input("Enter custom stack URL", key='pgm_custom_stack')
     else:
@@ -223,37 +229,38 @@ def _render_organization_flow(stack: str, manage_token: str, operation: str, fin
         st.info("The selected organization does not have any projects.")
         return
 
-    project_rows = []
-    for project in projects:
-        project_rows.append({
-            "include": True,
-            "name": project.get('name', ''),
-            "project_id": project.get('id', ''),
-            "type": project.get('type', ''),
-        })
-
-    edited_projects = st.data_editor(
-        project_rows,
-        column_config={
-            "include": st.column_config.CheckboxColumn("Include", help="Uncheck to skip this project", default=True),
-            "name": st.column_config.TextColumn("Project name", disabled=True),
-            "project_id": st.column_config.TextColumn("Project ID", disabled=True),
-            "type": st.column_config.TextColumn("Project type", disabled=True),
-        },
-        hide_index=True,
-        key='pgm_project_table',
-    )
-
-    included_project_ids = {
-        row.get('project_id')
-        for row in edited_projects
-        if row.get('include') and row.get('project_id')
-    }
-    target_projects = [project for project in projects if project.get('id') in included_project_ids]
-
+    inventory = kbc.inventory.get_inventory(stack, manage_token, organization_id)
+    _render_feature_inventory(inventory, manage_token, projects, final_feature)
+
+    table = kbc.projecttable.ProjectTable(projects)
+    selection = st.session_state.get('pgm_project_selection')
+    if selection is None or st.session_state.get('pgm_project_selection_org') != organization_id:
+        selection = kbc.projecttable.ProjectSelection()
+        st.session_state['pgm_project_selection'] = selection
+        st.session_state['pgm_project_selection_org'] = organization_id
+
+    scope = np.ones(len(table), dtype=bool)
+    targeting = False
+    if inventory.project_features and final_feature:
+        targeting = st.checkbox("Include only projects that need the change (based on the inventory)",
+                                key='pgm_inventory_targeting')
+        if targeting:
+            scope = table.id_mask(inventory.projects_needing(final_feature, operation))
+    # a grid page shows different projects once the targeting scope changes
+    scope_key = (organization_id, targeting, final_feature, operation) if targeting else (organization_id,)
+    if st.session_state.get('pgm_scope_key') != scope_key:
+        _reset_project_grids()
+        st.session_state['pgm_scope_key'] = scope_key
+
+    project_filter = _render_project_filter(table)
+    matching = table.matching(project_filter) & scope
+    _render_project_page(table, selection, matching, selection.mask(table) & scope, project_filter)
+
+    target_projects = table.select(selection.mask(table) & scope)
     st.caption(f"{len(target_projects)} project(s) selected for the operation.")
 
-    if st.button("Apply feature change", type="primary", key='pgm_multi_apply'):
+    plan_key = (organization_id, operation, final_feature, tuple(sorted(str(p.get('id')) for p in target_projects)))
+    if st.button("Plan feature change", type="primary", key='pgm_multi_plan'):
         if not final_feature:
             st.warning("Please select or enter a feature before performing the action.")
             return
@@ -262,29 +269,215 @@ def _render_organization_flow(stack: str, manage_token: str, operation: str, fin
             st.warning("All projects are excluded; nothing to update.")
             return
 
-        results_container = st.container()
-        with results_container:
-            for project in target_projects:
-                project_id = project.get('id')
-                project_label = _format_project_option(project)
-
-                if not project_id:
-                    st.error(f"{project_label}: missing project ID, skipping.")
-                    continue
-
-                try:
-                    if operation == 'ADD':
-                        kbc.kbcapi_scripts.add_feature(stack, manage_token, project_id, final_feature)
-                        st.success(f"{project_label}: added `{final_feature}`.")
-                    else:
-                        kbc.kbcapi_scripts.remove_feature(stack, manage_token, project_id, final_feature)
-                        st.success(f"{project_label}: removed `{final_feature}`.")
-                except requests.HTTPError as error:
-                    status_code = getattr(error.response, 'status_code', None)
-                    message = _http_error_details(error)
-                    if status_code in (400, 404, 409):
-                        st.warning(f"{project_label}: skipped ({message}).")
-                    else:
-                        st.error(f"{project_label}: failed ({message}).")
-                except requests.RequestException as error:
-                    st.error(f"{project_label}: unexpected error ({error}).")
+        st.session_state['pgm_plan_task'] = kbc.tasks.submit(
+            _plan_feature_change, inventory, stack, manage_token, organization_id, target_projects, operation,
+            final_feature, name=f"Planning {operation} `{final_feature}`")
+        st.session_state['pgm_plan_key'] = plan_key
+
+    plan_task = st.session_state.get('pgm_plan_task')
+    if plan_task is not None and st.session_state.get('pgm_plan_key') == plan_key:
+        components.render_task(plan_task, key='pgm_plan_task')
+        if plan_task.status == 'success':
+            _render_feature_plan(stack, manage_token, operation, final_feature, target_projects, inventory,
+                                 plan_task.result)
+    elif plan_task is not None:
+        st.info("The selection changed since the last plan; plan again before applying.")
+
+    components.render_task(st.session_state.get('pgm_bulk_task'), _render_project_results, key='pgm_bulk_task')
+
+
+def _render_project_filter(table: kbc.projecttable.ProjectTable) -> kbc.projecttable.ProjectFilter:
+    name_col, type_col, min_col, max_col = st.columns([3, 2, 1, 1])
+    with name_col:
+        name = st.text_input("Project name contains", key='pgm_filter_name')
+    with type_col:
+        types = st.multiselect("Project type", table.available_types, key='pgm_filter_types')
+    with min_col:
+        id_min = st.number_input("ID from", min_value=0, value=None, step=1, key='pgm_filter_id_min')
+    with max_col:
+        id_max = st.number_input("ID to", min_value=0, value=None, step=1, key='pgm_filter_id_max')
+    return kbc.projecttable.ProjectFilter(name.strip(), tuple(types), id_min, id_max)
+
+
+def _reset_project_grids(keep: Optional[str] = None) -> None:
+    # the grids would otherwise report their old selection on top of the new one
+    for key in [k for k in st.session_state if str(k).startswith('pgm_project_table_') and k != keep]:
+        del st.session_state[key]
+
+
+def _render_project_page(table: kbc.projecttable.ProjectTable, selection: kbc.projecttable.ProjectSelection,
+                         matching: np.ndarray, selected: np.ndarray,
+                         project_filter: kbc.projecttable.ProjectFilter) -> None:
+    """Shows one page of the matching projects; grid selection changes are folded into the selection."""
+    match_count = int(matching.sum())
+    select_col, clear_col, size_col, page_col = st.columns([2, 2, 1, 1])
+    with select_col:
+        if st.button(f"Select all {match_count} matching", key='pgm_select_matching'):
+            selection.select_matching(project_filter)
+            _reset_project_grids()
+            st.rerun()
+    with clear_col:
+        if st.button("Clear selection", key='pgm_select_none'):
+            selection.clear()
+            _reset_project_grids()
+            st.rerun()
+    with size_col:
+        page_size = st.selectbox("Page size", PAGE_SIZES, key='pgm_page_size')
+    with page_col:
+        page_count = max((match_count + page_size - 1) // page_size, 1)
+        page = st.number_input("Page", min_value=1, max_value=page_count, value=1, step=1, key='pgm_page') - 1
+
+    positions = table.page(matching, page, page_size)
+    page_selected = selected[positions]
+    page_rows = pd.DataFrame({
+        "name": table.names[positions],
+        "project_id": table.ids[positions],
+        "type": table.types[positions],
+    })
+    # the grid keeps its selection per key, so it is keyed on the exact rows it shows; when it changes the selection,
+    # the state of the other grids is dropped so none of them reports stale rows when shown again
+    rows_digest = hashlib.sha1(','.join(map(str, page_rows['project_id'])).encode()).hexdigest()[:16]
+    grid_key = f"pgm_project_table_{rows_digest}"
+    with kbc.profiler.span('project table', 'serialize'):
+        response = components.render_grid(
+            page_rows, selection='multiple', pre_selected=np.flatnonzero(page_selected).tolist(),
+            column_labels={"name": "Project name", "project_id": "Project ID", "type": "Project type"},
+            key=grid_key)
+    grid_selection = components.grid_selected_rows(response)
+    if grid_selection is not None:
+        selected_ids = {int(row['project_id']) for row in grid_selection if row.get('project_id') is not None}
+        changed = False
+        for project_id, was_selected in zip(page_rows['project_id'], page_selected):
+            if (project_id in selected_ids) != was_selected:
+                selection.set(table, project_id, not was_selected)
+                changed = True
+        if changed:
+            _reset_project_grids(keep=grid_key)
+    st.caption(f"{match_count} of {len(table)} project(s) match the filter, page {page + 1} of {page_count}.")
+
+
+def _render_feature_inventory(inventory: kbc.inventory.FeatureInventory, manage_token: str, projects: list,
+                              final_feature: str) -> None:
+    with st.expander("Feature inventory", expanded=bool(inventory.project_features)):
+        st.caption("Features of all projects in the organization. Refresh fetches only new projects and projects "
+                   "older than 15 minutes.")
+        refresh_task = st.session_state.get('pgm_inventory_task')
+        refresh_running = refresh_task is not None and not refresh_task.finished
+        if st.button("Build / refresh inventory", key='pgm_inventory_refresh', disabled=refresh_running):
+            st.session_state['pgm_inventory_task'] = kbc.tasks.submit(
+                _refresh_inventory, inventory, manage_token, projects, name="Feature inventory")
+        components.render_task(st.session_state.get('pgm_inventory_task'), key='pgm_inventory_task')
+
+        if not inventory.project_features:
+            return
+
+        if inventory.errors:
+            st.warning(f"{len(inventory.errors)} project(s) could not be loaded.")
+
+        lookup_features = inventory.features
+        default_index = lookup_features.index(final_feature) if final_feature in lookup_features else 0
+        lookup_feature = st.selectbox("Who has feature", lookup_features, index=default_index,
+                                      key='pgm_inventory_lookup')
+        having = [p for p in inventory.project_ids if p in inventory.projects_with(lookup_feature)]
+        st.caption(f"{len(having)} of {len(inventory.project_features)} project(s) have `{lookup_feature}`.")
+        st.dataframe({"project_id": having, "name": [inventory.project_names.get(p, '') for p in having]},
+                     hide_index=True, use_container_width=True)
+
+        if st.checkbox("Show project × feature matrix", key='pgm_inventory_matrix'):
+            st.dataframe(inventory.matrix(), hide_index=True, use_container_width=True)
+
+
+def _refresh_inventory(task: kbc.tasks.TaskHandle, inventory: kbc.inventory.FeatureInventory, manage_token: str,
+                       projects: list) -> int:
+    inventory.sync_projects(projects)
+    task.set_total(len(inventory.stale_projects()))
+    return inventory.refresh(manage_token, on_progress=task.report)
+
+
+def _apply_feature_to_projects(task: kbc.tasks.TaskHandle, stack: str, manage_token: str, operation: str,
+                               final_feature: str, target_projects: list,
+                               inventory: Optional[kbc.inventory.FeatureInventory] = None) -> None:
+    for project in target_projects:
+        project_id = project.get('id')
+        project_label = _format_project_option(project)
+
+        if not project_id:
+            task.report({"status": "error", "project": project_label, "message": "Missing project ID, skipping."})
+            continue
+
+        try:
+            if operation == 'ADD':
+                kbc.kbcapi_scripts.add_feature(stack, manage_token, project_id, final_feature)
+                outcome = {"status": "success", "message": f"Added `{final_feature}`."}
+            else:
+                kbc.kbcapi_scripts.remove_feature(stack, manage_token, project_id, final_feature)
+                outcome = {"status": "success", "message": f"Removed `{final_feature}`."}
+            if inventory is not None:
+                inventory.apply_change(project_id, final_feature, operation == 'ADD')
+        except requests.HTTPError as error:
+            status_code = getattr(error.response, 'status_code', None)
+            message = _http_error_details(error)
+            if status_code in (400, 404, 409):
+                outcome = {"status": "skipped", "message": f"Skipped ({message})."}
+            else:
+                outcome = {"status": "error", "message": f"Failed ({message})."}
+        except requests.RequestException as error:
+            outcome = {"status": "error", "message": f"Unexpected error ({error})."}
+
+        task.report({**outcome, "project": project_label})
+
+
+def _plan_feature_change(task: kbc.tasks.TaskHandle, inventory: kbc.inventory.FeatureInventory, stack: str,
+                         manage_token: str, organization_id, target_projects: list, operation: str,
+                         final_feature: str) -> dict:
+    # the page may show a cached project list; the plan is built from the organization as it is now
+    organization = kbc.kbcapi_scripts.get_organization_by_stack(stack, manage_token, organization_id, fresh=True)
+    projects = organization.get('projects') or []
+    current_ids = {str(p.get('id')) for p in projects}
+    target_ids = [str(p.get('id')) for p in target_projects if p.get('id')]
+    inventory.sync_projects(projects)
+    task.set_total(len(set(inventory.stale_projects(kbc.inventory.PLAN_MAX_AGE)) & current_ids & set(target_ids)))
+    plan = inventory.plan_change(manage_token, [p for p in target_ids if p in current_ids], final_feature, operation,
+                                 on_progress=task.report)
+    plan['removed'] = [p for p in target_ids if p not in current_ids]
+    return plan
+
+
+def _render_feature_plan(stack: str, manage_token: str, operation: str, final_feature: str, target_projects: list,
+                         inventory: kbc.inventory.FeatureInventory, plan: dict) -> None:
+    by_id = {str(p.get('id')): p for p in target_projects}
+    to_change = [by_id[p] for p in plan['change']] + [by_id[p] for p in plan['unknown']]
+    verb = "add" if operation == 'ADD' else "remove"
+
+    st.markdown(f"**Plan:** {verb} `{final_feature}` in **{len(plan['change'])}** project(s); "
+                f"{len(plan['unchanged'])} already {'have' if operation == 'ADD' else 'lack'} it.")
+    if plan.get('removed'):
+        st.warning(f"{len(plan['removed'])} selected project(s) are no longer in the organization and are left out.")
+    if plan['unknown']:
+        st.warning(f"Features of {len(plan['unknown'])} project(s) could not be read; they are included in the "
+                   f"change and the API decides.")
+    with st.expander("Planned changes", expanded=False):
+        st.dataframe({"project_id": [p.get('id') for p in to_change], "name": [p.get('name', '') for p in to_change],
+                      "note": ["" if str(p.get('id')) in plan['change'] else plan['unknown'][str(p.get('id'))]
+                               for p in to_change]},
+                     hide_index=True, use_container_width=True)
+
+    if not to_change:
+        st.success("Nothing to do, every selected project is already in the requested state.")
+        return
+
+    if st.button(f"Apply to {len(to_change)} project(s)", type="primary", key='pgm_multi_apply'):
+        running = st.session_state.get('pgm_bulk_task')
+        if running and not running.finished:
+            st.warning("A feature change is already running; wait for it to finish or cancel it.")
+        else:
+            st.session_state['pgm_bulk_task'] = kbc.tasks.submit(
+                _apply_feature_to_projects, stack, manage_token, operation, final_feature, to_change,
+                inventory=inventory, name=f"{operation} `{final_feature}`", total=len(to_change),
+                export_fields=('project', 'status', 'message'))
+            # the plan is consumed; applying again requires a fresh plan
+            del st.session_state['pgm_plan_task']
+
+
+def _render_project_results(results: list) -> None:
+    components.render_bulk_results(results, key='pgm_bulk_results')
@@ -0,0 +1,98 @@
+import datetime
+
+import streamlit as st
+
+import kbc.kbcapi_scripts
+import kbc.schedules
+import kbc.tasks
+from tabs import components
+
+REGIONS = [region for region in kbc.kbcapi_scripts.URL_SUFFIXES if region != 'CURRENT_STACK']
+BREAKDOWNS = {"None": None, "Project": 'project_id', "Component": 'component_id'}
+
+
+def _load_organization(task, manage_token, region, project_ids):
+    return kbc.schedules.load_organization_schedules(manage_token, region, project_ids)
+
+
+def _load_projects(task, region, storage_tokens):
+    # storage tokens are prefixed with the ID of their project: <project>-<token id>-<secret>
+    return kbc.schedules.load_schedules([(region, token.split('-', 1)[0], token) for token in storage_tokens])
+
+
+def _split(value: str) -> list:
+    return sorted({v.strip() for v in value.replace(',', '\n').splitlines() if v.strip()}, key=str)
+
+
+def _render_loading():
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        region = st.selectbox("Region", REGIONS, key='schload_region')
+        source = st.radio("Projects", ["Organization", "Storage tokens"], key='schload_source')
+    with col2:
+        if source == "Organization":
+            manage_token = st.text_input("Manage token", type="password", key='schload_token')
+            project_ids = _split(st.text_area("Project IDs", key='schload_projects',
+                                              help="One ID per line (or separated by commas)."))
+            ready = bool(manage_token and project_ids)
+            args, count = (_load_organization, manage_token, region, project_ids), len(project_ids)
+        else:
+            storage_tokens = _split(st.text_area("Storage tokens", key='schload_storage_tokens',
+                                                 help="One token per line."))
+            ready = bool(storage_tokens)
+            args, count = (_load_projects, region, storage_tokens), len(storage_tokens)
+
+    task = st.session_state.get('schload_task')
+    if ready and (task is None or task.finished):
+        if st.button(f"Load schedules of {count} project(s)", key='schload_run'):
+            task = kbc.tasks.submit(*args, name="Loading schedules")
+            st.session_state['schload_task'] = task
+    components.render_task(task, key='schload_task')
+
+
+def _render_analysis(frame, errors: dict):
+    if errors:
+        st.warning(f"Schedules of {len(errors)} project(s) could not be loaded.")
+        components.render_grid({"project_id": list(errors), "error": list(errors.values())}, key='schload_errors')
+    st.caption(f"{len(frame)} schedule(s), {int(frame['enabled'].sum())} enabled, "
+               f"{frame[['cron', 'timezone']].drop_duplicates().shape[0]} distinct cron expression(s).")
+    if frame.empty:
+        return
+
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        start = st.date_input("From (UTC)", datetime.date.today(), key='schload_start')
+    with col2:
+        days = st.number_input("Days", min_value=1, max_value=14, value=1, key='schload_days')
+    with col3:
+        by = BREAKDOWNS[st.selectbox("Breakdown", list(BREAKDOWNS), key='schload_by')]
+    with col4:
+        include_disabled = st.checkbox("Include disabled", key='schload_disabled')
+
+    start = datetime.datetime.combine(start, datetime.time())
+    end = start + datetime.timedelta(days=int(days))
+    histogram = kbc.schedules.trigger_histogram(frame, start, end, include_disabled=include_disabled)
+    if by:
+        breakdown = kbc.schedules.trigger_histogram(frame, start, end, by=by, include_disabled=include_disabled)
+        st.bar_chart(breakdown, x='minute', y='triggers', color=by)
+    else:
+        st.bar_chart(histogram, y='triggers')
+
+    st.caption("Busiest minutes")
+    components.render_grid(kbc.schedules.peak_minutes(histogram).reset_index(), key='schload_peaks')
+    invalid = kbc.schedules.invalid_schedules(frame)
+    if not invalid.empty:
+        st.warning(f"{len(invalid)} schedule(s) have a cron expression or timezone that cannot be evaluated and are "
+                   "not counted.")
+        components.render_grid(invalid, key='schload_invalid')
+    with st.expander("Schedules"):
+        components.render_grid(frame, key='schload_schedules')
+
+
+def display_content():
+    st.subheader("Schedule load")
+    _render_loading()
+    task = st.session_state.get('schload_task')
+    if task is None or not task.finished or task.result is None:
+        return
+    _render_analysis(*task.result)
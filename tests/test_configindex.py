@@ -0,0 +1,32 @@
+import sqlite3
+
+import kbc.configindex
+from kbc.configindex import ConfigIndex
+
+
+def test_index_uses_wal(tmp_path):
+    index = ConfigIndex(str(tmp_path / 'index.sqlite'))
+    try:
+        assert index.connection.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    finally:
+        index.close()
+
+
+def test_locked_index_fails_only_that_project(tmp_path, monkeypatch):
+    monkeypatch.setattr(kbc.configindex, '_fetch_project', lambda token, region, indexed: ([], set()))
+    index = ConfigIndex(str(tmp_path / 'index.sqlite'))
+    store = index._store
+
+    def _store(region, project_id, *args):
+        if project_id == '2':
+            raise sqlite3.OperationalError('database is locked')
+        return store(region, project_id, *args)
+
+    monkeypatch.setattr(index, '_store', _store)
+    try:
+        outcomes = index.index_projects({('us-east4', '1'): 'token-1', ('us-east4', '2'): 'token-2'})
+    finally:
+        index.close()
+    statuses = {outcome['project']: (outcome['status'], outcome['message']) for outcome in outcomes}
+    assert statuses['1'][0] == 'success'
+    assert statuses['2'] == ('error', 'OperationalError: database is locked')
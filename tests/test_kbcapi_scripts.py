@@ -0,0 +1,22 @@
+import datetime
+
+from kbc.kbcapi_scripts import _parse_timestamp
+
+
+def test_parse_timestamp_storage_api_offset():
+    # lastChangeDate as returned by the Storage API (+HHMM offset, not accepted by fromisoformat on 3.10)
+    parsed = _parse_timestamp('2024-01-15T10:20:30+0100')
+    assert parsed == datetime.datetime(2024, 1, 15, 9, 20, 30, tzinfo=datetime.timezone.utc)
+
+
+def test_parse_timestamp_compares_instants():
+    assert _parse_timestamp('2024-01-15T10:20:30+0100') <= _parse_timestamp('2024-01-15T09:30:00+0000')
+
+
+def test_parse_timestamp_without_offset_is_utc():
+    assert _parse_timestamp('2024-01-15T10:20:30').tzinfo == datetime.timezone.utc
+
+
+def test_parse_timestamp_invalid():
+    assert _parse_timestamp(None) is None
+    assert _parse_timestamp('yesterday') is None
@@ -0,0 +1,18 @@
+import json
+
+from kbc.logexport import LogIndex
+
+
+def test_build_indexes_non_string_components(tmp_path):
+    export = tmp_path / 'export.jsonl'
+    records = [{'component': 123, 'message': 'numeric'}, {'component': '123', 'message': 'string'},
+               {'component': {'id': 'keboola.ex-db'}, 'message': 'object'}]
+    export.write_text(''.join(json.dumps(record) + '\n' for record in records))
+    index = LogIndex(str(export))
+    try:
+        assert index.build() == 3
+        assert index.is_current()
+        counts = {row['component']: row['count'] for row in index.aggregate(group_by=('component',))}
+        assert counts == {'123': 2, "{'id': 'keboola.ex-db'}": 1}
+    finally:
+        index.close()
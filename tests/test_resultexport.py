@@ -0,0 +1,11 @@
+from kbc.resultexport import without_credentials
+
+
+def test_without_credentials_drops_secret_fields():
+    consumers = [{'component_id': 'keboola.ex-google-drive', 'app_key': 'client-id', 'app_secret': 's1',
+                  'app_secret_docker': 's2', 'oauth_version': '2.0'},
+                 {'component_id': 'kds-team.ex-hubspot', 'credentials': {'password': 'p', 'user': 'u'}}]
+    assert without_credentials(consumers) == [
+        {'component_id': 'keboola.ex-google-drive', 'app_key': 'client-id', 'oauth_version': '2.0'},
+        {'component_id': 'kds-team.ex-hubspot', 'credentials': {'user': 'u'}}]
+    assert without_credentials('HTTPError: 401') == 'HTTPError: 401'
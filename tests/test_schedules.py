@@ -0,0 +1,50 @@
+from unittest import mock
+
+import requests
+
+import kbc.schedules
+import kbc.tokenbroker
+
+SCHEDULE = {"id": "1", "schedule": {"cronTab": "*/5 * * * *", "timezone": "UTC", "state": "enabled"},
+            "target": {"componentId": "keboola.orchestrator", "configurationId": "123"}}
+
+
+def _response(url, status_code, content=b'[]'):
+    response = requests.Response()
+    response.url = url
+    response.status_code = status_code
+    response._content = content
+    return response
+
+
+def _scheduler(forbidden_token):
+    def request(method, url, headers=None, **kwargs):
+        if headers['X-StorageApi-Token'] == forbidden_token:
+            return _response(url, 403, b'{"error": "Access denied"}')
+        return _response(url, 200, b'[' + requests.compat.json.dumps(SCHEDULE).encode() + b']')
+    return request
+
+
+def test_load_schedules_reports_forbidden_project():
+    with mock.patch('requests.request', _scheduler('1-forbidden')):
+        frame, errors = kbc.schedules.load_schedules([('US', '1', '1-forbidden'), ('US', '2', '2-ok')])
+    assert list(frame['project_id']) == ['2']
+    assert list(errors) == ['1'] and '403' in errors['1']
+
+
+def test_load_organization_schedules_reports_failed_projects():
+    def request(method, url, headers=None, data=None, **kwargs):
+        if '/manage/projects/' in url:
+            project_id = url.split('/manage/projects/')[1].split('/')[0]
+            if project_id == '3':
+                return _response(url, 403, b'{"error": "Project is disabled"}')
+            return _response(url, 201, f'{{"id": "{project_id}", "token": "{project_id}-token"}}'.encode())
+        return _scheduler('1-token')(method, url, headers=headers, **kwargs)
+
+    kbc.tokenbroker.broker.clear()
+    with mock.patch('requests.request', request):
+        frame, errors = kbc.schedules.load_organization_schedules('manage-token', 'US', [1, 2, 3])
+    kbc.tokenbroker.broker.clear()
+    assert list(frame['project_id']) == ['2']
+    assert sorted(errors) == ['1', '3']
+    assert '403' in errors['1'] and errors['3'].startswith('No storage token')
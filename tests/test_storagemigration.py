@@ -0,0 +1,15 @@
+from unittest import mock
+
+from kbc.storagemigration import _create_bucket
+
+
+def test_create_bucket_keeps_backend_and_description():
+    buckets = mock.Mock()
+    _create_bucket(buckets, 'in.c-sales', {'id': 'in.c-sales', 'backend': 'snowflake', 'description': 'CRM data'})
+    buckets.create.assert_called_once_with('sales', 'in', description='CRM data', backend='snowflake')
+
+
+def test_create_bucket_without_source_detail():
+    buckets = mock.Mock()
+    _create_bucket(buckets, 'out.c-report')
+    buckets.create.assert_called_once_with('report', 'out', description='', backend=None)
@@ -0,0 +1,37 @@
+from unittest import mock
+
+import requests
+
+import kbc.health
+import kbc.transport
+
+
+def _responder(status_code, calls):
+    def request(method, url, **kwargs):
+        calls.append(url)
+        response = requests.Response()
+        response.url = url
+        response.status_code = status_code
+        return response
+    return request
+
+
+def test_retried_500_does_not_open_the_circuit():
+    calls = []
+    url = 'https://connection.broken-config.example.com/v2/storage/components/x/configs/1'
+    with mock.patch('requests.request', _responder(500, calls)), mock.patch('time.sleep'):
+        for _ in range(kbc.health.FAILURE_THRESHOLD + 1):
+            assert kbc.transport.get(url).status_code == 500
+    breaker = kbc.health.breaker_for_url(url)
+    assert breaker.state == kbc.health.CLOSED
+    assert len(calls) == (kbc.transport.MAX_SERVER_RETRIES + 1) * (kbc.health.FAILURE_THRESHOLD + 1)
+
+
+def test_unavailable_stack_counts_once_per_request():
+    calls = []
+    url = 'https://connection.overloaded.example.com/v2/storage'
+    with mock.patch('requests.request', _responder(503, calls)), mock.patch('time.sleep'):
+        assert kbc.transport.get(url).status_code == 503
+        breaker = kbc.health.breaker_for_url(url)
+        assert breaker.failures == 1 and breaker.state == kbc.health.CLOSED
+        assert len(calls) == kbc.transport.MAX_SERVER_RETRIES + 1
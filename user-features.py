@@ -1,15 +1,11 @@
 import streamlit as st
-import requests
+
+import kbc.stacks
+from kbc import transport
 
 # Keboola API token (ensure you keep this secure)
 
-hostname_suffix_options = {
-    "keboola.com": "AWS us-east-1",
-    "eu-central-1.keboola.com": "AWS eu-central-1",
-    "north-europe.azure.keboola.com": "Azure North Europe",
-    "us-east4.gcp.keboola.com": "GCP US East4",
-    "europe-west3.gcp.keboola.com": "GCP Europe West3"
-}
+hostname_suffix_options = kbc.stacks.labels(multitenant_only=True)
 
 def get_headers(token):
     return {
@@ -20,7 +16,7 @@ def get_headers(token):
 
 # Helper functions for API interactions
 def get_user_details(api_url, token, user_email):
-    response = requests.get(
+    response = transport.get(
         f"{api_url}/users/{user_email}",
         headers=get_headers(token)
     )
@@ -28,7 +24,7 @@ def get_user_details(api_url, token, user_email):
 
 
 def add_user_feature(api_url, token, user_email, feature_name):
-    response = requests.post(
+    response = transport.post(
         f"{api_url}/users/{user_email}/features",
         headers=get_headers(token),
         json={"feature": feature_name}
@@ -37,7 +33,7 @@ def add_user_feature(api_url, token, user_email, feature_name):
 
 
 def get_features_list(api_url, token):
-    response = requests.get(
+    response = transport.get(
         f"{api_url}/features?type=admin",
         headers=get_headers(token)
     )